@@ -10,7 +10,14 @@ class ServicesConfig(PluginConfig):
     base_url = 'ixservices'
     required_settings = []
     default_settings = {
-        'ativo': True
+        'ativo': True,
+        # whois (utils/whoisutils.py)
+        'whois_command': 'whois',
+        'whois_timeout': 10,
+        'whois_workers': 4,
+        'whois_cache_ttl': 3600,
+        'whois_cache_size': 1024,
+        'whois_cache_dir': None,
     }
 
 config = ServicesConfig
\ No newline at end of file
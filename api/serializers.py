@@ -3,11 +3,15 @@ from ixservices.ixservices.models import (AS, IX, ServiceTagDomain, ServiceTag,
                                           CustomerConnection, CustomerConnectionType, ServiceType, IXService, CustomerService)
 
 from django.db import transaction
+from django.db.models import Manager, QuerySet
 
 # netbox imports
 from netbox.api.serializers import PrimaryModelSerializer, BaseModelSerializer, WritableNestedSerializer
 from dcim.models import Device, Interface
 
+from ixservices.ixservices.utils.topology import resolve_connections
+from ixservices.ixservices.utils.validation import validation_policy
+
 
 class BaseModelSerializer(PrimaryModelSerializer):
     display = serializers.SerializerMethodField(read_only=True)
@@ -39,16 +43,28 @@ class NestedServiceTagSerializer(WritableNestedSerializer):
 
 
 class NestedIPv4AddressSerializer(WritableNestedSerializer):
+    # usado somente nos enderecos de CustomerService: sempre alocado, sem consulta por endereco
+    is_allocated = serializers.SerializerMethodField(read_only=True)
+
     class Meta:
         model = IPv4Address
         fields = ('id', 'display', 'created', 'last_updated', 'ix', 'address', 'reverse_dns', 'is_allocated')
 
+    def get_is_allocated(self, obj):
+        return True
+
 
 class NestedIPv6AddressSerializer(WritableNestedSerializer):
+    # usado somente nos enderecos de CustomerService: sempre alocado, sem consulta por endereco
+    is_allocated = serializers.SerializerMethodField(read_only=True)
+
     class Meta:
         model = IPv6Address
         fields = ('id', 'display', 'created', 'last_updated', 'ix', 'address', 'reverse_dns', 'is_allocated')
 
+    def get_is_allocated(self, obj):
+        return True
+
 
 class NestedMACAddressSerializer(WritableNestedSerializer):
     class Meta:
@@ -295,21 +311,55 @@ class CreateOrUpdateCustomerConnectionSerializer(serializers.Serializer):
         return instance
 
 
+class ConnectionTopologyListSerializer(serializers.ListSerializer):
+    """
+    Resolve the topology of the whole list of CustomerConnections with the
+    batch resolver and share the result with the child serializer.
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        if isinstance(data, QuerySet):
+            data = data.select_related('asn', 'connection_type', 'tag_domain')
+        data = list(data)
+        self.context['topology'] = resolve_connections(data)
+        return super().to_representation(data)
+
+
+class ConnectionTopologyField(serializers.ReadOnlyField):
+    """Topology field read from the batch resolver map when available."""
+
+    def get_attribute(self, instance):
+        topology = self.context.get('topology', {})
+        if instance.pk in topology:
+            return topology[instance.pk][self.source]
+        return super().get_attribute(instance)
+
+
 class ConnectedDeviceSerializer(BaseModelSerializer):
 
+    destination_device_info = ConnectionTopologyField()
+
     class Meta:
         model = CustomerConnection
         fields = ('id', 'display', 'destination_device_info', 'tag_domain', 'connection_type')
+        list_serializer_class = ConnectionTopologyListSerializer
 
 
 class ConnectedInterfaceSerializer(BaseModelSerializer):
 
     connection_type = NestedCustomerConnectionTypeSerializer()
     asn = NestedASSerializer()
+    tagdomain = ConnectionTopologyField()
+    connected_device_info = ConnectionTopologyField()
+    device_id_by_interface = ConnectionTopologyField()
+    connected_interfaces = ConnectionTopologyField()
 
     class Meta:
         model = CustomerConnection
         fields = ('id', 'name', 'asn', 'connection_type', 'tagdomain', 'connected_device_info', 'device_id_by_interface', 'connected_interfaces', 'status',)
+        list_serializer_class = ConnectionTopologyListSerializer
 
     
 class ServiceTypeSerializer(BaseModelSerializer):
@@ -388,7 +438,8 @@ class CreateOrUpdateCustomerServiceSerializer(BaseModelSerializer):
         # change previous tag status when object tag is changed
         if previous_tag and previous_tag.customerservice.all().count() == 0:
             previous_tag.status = "AVAILABLE"
-            previous_tag.save()
+            with validation_policy(dirty_only=True):
+                previous_tag.save()
         return instance
 
 
@@ -11,7 +11,6 @@ from django.db.models import Q, F, TextField, Case, When, Count
 from django.db.models.functions import Cast
 from django.core.exceptions import ValidationError
 from django.contrib.postgres.aggregates.general import ArrayAgg
-from itertools import product
 
 from ixservices.ixservices.models import AS, IX, ServiceTag, IPv4Address, IPv6Address, MACAddress, CustomerConnection, CustomerConnectionType, CustomerConnectionEndpoint, CustomerService, ServiceTagDomain, ServiceType, IXService
 from .serializers import (ASSerializer, IXSerializer, ServiceTagDomainSerializer, ServiceTagSerializer, IPv4AddressSerializer, IPv6AddressSerializer, MACAddressSerializer, CustomerConnectionEndpointSerializer,
@@ -22,9 +21,18 @@ from .serializers import (ASSerializer, IXSerializer, ServiceTagDomainSerializer
 from dcim.api.serializers import InterfaceSerializer, FrontPortSerializer, RearPortSerializer
 from dcim.models import Interface, FrontPort, RearPort, CablePath
 from netbox.api.views import ModelViewSet as NetboxModelViewSet
+from extras.choices import ObjectChangeActionChoices
+from extras.models import ObjectChange
 
-from ..ixservices.utils.whoisutils import get_parsed_whois
+from ..ixservices.utils.whoisutils import WHOIS_SUMMARY_FIELDS, lookup_whois, lookup_whois_many
 from ixservices.ixservices.utils.status import TagStatusChoices
+from ixservices.ixservices.utils.constants import MAX_TAG_NUMBER, MIN_TAG_NUMBER
+from ixservices.ixservices.utils.ips_utils import DualStackPairIndex, filter_address_range
+from ixservices.ixservices.utils.registry import registry
+from ixservices.ixservices.utils.provisioning import ServiceProvisioner
+from ixservices.ixservices.utils.tagsummary import get_domain_tags
+from ixservices.ixservices.utils.cabletrace import DeviceTrace
+from ixservices.ixservices.utils.stats import free_interface_count, service_type_counts, tag_status_counts
 
 class NoAuthViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     authentication_classes = []
@@ -55,6 +63,10 @@ class PermissionRequiredViewSet(viewsets.ModelViewSet):
     queryset = []
 
 
+# maximo de ASNs por chamada de getASWhoisBatch
+WHOIS_BATCH_LIMIT = 100
+
+
 class ASViewSet(AuthViewSet):
     serializer_class = ASSerializer
     queryset = AS.objects.all()   
@@ -67,18 +79,44 @@ class ASViewSet(AuthViewSet):
             return Response("Informar AS", status.HTTP_400_BAD_REQUEST)
 
         try:
-            final_list = get_parsed_whois(int(number))
+            final_list = lookup_whois(int(number), self._whois_fields(request))
+        except ValidationError as e:
+            if e.code == 'timeout':
+                return Response(f"Whois do AS{number} indisponível!", status.HTTP_504_GATEWAY_TIMEOUT)
+            return self._whois_error(number, e)
         except Exception as e:
-            #return HttpResponseBadRequest(f"AS{number} não existe!")
-            msg = str(e).lower()
-            if msg.find('exist') >= 0:
-                return Response(f"AS{number} não existe!", status.HTTP_400_BAD_REQUEST)
-            else:
-                return Response(f"AS{number} inválido!", status.HTTP_400_BAD_REQUEST)
+            return self._whois_error(number, e)
 
 
         return Response(final_list)
 
+    @action(detail=False, methods=['GET', 'POST'])
+    def getASWhoisBatch(self, request, **kwargs):
+        # GET ?numbers=1,2,3 ou POST [1, 2, 3]
+        numbers = request.data if request.method == 'POST' else request.GET.get('numbers', '').split(',')
+        if not isinstance(numbers, list) or not any(str(number).strip() for number in numbers):
+            return Response("Informar lista de AS", status.HTTP_400_BAD_REQUEST)
+        if len(numbers) > WHOIS_BATCH_LIMIT:
+            return Response(f"Máximo de {WHOIS_BATCH_LIMIT} AS por consulta", status.HTTP_400_BAD_REQUEST)
+        try:
+            numbers = [int(str(number).strip()) for number in numbers if str(number).strip()]
+        except ValueError:
+            return Response("AS inválido na lista", status.HTTP_400_BAD_REQUEST)
+
+        return Response(lookup_whois_many(numbers, self._whois_fields(request)))
+
+    def _whois_fields(self, request):
+        # ?summary=1 retorna somente aut-num, as-name, owner e e-mail
+        return WHOIS_SUMMARY_FIELDS if request.GET.get('summary') in ('1', 'true') else None
+
+    def _whois_error(self, number, e):
+        #return HttpResponseBadRequest(f"AS{number} não existe!")
+        msg = str(e).lower()
+        if msg.find('exist') >= 0:
+            return Response(f"AS{number} não existe!", status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response(f"AS{number} inválido!", status.HTTP_400_BAD_REQUEST)
+
 
 class IXViewSet(AuthViewSet):
     serializer_class = IXSerializer
@@ -130,6 +168,24 @@ class IXViewSet(AuthViewSet):
         return Response(data)
 
 
+    @action(detail=False, methods=['GET', 'POST'])
+    def resolveAddress(self, request, **kwargs):
+        """
+        GET ?address=IP[&address=IP...] ou POST {"addresses": [...]}
+        retorna o IX (maior prefixo), o customerservice e o AS de cada endereco
+        """
+        if request.method == 'POST':
+            addresses = request.data.get('addresses', []) if isinstance(request.data, dict) else None
+        else:
+            addresses = [
+                address for value in request.GET.getlist('address') for address in value.split(',') if address
+            ]
+        if not addresses or not isinstance(addresses, list):
+            return HttpResponseBadRequest("Informar address")
+
+        return Response(IX.resolve_addresses(*addresses))
+
+
     @action(detail=False, methods=['GET'])
     def getIXs(self, request, **kwargs):
         data = self.queryset.values('code', 'fullname')
@@ -341,7 +397,15 @@ class TagViewSet(AuthViewSet):
             return HttpResponseBadRequest("Informar IX")
 
         qs = self.filter_queryset(self.get_queryset())
-        data = qs.filter(status='AVAILABLE', tag__gt=1000).values('id', 'tag').first()
+        tag_domain = ServiceTagDomain.objects.filter(
+            domain_type='IX-DOMAIN', ix__code=ix.lower(), device__isnull=True, interface__isnull=True
+        ).first()
+        if not tag_domain:
+            return Response(None)
+
+        # primeira tag livre acima de 1000 obtida pelo bitmap do dominio
+        tag = tag_domain.get_tag_bitmap().first_free(start=1001)
+        data = qs.filter(tag_domain=tag_domain, tag=tag).values('id', 'tag').first() if tag is not None else None
 
         return Response(data)
 
@@ -365,14 +429,16 @@ class TagViewSet(AuthViewSet):
             return HttpResponseBadRequest("Informar IX")
 
         ix = ix.lower()
-        availableTags = self.queryset.filter(ix__code=ix, status='AVAILABLE').count()
-        allocatedTags = self.queryset.filter(ix__code=ix, status='ALLOCATED').count()
-        productionTags = self.queryset.filter(ix__code=ix, status='PRODUCTION').count()
+        tag_domain = ServiceTagDomain.objects.filter(
+            domain_type='IX-DOMAIN', ix__code=ix, device__isnull=True, interface__isnull=True
+        ).first()
+        # contagem servida pelo bitmap do dominio do IX
+        count = tag_domain.get_tag_bitmap().count_by_status() if tag_domain else {}
 
         data = {
-            'availableTags': availableTags,
-            'allocatedTags': allocatedTags,
-            'productionTags': productionTags
+            'availableTags': count.get('AVAILABLE', 0),
+            'allocatedTags': count.get('ALLOCATED', 0),
+            'productionTags': count.get('PRODUCTION', 0)
         }
 
         return Response(data)
@@ -386,10 +452,7 @@ class TagViewSet(AuthViewSet):
 
         qs = self.filter_queryset(self.get_queryset())
 
-        count = {
-            'AVAILABLE': qs.filter(status='AVAILABLE').count(),
-            'PRODUCTION': qs.filter(status='PRODUCTION').count(),
-        }
+        count = tag_status_counts(qs, statuses=('AVAILABLE', 'PRODUCTION'))
 
         tags = qs.values('tag', 'status', 'customerservice')
 
@@ -442,6 +505,9 @@ class TagDomainViewSet(AuthViewSet):
 
     { 'PRODUCTION': { 0: ... }, ... }
 
+    /api/plugins/ixservices/tagdomain/getFreeTags/?id=DOMAIN_ID&start=&end=&size=
+    retorna a primeira tag (ou faixa de tags) livre do dominio a partir do bitmap
+
     """
     serializer_class = ServiceTagDomainSerializer
     queryset = ServiceTagDomain.objects.all()
@@ -456,6 +522,43 @@ class TagDomainViewSet(AuthViewSet):
     # 2. no device domain? ok look for IX domain and/or port channel domain
     # 2a. send allocated tags for existent domain
 
+    # return free tags from specific domain using the domain bitmap
+    @action(detail=False, methods=['GET'])
+    def getFreeTags(self, request, **kwargs):
+        """
+        /api/plugins/ixservices/tagdomain/getFreeTags/?id=DOMAIN_ID&start=&end=&size=
+        retorna a primeira tag livre (ou a primeira faixa de size tags livres) e
+        a contagem das tags por status
+        """
+        id = request.GET.get('id', False)
+        if not id:
+            return Response('Informar id para o servicetagdomain', status.HTTP_400_BAD_REQUEST)
+        try:
+            start = int(request.GET.get('start', MIN_TAG_NUMBER))
+            end = int(request.GET.get('end', MAX_TAG_NUMBER))
+            size = int(request.GET.get('size', 1))
+        except ValueError:
+            return Response('start, end e size devem ser inteiros', status.HTTP_400_BAD_REQUEST)
+        if not MIN_TAG_NUMBER <= start <= end <= MAX_TAG_NUMBER or size < 1:
+            return Response('Faixa de tags invalida', status.HTTP_400_BAD_REQUEST)
+
+        tag_domain = self.filter_queryset(self.get_queryset()).filter(pk=id).first()
+        if not tag_domain:
+            return Response('ServiceTagDomain nao encontrado', status.HTTP_404_NOT_FOUND)
+
+        bitmap = tag_domain.get_tag_bitmap()
+        first = bitmap.first_free_range(size, start, end)
+
+        data = {
+            'id': tag_domain.pk,
+            'first': first,
+            'range': list(range(first, first + size)) if first is not None else [],
+            'count': bitmap.count_by_status(),
+        }
+
+        return Response(data)
+
+
     # return tags in given status from specific domain 
     @action(detail=False, methods=['GET'])
     def getTags(self, request, **kwargs):
@@ -464,90 +567,92 @@ class TagDomainViewSet(AuthViewSet):
         if not id:
             return Response('Informar id para o servicetagdomain', status.HTTP_400_BAD_REQUEST)
 
-        # using model defined tuple: STATUSES
-        # comprehension
-        tagd = { key: [] for key,txt in ServiceTag.STATUSES }
-
-        #tagstatus = request.GET.get('status', False)
-        #if not tagstatus:
-        for key in tagd:
-            qstag = ServiceTag.objects.filter(tag_domain__id=id,status=key).annotate(tag_id=F('id')).values('tag_id','tag')
-            verif_cs = qstag.filter(customerservice__isnull=False)
-            if verif_cs:
-                # somente tag que esteja em producao e "atribuida" a um customerservice
-                tagid_list = list(verif_cs.values_list('id', flat=True))
-                # aggregate customerservice
-                tag_qs = IXService.objects.filter(
-                        customerservice__tag_or_outer__id__in=tagid_list
-                    ).annotate(
-                        tag=F('customerservice__tag_or_outer__tag'),
-                        tag_id=F('customerservice__tag_or_outer__id'))
-                #tag_list = tag_qs.values('customerservice','tag','tag_id')
-                ixsrvs = tag_qs.annotate(ncs=Count('customerservice')).values('name','service_type__name','ncs')
-                detail_list = []
-                for srv in ixsrvs:
-                    listx = tag_qs.filter(name=srv['name'])
-                    
-                    # customerservice list
-                    # https://docs.djangoproject.com/en/4.0/ref/contrib/postgres/aggregates/
-                    srv['tags'] = listx.annotate(
-                                        asn_list=ArrayAgg(F('customerservice__asn__number'),),
-                                        inner_tag_list=ArrayAgg(F('customerservice__inner_tag'), filter=Q(customerservice__inner_tag__isnull=False))
-                                  ).values('tag','tag_id','asn_list', 'inner_tag_list')
-                    detail_list.append(srv)
-                
-                tagd.update({key:detail_list})
-
-                #cslist = verif_cs.aggregate('customerservice__service')
-            else:
-                tagd.update({key:qstag})
+        try:
+            id = int(id)
+        except ValueError:
+            return Response('id invalido para o servicetagdomain', status.HTTP_400_BAD_REQUEST)
+
+        # tags agrupadas por status em duas consultas, com cache por dominio
+        # (limpo pelos receivers de ServiceTag/CustomerService)
+        return Response(get_domain_tags(id))
+
+class AddressRangeViewSet(AuthViewSet):
+    """
+    aceita ?within=CIDR e/ou ?start=IP&end=IP usando as colunas numericas
+    """
+    ip_version = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = {key: self.request.GET.get(key) for key in ('within', 'start', 'end') if self.request.GET.get(key)}
+        if not params:
+            return queryset
+        try:
+            return filter_address_range(queryset, self.ip_version, **params)
+        except ValueError:
+            return queryset.none()
 
-        return Response(tagd)
 
-class IPv4AddressViewSet(AuthViewSet):
+class IPv4AddressViewSet(AddressRangeViewSet):
     serializer_class = IPv4AddressSerializer
-    queryset = IPv4Address.objects.all()
+    queryset = IPv4Address.objects.with_allocation()
     filter_fields = ("ix__code", "address")
+    ip_version = 4
 
 
     @action(detail=False, methods=['GET'])
     def getIPv4ToCustomerService(self, request, **kwargs):
+        """
+        retorna o primeiro IPv4 livre e o IPv6 derivado dele (mesma regra do
+        create_all_ips), ou os proximos count pares livres com ?count=N
+        """
         ix = request.GET.get('ix__code', False)
         only_v4 = request.GET.get('only_v4', False)
+        count = request.GET.get('count', False)
         if not ix:
             return HttpResponseBadRequest("Informar IX")
+        if count and (not count.isdigit() or int(count) < 1):
+            return HttpResponseBadRequest("count deve ser um inteiro positivo")
 
         qs = self.filter_queryset(self.get_queryset())
 
         v4 = qs.filter(customerservice__isnull=True).values('id', 'address')
 
-        if v4.count() == 0:
+        if not v4.exists():
             return HttpResponseBadRequest("Nenhum IPv4 livre encontrado.")
 
         if not only_v4 or only_v4 == '0':
-            v6 = IPv6Address.objects.filter(ix__code=ix, customerservice__isnull=True).values('id', 'address')
+            ix = registry.ix_by_code(ix)
+            if not ix:
+                return HttpResponseBadRequest("IX nao encontrado")
+            v6 = IPv6Address.objects.filter(ix=ix, customerservice__isnull=True).values('id', 'address')
+
+            index = DualStackPairIndex(ix.ipv4_prefix, ix.ipv6_prefix, v6)
+            pairs = index.pairs(v4.iterator(), int(count or 1))
 
-            ips_list = product(v4, v6)
-            ipv4, ipv6 = next((
-                ips for ips in ips_list
-                if int(ips[0]['address'].rsplit(".", 1)[-1]) == int(ips[1]['address'].rsplit(":", 1)[-1])), (None, None))
+            if count:
+                return Response({
+                    'pairs': [{'ipv4': ipv4, 'ipv6': ipv6} for ipv4, ipv6 in pairs]
+                })
 
-            if ipv4 is None:
-                ipv4 = v4.first()
-                ipv6 = v6.first()
+            ipv4, ipv6 = pairs[0] if pairs else (v4.first(), v6.first())
 
             return Response({
                 'ipv4': ipv4,
                 'ipv6': ipv6
             })
 
+        if count:
+            return Response({'pairs': [{'ipv4': ipv4} for ipv4 in v4[:int(count)]]})
+
         return Response({'ipv4': v4.first()})
 
 
-class IPv6AddressViewSet(AuthViewSet):
+class IPv6AddressViewSet(AddressRangeViewSet):
     serializer_class = IPv6AddressSerializer
-    queryset = IPv6Address.objects.all()   
+    queryset = IPv6Address.objects.with_allocation()
     filter_fields = ("ix__code", "address")
+    ip_version = 6
 
 
     @action(detail=False, methods=['GET'])
@@ -689,16 +794,11 @@ class CustomerServiceViewSet(AuthViewSet):
 
         cix = connections.exclude(connection_type__id=1).count()
 
-        idConnections = [item[0] for item in connections.values_list('id').distinct()]
-
         qs = self.filter_queryset(self.get_queryset())
 
-        data = {
-            'atmv4': qs.filter(connection__id__in=idConnections, service__service_type__name='ATMv4').count(),
-            'atmv6': qs.filter(connection__id__in=idConnections, service__service_type__name='ATMv6').count(),
-            'bilaterais': qs.filter(connection__id__in=idConnections, service__service_type__name='Bilateral').count(),
-            'cix': cix,
-        }
+        # conexoes do PIX como subconsulta, contadores em uma consulta
+        data = service_type_counts(qs.filter(connection__in=connections.values('id')))
+        data['cix'] = cix
 
         return Response(data)
 
@@ -836,34 +936,17 @@ class CustomerServiceViewSet(AuthViewSet):
             )
         ).distinct().count()
 
-        totServicesATMv4 = self.queryset.filter(service__ix__code=ix, service__service_type__name="ATMv4").count()
-        totServicesATMv6 = self.queryset.filter(service__ix__code=ix, service__service_type__name="ATMv6").count()
-        totServicesBilateral = self.queryset.filter(service__ix__code=ix, service__service_type__name="Bilateral").count()
+        totServices = service_type_counts(self.queryset.filter(service__ix__code=ix))
 
-        totFreeInterfaces = IX.objects.filter(
-            Q(code=ix) &
-            Q(region__sites__devices__device_role__slug__in=['pe', 'l2']) &
-            (
-                (
-                    Q(region__sites__devices__interfaces__cable__isnull=True) &
-                    Q(region__sites__devices__interfaces__mark_connected=False) &
-                    Q(region__sites__devices__interfaces__customerconnectionendpoint__isnull=True) &
-                    Q(region__sites__devices__interfaces__custom_field_data__InterfaceRole='Participant')
-                ) |
-                (
-                    # Q(region__sites__devices__rearports__cable__isnull=True) &
-                    # Q(region__sites__devices__rearports__mark_connected=False) &
-                    Q(region__sites__devices__interfaces__customerconnectionendpoint__isnull=True) &
-                    Q(region__sites__devices__interfaces__custom_field_data__InterfaceRole='Participant')
-                )
-            )
-        ).count()
+        # interfaces de participantes sem endpoint (a condicao com cabo/mark_connected
+        # ja estava contida na segunda)
+        totFreeInterfaces = free_interface_count(ix)
 
         data = {
             "totASs": totASs,
-            "totServicesATMv4": totServicesATMv4,
-            "totServicesATMv6": totServicesATMv6,
-            "totServicesBilateral": totServicesBilateral,
+            "totServicesATMv4": totServices['atmv4'],
+            "totServicesATMv6": totServices['atmv6'],
+            "totServicesBilateral": totServices['bilaterais'],
             "totFreeInterfaces": totFreeInterfaces,
         }
 
@@ -917,10 +1000,8 @@ class CustomerServiceViewSet(AuthViewSet):
 
         data = {
             'asns': qs.values('asn__number').distinct().order_by(),
-            'atmv4': qs.filter(service__service_type__name='ATMv4').count(),
-            'atmv6': qs.filter(service__service_type__name='ATMv6').count(),
-            'bilaterais': qs.filter(service__service_type__name='Bilateral').count(),
         }
+        data.update(service_type_counts(qs))
         return Response(data)
 
 
@@ -981,49 +1062,53 @@ class CreateOrUpdateCustomerServiceViewSet(AuthViewSet):
     def perform_create(self, serializer):
         # raise ValidationError("**TESTE DE PARAMETROS NA VIEW OK**\n{}".format(vars(self.request)))
         if isinstance(self.request.data,list):
-            serializer_data = []
+            serializer_data = {}
             with transaction.atomic():
-                for item_data in self.request.data:
-                    # tag_or_outer = object_data.get("tag_or_outer")
-                    # tag_domain_id = item_data.get("tag_domain_id")
-                    connection_id = item_data.get("connection")
-                    tag_domain_id = self._get_tag_domain_id(connection_id)
-
-                    if tag_domain_id:
-                        tag_or_outer_v4 = item_data.get("tag_number_v4")
-                        tag_or_outer_v6 = item_data.get("tag_number_v6")
-                        tag_or_outer_bilateral = item_data.get("tag_or_outer_bilateral")
-                        # create service for ipv4 only or ipv6 only
-                        if tag_or_outer_v4 or tag_or_outer_v6 or tag_or_outer_bilateral:
-                            tag_or_outer = self._get_tag_by_domain(
-                                tag_domain_id,
-                                tag_or_outer_v4 or tag_or_outer_v6 or tag_or_outer_bilateral
-                            )
-                            if tag_or_outer:
-                                if tag_or_outer_bilateral:
-                                    # service = self._get_bilateral_service(
-                                    #     tag_domain_id,
-                                    #     tag_number=tag_or_outer.tag,
-                                    #     asn_number=item_data.get('asn')['number']
-                                    # )
-
-                                    # tag_or_outer.status = "AVAILABLE"
-                                    # tag_or_outer.save()
-
-                                    obj_serializer = self.get_serializer(data=item_data)
-                                    obj_serializer.is_valid(raise_exception=True)
-                                    obj_serializer.save(tag_or_outer=tag_or_outer,)# service=service)
-                                    serializer_data.append(obj_serializer.data)
-                                else:
-                                    obj_serializer = self.get_serializer(data=item_data)
-                                    obj_serializer.is_valid(raise_exception=True)
-                                    obj_serializer.save(tag_or_outer=tag_or_outer)
-                                    serializer_data.append(obj_serializer.data)
-            return serializer_data
+                # servicos v4/v6 validados e gravados em lote
+                provisioner = ServiceProvisioner(self.request.data)
+                provisioner.run()
+                if provisioner.created:
+                    services = self._get_created_services(provisioner)
+                    for position, service in provisioner.created:
+                        serializer_data[position] = services[service.pk]
+                # bilaterais seguem um item por vez (receivers renomeiam o IXService do par)
+                for position, item_data, tag_or_outer in provisioner.deferred:
+                    obj_serializer = self.get_serializer(data=item_data)
+                    obj_serializer.is_valid(raise_exception=True)
+                    obj_serializer.save(tag_or_outer=tag_or_outer)
+                    serializer_data[position] = obj_serializer.data
+            return [serializer_data[position] for position in sorted(serializer_data)]
         else:
             serializer.is_valid(raise_exception=True)
             serializer.save()
 
+    def _get_created_services(self, provisioner):
+        services = list(CustomerService.objects.filter(
+            pk__in=[service.pk for position, service in provisioner.created]
+        ).select_related(
+            'asn', 'service__service_type', 'service__ix', 'mlpav4_address__ix', 'mlpav6_address__ix',
+        ).prefetch_related('mac_address', 'tags'))
+        for service in services:
+            # enderecos acabaram de ser alocados
+            for address in (service.mlpav4_address, service.mlpav6_address):
+                if address is not None:
+                    address.allocated = True
+        tags = ServiceTag.objects.filter(pk__in=[tag.pk for tag in provisioner.promoted]).prefetch_related('tags')
+        self._log_bulk_changes(services, tags)
+        return dict(
+            (service.pk, data) for service, data in zip(services, self.get_serializer(services, many=True).data)
+        )
+
+    def _log_bulk_changes(self, services, tags):
+        # bulk_create/update nao disparam os sinais do changelog do netbox
+        changes = [service.to_objectchange(ObjectChangeActionChoices.ACTION_CREATE) for service in services]
+        changes += [tag.to_objectchange(ObjectChangeActionChoices.ACTION_UPDATE) for tag in tags]
+        for objectchange in changes:
+            objectchange.user = self.request.user
+            objectchange.user_name = self.request.user.username
+            objectchange.request_id = self.request.id
+        ObjectChange.objects.bulk_create(changes)
+
 
     @transaction.atomic
     def perform_update(self, serializer):
@@ -1076,7 +1161,8 @@ class CreateOrUpdateCustomerServiceViewSet(AuthViewSet):
             return service_tag or ServiceTag.objects.create(tag=tag_number, tag_domain=tag_domain)
         else:
             # caso a tag noa seja informada verifica se exista uma tag disponivel e retorn o objeto
-            service_tag = ServiceTag.objects.filter(status="AVAILABLE", tag_domain=tag_domain).first()
+            tag = tag_domain.get_tag_bitmap().first_free()
+            service_tag = ServiceTag.objects.filter(tag=tag, tag_domain=tag_domain).first() if tag is not None else None
             if not service_tag:
                 # a tag disponivel nao foi encontrada entao nao sera validada para o dominio informado
                 raise ValidationError("*** No ServiceTag available for domain: {}".format(tag_domain_id))
@@ -1092,7 +1178,7 @@ class CreateOrUpdateCustomerServiceViewSet(AuthViewSet):
             # dominio nao foi encontrado pelo id informado
             raise ValidationError("*** ServiceTagDomain not found: {}".format(tag_domain_id))
 
-        bilateral = ServiceType.objects.get(name="Bilateral")
+        bilateral = registry.bilateral_type()
         cstag = CustomerService.objects.filter(tag_or_outer__tag=tag_number).first()
 
         if cstag:
@@ -1219,9 +1305,10 @@ class ATMv4ServiceViewSet(ReadOnlyViewSet):
     filter_fields = ("service__ix__code", )
     
     def get_queryset(self): 
-        atmv4 = ServiceType.objects.filter(pk=1).first()
-        services = IXService.objects.filter(service_type=atmv4)
-        return CustomerService.objects.filter(service__in=services)
+        atmv4 = registry.atmv4_type()
+        if atmv4 is None:
+            return CustomerService.objects.none()
+        return CustomerService.objects.filter(service__service_type=atmv4)
     
 
 class ATMv6ServiceViewSet(ReadOnlyViewSet):   
@@ -1229,18 +1316,20 @@ class ATMv6ServiceViewSet(ReadOnlyViewSet):
     queryset = CustomerService.objects.all()
     
     def get_queryset(self): 
-        atmv6 = ServiceType.objects.filter(pk=2).first()
-        services = IXService.objects.filter(service_type=atmv6)
-        return CustomerService.objects.filter(service__in=services)
+        atmv6 = registry.atmv6_type()
+        if atmv6 is None:
+            return CustomerService.objects.none()
+        return CustomerService.objects.filter(service__service_type=atmv6)
 
 class BilateralServiceViewSet(ReadOnlyViewSet):    
     serializer_class = CustomerServiceSerializer
     queryset = CustomerService.objects.all()
     
     def get_queryset(self): 
-        bilateral = ServiceType.objects.filter(pk=3).first()
-        services = IXService.objects.filter(service_type=bilateral)
-        return CustomerService.objects.filter(service__in=services)
+        bilateral = registry.bilateral_type()
+        if bilateral is None:
+            return CustomerService.objects.none()
+        return CustomerService.objects.filter(service__service_type=bilateral)
 
 
 class InterfaceDViewSet(ReadOnlyViewSet):
@@ -1257,77 +1346,31 @@ class InterfaceDViewSet(ReadOnlyViewSet):
 
         qs = self.filter_queryset(self.get_queryset())
         qs = qs.filter(custom_field_data__InterfaceRole='Participant')
+
+        # trace de todas as interfaces do device de uma vez
+        tracer = DeviceTrace(qs)
         data = []
-        for item in qs:
+        for item in tracer.interfaces:
+            # livre: nem a interface nem as portas do caminho sao CustomerConnectionEndpoint
+            if tracer.has_endpoint(item):
+                continue
 
             dio_connected = None
-
-            dataItem = {}
-
-            trace = item.trace()
-            flag_ccendpoint = False
-
-            if len(trace)>0:
-                for line in trace:
-                    for searchCcEndpoint in line:
-                        try:
-                            getattr(searchCcEndpoint, 'customerconnectionendpoint')
-                            flag_ccendpoint = False
-                            break
-                        except:
-                            flag_ccendpoint = True
-                    if flag_ccendpoint == False:
-                        break
-            else:
-                try:
-                    getattr(item, 'customerconnectionendpoint')
-                except:
-                    flag_ccendpoint = True
-
-            # if(len(trace) > 2):
-            #     try:
-            #         getattr(trace[-1][-1], 'customerconnectionendpoint')
-            #     except:
-            #         flag_ccendpoint = True
-
-            # elif len(trace) > 1:
-            #     try:
-            #         getattr(trace[1][0], 'customerconnectionendpoint')
-            #     except:
-            #         flag_ccendpoint = True
-            # else:
-            #     try:
-            #         getattr(trace[0][-1], 'customerconnectionendpoint')
-            #     except:
-            #         try:
-            #             getattr(item, 'customerconnectionendpoint')
-            #         except:
-            #             flag_ccendpoint = True
-
-            if flag_ccendpoint:
-                try:
-                    if len(trace)>0:
-                        for position in trace:
-                            for positionItem in position:
-                                if isinstance(positionItem, RearPort):
-                                    dio_connected = {
-                                        'position_id': positionItem.id,
-                                        'position_name': positionItem.name,
-                                        'device_id': positionItem.device.id,
-                                        'dio_name': positionItem.device.name,
-                                    }
-                                    break
-                            if dio_connected != None:
-                                break
-                except Exception as e:
-                    print(f'Exception {e}')
-                dataItem['device_id'] = item.device_id
-                dataItem['device_name'] = item.device.name
-                dataItem['position_id'] = item.id
-                dataItem['position_name'] = item.name
-                dataItem['dio_connected'] = dio_connected
-                data.append(dataItem)
-
+            rearport = tracer.first_rearport(item)
+            if rearport is not None:
+                dio_connected = {
+                    'position_id': rearport.id,
+                    'position_name': rearport.name,
+                    'device_id': rearport.device.id,
+                    'dio_name': rearport.device.name,
+                }
+            data.append({
+                'device_id': item.device_id,
+                'device_name': item.device.name,
+                'position_id': item.id,
+                'position_name': item.name,
+                'dio_connected': dio_connected,
+            })
 
         return Response(data)
 
@@ -1340,8 +1383,11 @@ class InterfaceDViewSet(ReadOnlyViewSet):
 
         qs = self.filter_queryset(self.get_queryset())
         qs = qs.filter(custom_field_data__InterfaceRole='Participant')
+
+        # trace de todas as interfaces do device de uma vez
+        tracer = DeviceTrace(qs)
         data = []
-        for item in qs:
+        for item in tracer.interfaces:
 
             dataItem = {
                 'id': item.id,
@@ -1357,57 +1403,31 @@ class InterfaceDViewSet(ReadOnlyViewSet):
                 'tags': {},
             }
 
-            trace = item.trace()
-            if(len(trace) > 2):
-                try:
-                    dataItem['device'] = trace[-1][-1].device.id
-                    dataItem['device_port'] = trace[-1][-1].name
-                    dataItem['device_name'] = trace[-1][-1].device.name
-                    dataItem['device_role'] = trace[-1][-1].device.device_role.slug
-                except:
-                    pass
+            trace = tracer.trace(item)
+            # porta remota: fim do caminho, porta do DIO apos o primeiro cabo
+            # ou ponta do primeiro cabo; a conexao e lida da porta do DIO ou
+            # da propria interface
+            if len(trace) > 2:
+                remote, endpoint = trace[-1][-1], None
             elif len(trace) > 1:
-                try:
-                    dataItem['device'] = trace[1][0].device.id
-                    dataItem['device_port'] = trace[1][0].name
-                    dataItem['device_name'] = trace[1][0].device.name
-                    dataItem['device_role'] = trace[1][0].device.device_role.slug
-                    dataItem['ccId'] = trace[1][0].customerconnectionendpoint.customer_connection.id
-                    dataItem['ccName'] = trace[1][0].customerconnectionendpoint.customer_connection.name
-                    dataItem['asn__number'] = trace[1][0].customerconnectionendpoint.customer_connection.asn.number
-
-                    for customerservice in trace[1][0].customerconnectionendpoint.customer_connection.customerservice.iterator():
-                        try:
-                            if customerservice.asn.number not in list(dataItem['tags'].keys()):
-                                dataItem['tags'][customerservice.asn.number] = [customerservice.tag_or_outer.tag]
-                            else:
-                                dataItem['tags'][customerservice.asn.number].append(customerservice.tag_or_outer.tag)
-                        except:
-                            pass
-                except:
-                    pass
+                remote = trace[1][0]
+                endpoint = tracer.endpoint(remote)
             else:
-                try:
-                    dataItem['device'] = trace[0][-1].device.id
-                    dataItem['device_port'] = trace[0][-1].name
-                    dataItem['device_name'] = trace[0][-1].device.name
-                    dataItem['device_role'] = trace[0][-1].device.device_role.slug
-                except:
-                    try:
-                        dataItem['ccId'] = item.customerconnectionendpoint.customer_connection.id
-                        dataItem['ccName'] = item.customerconnectionendpoint.customer_connection.name
-                        dataItem['asn__number'] = item.customerconnectionendpoint.customer_connection.asn.number
-
-                        for customerservice in item.customerconnectionendpoint.customer_connection.customerservice.iterator():
-                            try:
-                                if customerservice.asn.number not in list(dataItem['tags'].keys()):
-                                    dataItem['tags'][customerservice.asn.number] = [customerservice.tag_or_outer.tag]
-                                else:
-                                    dataItem['tags'][customerservice.asn.number].append(customerservice.tag_or_outer.tag)
-                            except:
-                                pass
-                    except:
-                        pass
+                remote = trace[0][-1] if trace else None
+                endpoint = tracer.endpoint(item) if remote is None else None
+
+            if remote is not None:
+                dataItem['device'] = remote.device.id
+                dataItem['device_port'] = remote.name
+                dataItem['device_name'] = remote.device.name
+                dataItem['device_role'] = remote.device.device_role.slug
+
+            if endpoint is not None and endpoint.customer_connection_id:
+                connection = endpoint.customer_connection
+                dataItem['ccId'] = connection.id
+                dataItem['ccName'] = connection.name
+                dataItem['asn__number'] = connection.asn.number
+                dataItem['tags'] = tracer.tags(connection.id)
 
             data.append(dataItem)
 
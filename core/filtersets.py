@@ -10,6 +10,8 @@ from ixservices.ixservices.models import (AS, IX, ServiceTagDomain, ServiceTag,
                                           CustomerConnection, CustomerConnectionEndpoint)
 
 from ixservices.ixservices.utils.status import TagStatusChoices, IPStatusChoices, TagDomainChoices
+from ixservices.ixservices.utils.ips_utils import filter_address_range
+from ixservices.ixservices.utils.registry import registry
 
 
 class BaseFilterSet(PrimaryModelFilterSet):
@@ -32,6 +34,24 @@ class BaseFilterSet(PrimaryModelFilterSet):
         # print(qs_filter)
         return queryset.filter(qs_filter)
 
+class AddressRangeFilterSet(BaseFilterSet):
+    within = django_filters.CharFilter(method='_address_range', label='Within (CIDR)',)
+    start = django_filters.CharFilter(method='_address_range', label='Start address',)
+    end = django_filters.CharFilter(method='_address_range', label='End address',)
+
+    # versao do IP filtrado
+    ip_version = None
+
+    class Meta(BaseFilterSet.Meta):
+        abstract = True
+
+    def _address_range(self, queryset, name, value):
+        try:
+            return filter_address_range(queryset, self.ip_version, **{name: value})
+        except ValueError:
+            return queryset.none()
+
+
 ### core filtersets ###
 class IXFilterSet(BaseFilterSet):
     code = django_filters.CharFilter(method='code', label='Code',)
@@ -92,7 +112,7 @@ class TagFilterSet(BaseFilterSet):
         if not value.strip():
             return queryset
         try:
-            ix = IX.objects.get(pk=int(value.strip()))
+            ix = registry.ix_by_pk(int(value.strip()))
         except Exception:
             pass
         return queryset.filter(ix=ix) if ix else queryset
@@ -120,7 +140,9 @@ class ServiceTagDomainFilterSet(BaseFilterSet):
        
 
 
-class IPv4AddressFilterSet(BaseFilterSet):
+class IPv4AddressFilterSet(AddressRangeFilterSet):
+    ip_version = 4
+
     address = django_filters.CharFilter(method='address', label='Address',)   
     is_allocated = django_filters.BooleanFilter(
         method='_is_allocated',
@@ -149,7 +171,9 @@ class IPv4AddressFilterSet(BaseFilterSet):
     
 
 
-class IPv6AddressFilterSet(BaseFilterSet):
+class IPv6AddressFilterSet(AddressRangeFilterSet):
+    ip_version = 6
+
     address = django_filters.CharFilter(method='address', label='Address',)
     is_allocated = django_filters.BooleanFilter(
         method='_is_allocated',
@@ -93,12 +93,12 @@ class ServiceTagDomainSelectViewSet(CustomFieldModelViewSet):
     filterset_class = filtersets.ServiceTagDomainFilterSet
 
 class IPv4AddressSelectViewSet(CustomFieldModelViewSet):
-    queryset = IPv4Address.objects.all()
+    queryset = IPv4Address.objects.with_allocation()
     serializer_class = serializers.IPv4AddressSerializer
     filterset_class = filtersets.IPv4AddressFilterSet
 
 class IPv6AddressSelectViewSet(CustomFieldModelViewSet):
-    queryset = IPv6Address.objects.all()
+    queryset = IPv6Address.objects.with_allocation()
     serializer_class = serializers.IPv6AddressSerializer
     filterset_class = filtersets.IPv6AddressFilterSet
 
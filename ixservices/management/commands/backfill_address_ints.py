@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from ixservices.ixservices.models import IPv4Address, IPv6Address
+from ixservices.ixservices.utils.ips_utils import BULK_BATCH_SIZE, ipv4_to_int, ipv6_to_pair
+
+
+class Command(BaseCommand):
+    help = 'Preenche as colunas numericas (address_int, address_hi/lo) dos IPv4Address e IPv6Address'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Recalcula todos os enderecos e nao somente os que estao sem valor'
+        )
+
+    def handle(self, *args, **options):
+        ipv4 = IPv4Address.objects.all()
+        ipv6 = IPv6Address.objects.all()
+        if not options['all']:
+            ipv4 = ipv4.filter(address_int__isnull=True)
+            ipv6 = ipv6.filter(Q(address_hi__isnull=True) | Q(address_lo__isnull=True))
+
+        self.backfill(IPv4Address, ipv4, ['address_int'], lambda obj: (ipv4_to_int(obj.address),))
+        self.backfill(IPv6Address, ipv6, ['address_hi', 'address_lo'], lambda obj: ipv6_to_pair(obj.address))
+
+    def backfill(self, model, queryset, fields, convert):
+        objs = []
+        for obj in queryset.only('pk', 'address').iterator(chunk_size=BULK_BATCH_SIZE):
+            for field, value in zip(fields, convert(obj)):
+                setattr(obj, field, value)
+            objs.append(obj)
+
+        with transaction.atomic():
+            model.objects.bulk_update(objs, fields, batch_size=BULK_BATCH_SIZE)
+        self.stdout.write(self.style.SUCCESS('{}: {} enderecos atualizados'.format(model.__name__, len(objs))))
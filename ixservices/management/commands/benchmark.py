@@ -0,0 +1,281 @@
+import re
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from ixservices.ixservices.models import AS, IX, CustomerService, ServiceTag, ServiceTagDomain
+from ixservices.ixservices.utils.ips_utils import iter_ix_addresses, seed_ix_addresses
+from ixservices.ixservices.utils.stats import ix_panel_stats
+from ixservices.ixservices.utils.status import TagStatusChoices
+from ixservices.ixservices.utils.tagpool import seed_tag_domain
+from ixservices.ixservices.utils.validation import VALIDATIONS, validation_policy
+from ixservices.ixservices.utils.validators import (validate_as_number, validate_as_numbers, validate_batch,
+                                                    validate_ipv4_network, validate_mac_address,
+                                                    validate_mac_addresses, validate_networks)
+from ixservices.ixservices.utils.whoisutils import WHOIS_SUMMARY_FIELDS, decode_line, parse_whois
+
+
+# prefixos reservados para benchmark (RFC 2544 e RFC 3849)
+BENCHMARK_IPV4 = '198.18.0.0/{}'
+BENCHMARK_IPV6 = '2001:db8:ffff::/64'
+
+
+def synthetic_whois(members=20000):
+    """Whois response of an AS-SET with many members."""
+    lines = [b'% IANA WHOIS server', b'% for more information on IANA, visit http://www.iana.org', b'']
+    lines += [b'as-set:         AS-BENCHMARK', b'descr:          benchmark set']
+    lines += [b'members:        AS%d' % (64512 + n) for n in range(members)]
+    lines += [b'', b'aut-num:        AS65000', b'as-name:        BENCHMARK-AS', b'owner:          Benchmark S.A.',
+              b'e-mail:         noc@benchmark.example   % contato', b'']
+    return b'\n'.join(lines)
+
+
+def parse_whois_lines(whois_content):
+    """Previous line by line str parser, kept as the benchmark baseline."""
+    final_list = []
+    line_break = False
+    for line in whois_content.split(b'\n'):
+        decoded_line = decode_line(line)
+        if final_list and re.match(r'^\s*(?:%.*)?$', decoded_line):
+            line_break = True
+        match_content = re.match(r'^\s*\b([\w\d-]*):\s*((?:(?! %.*$).)*)', decoded_line)
+        if match_content:
+            if line_break:
+                final_list.append(('', ''))
+                line_break = False
+            final_list.append(match_content.groups())
+    return final_list
+
+
+def ix_panel_stats_baseline(ix, user):
+    """Previous IXView stats, one count() per number, kept as the benchmark baseline."""
+    qs, st = ix.servicetag_set, TagStatusChoices()
+    def qs_restrict(qs):
+        return qs.restrict(user, 'view')
+    def get_by_status(status):
+        return qs_restrict(qs).filter(status=status).count()
+    def get_total_ips(qs):
+        return qs_restrict(qs).count(), qs.filter(customerservice__isnull=True).count(), \
+            qs.filter(customerservice__isnull=False).count()
+    services = qs_restrict(CustomerService.objects.filter(service__ix=ix))
+    ipv4, ipv4_free, ipv4_alloc = get_total_ips(ix.ipv4address.all())
+    ipv6, ipv6_free, ipv6_alloc = get_total_ips(ix.ipv6address.all())
+    return {
+        'total_asn': qs_restrict(AS.objects.filter(customerservice__service__ix=ix).distinct()).count(),
+        'total_services': services.count(),
+        'total_atmv4': services.filter(service__service_type__pk=1).count(),
+        'total_atmv6': services.filter(service__service_type__pk=2).count(),
+        'total_bilateral': services.filter(service__service_type__pk=3).count(),
+        'total_ipv4': ipv4,
+        'total_ipv4_free': ipv4_free,
+        'total_ipv4_alloc': ipv4_alloc,
+        'total_ipv6': ipv6,
+        'total_ipv6_free': ipv6_free,
+        'total_ipv6_alloc': ipv6_alloc,
+        'tags_avail_count': get_by_status(st.STATUS_AVAILABLE),
+        'tags_alloc_count': get_by_status(st.STATUS_ALLOCATED),
+        'tags_prod_count': get_by_status(st.STATUS_PRODUCTION),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark das rotinas de carga do plugin'
+
+    targets = ('ipseeding', 'savepaths', 'validators', 'whoisparse', 'panels')
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', choices=self.targets)
+        parser.add_argument(
+            '--prefixes', nargs='+', type=int, default=[24, 22, 20],
+            help='Tamanhos de prefixo IPv4 usados no benchmark de IPs'
+        )
+        parser.add_argument(
+            '--write', action='store_true',
+            help='Grava as linhas no banco (dentro de uma transacao desfeita ao final)'
+        )
+        parser.add_argument(
+            '--count', type=int, default=100000,
+            help='Numero de valores no benchmark dos validadores'
+        )
+        parser.add_argument(
+            '--files', nargs='+', default=[],
+            help='Respostas whois gravadas usadas no benchmark do parser (padrao: AS-SET sintetico)'
+        )
+        parser.add_argument(
+            '--saves', type=int, default=100,
+            help='Numero de saves por caminho no benchmark de validacao'
+        )
+        parser.add_argument(
+            '--username',
+            help='Usuario cujas permissoes sao aplicadas no benchmark dos paineis (padrao: superusuario)'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=10,
+            help='Numero de execucoes de cada painel'
+        )
+
+    def handle(self, *args, **options):
+        getattr(self, 'bench_{}'.format(options['target']))(**options)
+
+    def report(self, label, rows, elapsed):
+        rate = rows / elapsed if elapsed else float('inf')
+        self.stdout.write('{:<24} {:>8} rows {:>10.3f}s {:>12.0f} rows/s'.format(label, rows, elapsed, rate))
+
+    def report_queries(self, label, saves, queries, elapsed):
+        self.stdout.write('{:<24} {:>8} saves {:>8.1f} queries/save {:>10.3f}s'.format(
+            label, saves, queries / saves if saves else 0, elapsed
+        ))
+
+    def bench_ipseeding(self, prefixes, write, **options):
+        for prefixlen in prefixes:
+            ipv4_prefix = BENCHMARK_IPV4.format(prefixlen)
+
+            start = time.perf_counter()
+            rows = 2 * sum(1 for _ in iter_ix_addresses(ipv4_prefix, BENCHMARK_IPV6))
+            self.report('/{} compute'.format(prefixlen), rows, time.perf_counter() - start)
+
+            if not write:
+                continue
+
+            with transaction.atomic():
+                ix = IX.objects.create(
+                    code='bnch', shortname='benchmark.br', fullname='Benchmark - BR',
+                    ipv4_prefix=ipv4_prefix, ipv6_prefix=BENCHMARK_IPV6,
+                    management_prefix='10.255.255.0/24', create_ips=False, create_tags=False
+                )
+                start = time.perf_counter()
+                rows = seed_ix_addresses(ix)
+                self.report('/{} bulk insert'.format(prefixlen), rows, time.perf_counter() - start)
+                # descarta o IX e os IPs criados para o benchmark
+                transaction.set_rollback(True)
+
+    def _measure(self, label, saves, save, policy=None):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for n_save in range(saves):
+                if policy is None:
+                    save(n_save)
+                else:
+                    with validation_policy(**policy):
+                        save(n_save)
+            elapsed = time.perf_counter() - start
+        self.report_queries(label, saves, len(queries), elapsed)
+
+    def bench_savepaths(self, saves, **options):
+        policies = (
+            ('full', None),
+            ('dirty only', {'dirty_only': True}),
+            ('trusted', {'skip': VALIDATIONS}),
+        )
+        with transaction.atomic():
+            ix = IX.objects.create(
+                code='bnch', shortname='benchmark.br', fullname='Benchmark - BR',
+                ipv4_prefix=BENCHMARK_IPV4.format(24), ipv6_prefix=BENCHMARK_IPV6,
+                management_prefix='10.255.255.0/24', create_ips=False, create_tags=False
+            )
+            tag_domain = ServiceTagDomain.objects.create(domain_type='IX-DOMAIN', ix=ix)
+            tag = ServiceTag.objects.create(tag=100, ix=ix, tag_domain=tag_domain)
+
+            def flip_tag(n_save):
+                tag.status = 'PRODUCTION' if n_save % 2 else 'AVAILABLE'
+                tag.save()
+
+            def describe_ix(n_save):
+                ix.description = 'benchmark {}'.format(n_save)
+                ix.save()
+
+            def describe_domain(n_save):
+                tag_domain.description = 'benchmark {}'.format(n_save)
+                tag_domain.save()
+
+            for name, save in (('tag status', flip_tag), ('ix', describe_ix), ('tag domain', describe_domain)):
+                for label, policy in policies:
+                    self._measure('{} {}'.format(name, label), saves, save, policy)
+
+            # descarta os objetos criados para o benchmark
+            transaction.set_rollback(True)
+
+    def bench_validators(self, count, **options):
+        # um valor invalido a cada dez
+        asns = [64500 if n % 10 == 0 else 262000 + n for n in range(count)]
+        macs = ['zz:zz' if n % 10 == 0 else '02:00:{:02x}:{:02x}:{:02x}:01'.format(
+            (n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff) for n in range(count)]
+        prefixes = ['10.0.0.0/33' if n % 10 == 0 else '10.{}.{}.0/24'.format((n >> 8) & 0xff, n & 0xff)
+                    for n in range(count)]
+
+        cases = (
+            ('asn single', lambda: validate_batch(validate_as_number, asns)),
+            ('asn batch', lambda: validate_as_numbers(asns)),
+            ('mac single', lambda: validate_batch(validate_mac_address, macs)),
+            ('mac batch', lambda: validate_mac_addresses(macs)),
+            ('ipv4 prefix single', lambda: validate_batch(validate_ipv4_network, prefixes)),
+            ('ipv4 prefix batch', lambda: validate_networks(prefixes, 4)),
+        )
+        for label, run in cases:
+            start = time.perf_counter()
+            errors = run()
+            self.report('{} ({} err)'.format(label, len(errors)), count, time.perf_counter() - start)
+
+    def bench_whoisparse(self, files, **options):
+        fixtures = []
+        for path in files:
+            with open(path, 'rb') as fixture:
+                fixtures.append((path, fixture.read()))
+        if not fixtures:
+            fixtures.append(('synthetic as-set', synthetic_whois()))
+
+        for name, content in fixtures:
+            self.stdout.write('{} ({} bytes)'.format(name, len(content)))
+            cases = (
+                ('  baseline', lambda: parse_whois_lines(content)),
+                ('  streaming', lambda: parse_whois(content)),
+                ('  projection', lambda: parse_whois(content, WHOIS_SUMMARY_FIELDS)),
+            )
+            for label, run in cases:
+                start = time.perf_counter()
+                rows = len(run())
+                self.report(label, rows, time.perf_counter() - start)
+
+    def bench_panels(self, prefixes, username, repeat, **options):
+        repeat = max(repeat, 1)
+        if username:
+            try:
+                user = get_user_model().objects.get(username=username)
+            except get_user_model().DoesNotExist:
+                raise CommandError('Usuario {} nao encontrado'.format(username))
+        else:
+            user = get_user_model()(username='benchmark', is_superuser=True)
+
+        with transaction.atomic():
+            # IX sintetico com o maior prefixo pedido, todos os IPs e tags
+            ix = IX.objects.create(
+                code='bnch', shortname='benchmark.br', fullname='Benchmark - BR',
+                ipv4_prefix=BENCHMARK_IPV4.format(min(prefixes)), ipv6_prefix=BENCHMARK_IPV6,
+                management_prefix='10.255.255.0/24', create_ips=False, create_tags=False
+            )
+            seed_ix_addresses(ix)
+            tag_domain = ServiceTagDomain.objects.create(domain_type='IX-DOMAIN', ix=ix)
+            seed_tag_domain(tag_domain, ix=ix)
+            st = TagStatusChoices()
+            ServiceTag.objects.filter(tag_domain=tag_domain, tag__gte=1000, tag__lt=3000).update(status=st.STATUS_PRODUCTION)
+
+            results = {}
+            for label, stats in (('baseline', ix_panel_stats_baseline), ('grouped', ix_panel_stats)):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for n_run in range(repeat):
+                        results[label] = stats(ix, user)
+                    elapsed = time.perf_counter() - start
+                self.stdout.write('{:<24} {:>8} runs {:>8.1f} queries/run {:>10.3f}s'.format(
+                    'ix panel {}'.format(label), repeat, len(queries) / repeat, elapsed
+                ))
+            if results['baseline'] != results['grouped']:
+                self.stdout.write(self.style.WARNING('paineis divergentes: {} != {}'.format(
+                    results['baseline'], results['grouped']
+                )))
+
+            # descarta os objetos criados para o benchmark
+            transaction.set_rollback(True)
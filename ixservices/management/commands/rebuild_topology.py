@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from ixservices.ixservices.models import CustomerConnectionEndpoint
+from ixservices.ixservices.utils.topology import rebuild_topology
+
+
+class Command(BaseCommand):
+    help = 'Recria o cache de topologia (CustomerConnectionTopology) dos CustomerConnectionEndpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('connections', nargs='*', type=int, help='IDs das CustomerConnections (padrao: todas)')
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Somente endpoints que ainda nao possuem topologia'
+        )
+
+    def handle(self, *args, **options):
+        endpoints = CustomerConnectionEndpoint.objects.select_related(
+            'interface__device', 'frontport__device', 'rearport__device'
+        )
+        if options['connections']:
+            endpoints = endpoints.filter(customer_connection__in=options['connections'])
+        if options['missing']:
+            endpoints = endpoints.filter(topology__isnull=True)
+
+        count = 0
+        for endpoint in endpoints.iterator():
+            rebuild_topology(endpoint)
+            count += 1
+        self.stdout.write(self.style.SUCCESS('{} endpoints atualizados'.format(count)))
@@ -0,0 +1,22 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from ixservices.ixservices.utils.counters import COUNTED_MODELS, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Refaz os contadores da home (StatCounter) a partir de contagens reais; para execucao periodica (cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='Modelos (padrao: todos), ex.: ipv4address servicetag')
+
+    def handle(self, *args, **options):
+        names = [name.lower() for name in options['models']]
+        unknown = [name for name in names if name not in COUNTED_MODELS]
+        if unknown:
+            raise CommandError('Modelos sem contador: {}'.format(', '.join(unknown)))
+
+        totals = reconcile_counters(*[apps.get_model('ixservices', name) for name in names])
+        for name, total in totals.items():
+            self.stdout.write('{}: {}'.format(name, total))
+        self.stdout.write(self.style.SUCCESS('{} modelos reconciliados'.format(len(totals))))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ixservices.ixservices.models import IX
+
+
+class Command(BaseCommand):
+    help = 'Troca os prefixos de um IX renumerando os IPs e os servicos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('code', help='Codigo do IX')
+        parser.add_argument('--ipv4', help='Novo prefixo IPv4')
+        parser.add_argument('--ipv6', help='Novo prefixo IPv6')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Somente exibe o remapeamento planejado, sem gravar'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            ix = IX.objects.get(code=options['code'])
+        except IX.DoesNotExist:
+            raise CommandError('IX {} nao encontrado'.format(options['code']))
+        if not options['ipv4'] and not options['ipv6']:
+            raise CommandError('Informar --ipv4 e/ou --ipv6')
+
+        ix.ipv4_prefix = options['ipv4'] or ix.ipv4_prefix
+        ix.ipv6_prefix = options['ipv6'] or ix.ipv6_prefix
+
+        ix.full_clean()
+        remap = ix.plan_renumber()
+        if not options['dry_run']:
+            # o post_save do IX executa a renumeracao
+            ix.save()
+
+        for version, plan in remap.items():
+            self.stdout.write('{}: {} -> {} (offset {})'.format(
+                version, plan['old_prefix'], plan['new_prefix'], plan['offset']))
+            self.stdout.write('  remapeados: {}  criados: {}  removidos: {}  servicos: {}'.format(
+                len(plan['remap']), len(plan['create']), len(plan['delete']), len(plan['services'])))
+            for pk, address in plan['services']:
+                self.stdout.write('  service {} -> {}'.format(pk, address))
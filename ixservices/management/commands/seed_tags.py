@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from ixservices.ixservices.models import ServiceTagDomain
+
+
+class Command(BaseCommand):
+    help = 'Cria as tags (0 - 4095) faltantes dos ServiceTagDomains informados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('domains', nargs='*', type=int, help='IDs dos ServiceTagDomains')
+        parser.add_argument(
+            '--empty', action='store_true',
+            help='Seleciona todos os ServiceTagDomains que ainda nao possuem tags'
+        )
+
+    def handle(self, *args, **options):
+        domains = ServiceTagDomain.objects.all()
+        if options['empty']:
+            domains = domains.annotate(ntags=Count('servicetags')).filter(ntags=0)
+        elif options['domains']:
+            domains = domains.filter(pk__in=options['domains'])
+        else:
+            raise CommandError('Informar os IDs dos dominios ou --empty')
+
+        for tag_domain in domains:
+            # somente o dominio do IX mantem o vinculo das tags com o IX
+            ix = tag_domain.ix if tag_domain.domain_type == 'IX-DOMAIN' else None
+            created = tag_domain.seed_tags(ix=ix)
+            self.stdout.write(self.style.SUCCESS('{}: {} tags criadas'.format(tag_domain, created)))
@@ -4,12 +4,13 @@ from django.utils.translation import gettext as _
 from django.dispatch import receiver
 from django.urls import reverse
 from django.db.models.signals import post_delete, post_save, pre_save
-from django.db.models import Q, UniqueConstraint
+from django.db.models import Exists, OuterRef, Q, UniqueConstraint
+from django.db import transaction
 
 # import do modelo do netbox
 from netbox.models import ChangeLoggedModel
 from netbox.models import NestedGroupModel, PrimaryModel
-from dcim.models import Device, Interface, FrontPort, RearPort, CablePath
+from dcim.models import Cable, Device, Interface, FrontPort, RearPort, CablePath
 from utilities.querysets import RestrictedQuerySet
 
 # importar validacoes
@@ -24,6 +25,17 @@ from .utils.validators import (validate_as_number,
                          validate_url_format, trace_print_exception)
 
 from .utils.constants import (MAX_TAG_NUMBER, MIN_TAG_NUMBER)
+from .utils.ips_utils import ipv4_to_int, ipv6_to_pair, renumber_ix, seed_ix_addresses
+from .utils.prefix_index import get_prefix_index, invalidate_prefix_index
+from .utils.resolver import forget_service, get_resolver, refresh_service, reset_resolver
+from .utils.topology import ENDPOINT_PORTS, ENDPOINT_RELATED, cable_nodes, cablepath_nodes, compute_topology, rebuild_topology, rebuild_topology_for_nodes
+from .utils.tagdomains import reset_tag_domain_map, resolve_tag_domain
+from .utils.registry import ATMV4, ATMV6, BILATERAL, registry
+from .utils.dirty import on_change
+from .utils.validation import PREFIX_OVERLAP, TAG_DOMAIN_UNIQUE, UNIQUE, clean_instance, is_guaranteed, validation_policy
+from .utils.tagsummary import invalidate_all_domain_tags, invalidate_domain_tags
+from .utils.counters import apply_deltas, changed_deltas, instance_deltas
+from .utils.tagpool import TAG_BITMAP_BYTES, TagBitmap, seed_tag_domain
 from .utils.status import TagStatusChoices, ActiveStatusChoices
 
 
@@ -41,11 +53,43 @@ class ChangeLoggingMixin(PrimaryModel):
     def _get_absolute_url(self, model_name):
         return reverse("plugins:ixservices:{}".format(model_name), kwargs={"pk": self.pk})
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # valores carregados, base para get_dirty_fields()
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def get_dirty_fields(self):
+        """Return the names of the fields changed since the instance was loaded or saved."""
+        loaded = getattr(self, '_loaded_values', {})
+        return set(
+            field.name for field in self._meta.concrete_fields
+            if field.attname not in loaded or getattr(self, field.attname) != loaded[field.attname]
+        )
+
+    def has_changed(self, *fields):
+        return bool(self.get_dirty_fields().intersection(fields))
+
+    def get_loaded_value(self, name):
+        """Return the value of a field when loaded or last saved (current value if unknown)."""
+        attname = self._meta.get_field(name).attname
+        return getattr(self, '_loaded_values', {}).get(attname, getattr(self, attname))
+
+    def reset_dirty_fields(self, *fields):
+        """Take the current values as the loaded ones (all fields by default)."""
+        if not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+        for field in self._meta.concrete_fields:
+            if not fields or field.name in fields:
+                self._loaded_values[field.attname] = getattr(self, field.attname)
+
     def save(self, *args, **kwargs):
 
-        # Call clean validations before save.
-        self.full_clean()
+        # Call clean validations before save (following the active validation policy).
+        clean_instance(self)
         super().save(*args, **kwargs)
+        self.reset_dirty_fields()
 
     class Meta:
         abstract = True
@@ -140,15 +184,11 @@ class IX(ChangeLoggingMixin):
 
     # ============== Prefixo de IPs ==================================================
     # rotinas para validacao, criacao e atualizacao dos prefixos importadas do Hercules
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._original_ipv4_prefix = self.ipv4_prefix
-        self._original_ipv6_prefix = self.ipv6_prefix   
-
     def clean(self):
         # self.block_update_pk()
         self.validate_mgmt_network()
-        self.validate_ip_network_intersect()
+        if not is_guaranteed(PREFIX_OVERLAP):
+            self.validate_ip_network_intersect()
     
     # validacao do prefixo de gerencia do IX
     def validate_mgmt_network(self):
@@ -165,17 +205,33 @@ class IX(ChangeLoggingMixin):
     def validate_ip_network_intersect(self):
         current_v4 = ipaddress.ip_network(self.ipv4_prefix)
         current_v6 = ipaddress.ip_network(self.ipv6_prefix)
-        for ix in IX.objects.all():
-            if ix.code == self.code:
-                continue
-            other_v4 = ipaddress.ip_network(ix.ipv4_prefix)
-            other_v6 = ipaddress.ip_network(ix.ipv6_prefix)
-            if current_v4.overlaps(other_v4):
+        index = get_prefix_index(IX)
+        for current, kind in ((current_v4, 'ipv4'), (current_v6, 'ipv6')):
+            overlap = index.first_overlap(current, kinds=(kind,), exclude_code=self.code)
+            if overlap:
+                other, ix_pk, ix_code, kind = overlap
                 raise ValidationError(_("{} overlaps with {} from IX: {}".
-                                        format(current_v4, other_v4, ix)))
-            if current_v6.overlaps(other_v6):
-                raise ValidationError(_("{} overlaps with {} from IX: {}".
-                                        format(current_v6, other_v6, ix)))
+                                        format(current, other, ix_code)))
+
+    @classmethod
+    def get_prefix_owners(cls, value):
+        """
+        Return the (IX, kind) pairs whose ipv4, ipv6 or management prefix
+        contains the address or prefix given.
+
+        """
+        owners = get_prefix_index(cls).owners(value)
+        ixs = cls.objects.in_bulk([ix_pk for ix_pk, ix_code, kind in owners])
+        return [(ixs[ix_pk], kind) for ix_pk, ix_code, kind in owners if ix_pk in ixs]
+
+    @staticmethod
+    def resolve_addresses(*addresses):
+        """
+        Resolve addresses to the IX (longest prefix match), CustomerService
+        and AS using the in-process resolver.
+
+        """
+        return get_resolver(IX, CustomerService).resolve_many(addresses)
 
     def get_ipv4_network(self):
         return ipaddress.ip_network(self.ipv4_prefix)
@@ -190,56 +246,14 @@ class IX(ChangeLoggingMixin):
         return CustomerService.objects.filter(mlpav6_address__ix=self)
 
     
-    # criar os IPs a aprtir do prefixo
-    def create_ipv4(self, old_addresses=[]):
+    # renumeracao dos IPs a partir da troca de prefixo
+    def plan_renumber(self):
         """
-        Create all IPv4Addresses that belong to this IX IPv4 prefix.
-        Raises ValueError if one of those IPs already exist and is assigned
-        to another IX.
+        Return the remap planned for the current prefixes without writing
+        anything (dry-run of update_ips).
 
         """
-        prefix = self.get_ipv4_network()
-        old_prefix = ipaddress.ip_network(self._original_ipv4_prefix)
-        # verifica se a expansao do prefixo
-        if prefix.overlaps(old_prefix) and prefix < old_prefix:
-            new_addresses = (ip for ip in prefix.hosts()
-                             if ip not in old_prefix.hosts())
-
-            for address in new_addresses:
-                IPv4Address.objects.create(address=str(address), ix=self)
-        else:
-            difference = int(prefix.network_address) - int(old_prefix.network_address)
-            for address in old_addresses:
-                ip_address = ipaddress.ip_address(address.address)
-                IPv4Address.objects.create(address=str(ip_address + difference), ix=self, reverse_dns=address.reverse_dns)
-            # If the new prefix is bigger, create the remaining addresses
-            remaining = list(prefix.hosts())[len(old_addresses):]
-            for address in remaining:
-                IPv4Address.objects.create(address=str(address), ix=self)
-
-    def map_new_address_ipv4(self, *services):
-        """
-        Change address of services to match new prefix. If the new prefix
-        contains the old one, no alteration is made. Else, the new address of a
-        given service is calculated by keeping the same offset from the old
-        prefix.
-
-        """
-        prefix = self.get_ipv4_network()
-        old_prefix = ipaddress.ip_network(self._original_ipv4_prefix)
-        # verifica se a expansao do prefixo
-        if prefix.overlaps(old_prefix) and prefix < old_prefix:
-            return
-        else:
-            for service in services:
-                service_address = ipaddress.ip_address(
-                    service.get_address().address)
-                offset = int(service_address) - int(old_prefix.network_address)
-                new_address = prefix.network_address + offset
-                service.set_address(
-                    IPv4Address.objects.get(address=str(new_address)))
-                service.save()
-
+        return renumber_ix(self, dry_run=True)
 
     def update_ips(self):
         """
@@ -249,37 +263,17 @@ class IX(ChangeLoggingMixin):
         old one (expansion)
 
         """
-        prefix = self.get_ipv4_network()
-        old_prefix = ipaddress.ip_network(self._original_ipv4_prefix)
-        if prefix != old_prefix:
-            # libera validacoes para criacao dos novos ips
-            self.prefix_update = True         
-            #  If it's an expansion, just create new addresses without changing services address
-            if prefix.overlaps(old_prefix) and prefix < old_prefix:
-                self.create_ipv4()
-            else:
-                mlpa_v4_services = self.get_atmv4_services()
-                # monitor_services = Monitorv4.objects.filter(monitor_address__ix=self)  --  modelo nao tuilizado no hercules
-                old_addresses = list(IPv4Address.objects.filter(ix=self))
-                self.create_ipv4(old_addresses)
-                self.map_new_address_ipv4(*mlpa_v4_services)                
-                # retorna validation error se os ips estiverem reservados
-                for old_address in old_addresses:
-                    old_address.delete()
-            
-            ### TODO cria os IPv6s 
-            create_all_ips(self, True)
-
-        prefix = self.get_ipv6_network()
-        old_prefix = ipaddress.ip_network(self._original_ipv6_prefix)
-        if prefix != old_prefix:
-            mlpa_v6_services = self.get_atmv6_services()
-            self.map_new_address_ipv4(*mlpa_v6_services)
-
-        self.prefix_update = False
-
-
-    
+        # libera validacoes para criacao dos novos ips
+        self.prefix_update = True
+        try:
+            remap = renumber_ix(self)
+        finally:
+            self.prefix_update = False
+        # renumeracao em bulk, sem sinais: o indice de prefixos e o resolver
+        # sao limpos aqui, sem depender da ordem dos receivers
+        invalidate_prefix_index()
+        reset_resolver()
+        return remap
 
 
 
@@ -308,16 +302,7 @@ class AS(ChangeLoggingMixin):
     # ------- Validation Functions -------
     def validate_as_number(self,number):
         """AS validator."""
-        # 16-bit range list
-        s_bit_reserved_range = list(range(64496, 64512))
-        s_bit_reserved_range.extend(list(range(64513, 65536)))
-        # 32-bit range list
-        t_bit_reserved_range = list(range(65536, 65551))
-        if number < 1 or \
-                number in s_bit_reserved_range or \
-                number in t_bit_reserved_range or \
-                number >= 4200000000:
-            raise ValidationError(INVALID_ASN)
+        validate_as_number(number)
 
     
     def get_absolute_url(self):
@@ -411,9 +396,26 @@ class ServiceTagDomain(ChangeLoggingMixin):
     
     @property
     def servicetags_count(self):
-        return self.servicetags.count()
-    
+        return self.get_tag_bitmap().count()
+
+    def get_tag_bitmap(self):
+        try:
+            return self.tag_bitmap
+        except ServiceTagBitmap.DoesNotExist:
+            return ServiceTagBitmap.for_domain(self.pk)
+
+    def seed_tags(self, ix=None):
+        """Create the missing tags (0 - 4095) of this domain in bulk."""
+        created = seed_tag_domain(self, ix=ix)
+        # bulk_create nao dispara os receivers que mantem o bitmap
+        bitmap = self.get_tag_bitmap()
+        bitmap.rebuild()
+        bitmap.save()
+        return created
+
     def clean(self):       
+        if is_guaranteed(TAG_DOMAIN_UNIQUE):
+            return
         if self.device and self.interface:
             self.validate_unique_ix_device_interface()
         elif self.device:
@@ -477,7 +479,97 @@ class ServiceTag(ChangeLoggingMixin):
     def customerservice_count(self):
         return self.customerservice.count()
 
-    
+
+class ServiceTagBitmap(models.Model):
+    '''
+        Bitmap de ocupacao das tags (0 - 4095) de um ServiceTagDomain, um
+        bitmap por status. Mantido pelos receivers de ServiceTag.
+    '''
+
+    tag_domain = models.OneToOneField('ServiceTagDomain', models.CASCADE, related_name='tag_bitmap')
+
+    available = models.BinaryField(default=bytes(TAG_BITMAP_BYTES))
+    allocated = models.BinaryField(default=bytes(TAG_BITMAP_BYTES))
+    production = models.BinaryField(default=bytes(TAG_BITMAP_BYTES))
+
+    # campo do bitmap de cada status
+    STATUS_FIELDS = {'AVAILABLE': 'available', 'ALLOCATED': 'allocated', 'PRODUCTION': 'production'}
+
+    class Meta:
+        verbose_name = ('ServiceTagBitmap')
+        verbose_name_plural = ('ServiceTagBitmaps')
+
+    def __str__(self):
+        return "Bitmap %s" % self.tag_domain_id
+
+    def get_bitmap(self, status):
+        return TagBitmap.from_bytes(getattr(self, self.STATUS_FIELDS[status]))
+
+    def set_bitmap(self, status, bitmap):
+        setattr(self, self.STATUS_FIELDS[status], bitmap.to_bytes())
+
+    def rebuild(self):
+        """Reload the bitmaps from the ServiceTag rows of the domain."""
+        tags = {status: [] for status in self.STATUS_FIELDS}
+        for tag, status in ServiceTag.objects.filter(tag_domain_id=self.tag_domain_id).values_list('tag', 'status'):
+            tags[status].append(tag)
+        for status, numbers in tags.items():
+            self.set_bitmap(status, TagBitmap.from_tags(numbers))
+
+    @classmethod
+    def for_domain(cls, tag_domain_id):
+        """Return the bitmap of a domain, building it on first use."""
+        bitmap = cls.objects.filter(tag_domain_id=tag_domain_id).first()
+        if bitmap is None:
+            with transaction.atomic():
+                bitmap, created = cls.objects.select_for_update().get_or_create(tag_domain_id=tag_domain_id)
+                if created:
+                    bitmap.rebuild()
+                    bitmap.save()
+        return bitmap
+
+    @classmethod
+    def update_tag(cls, tag_domain_id, tag, status=None):
+        """Move a tag to the bitmap of status (None removes the tag)."""
+        cls.update_tags(tag_domain_id, (tag,), status)
+
+    @classmethod
+    def update_tags(cls, tag_domain_id, tags, status=None):
+        """Move many tags of a domain to the bitmap of status with one write."""
+        with transaction.atomic():
+            bitmap = cls.objects.select_for_update().filter(tag_domain_id=tag_domain_id).first()
+            # dominio sem bitmap e construido a partir das tags no primeiro uso
+            if bitmap is None:
+                return
+            for name in cls.STATUS_FIELDS:
+                current = bitmap.get_bitmap(name)
+                for tag in tags:
+                    current.discard(tag)
+                    if name == status:
+                        current.add(tag)
+                bitmap.set_bitmap(name, current)
+            bitmap.save()
+
+    def count(self, status=None):
+        if status:
+            return self.get_bitmap(status).count()
+        bitmap = TagBitmap()
+        for name in self.STATUS_FIELDS:
+            bitmap = bitmap | self.get_bitmap(name)
+        return bitmap.count()
+
+    def count_by_status(self):
+        return {status: self.get_bitmap(status).count() for status in self.STATUS_FIELDS}
+
+    def first_free(self, start=MIN_TAG_NUMBER, end=MAX_TAG_NUMBER):
+        return self.get_bitmap('AVAILABLE').first(start, end)
+
+    def first_free_range(self, size, start=MIN_TAG_NUMBER, end=MAX_TAG_NUMBER):
+        return self.get_bitmap('AVAILABLE').first_range(size, start, end)
+
+    def free_tags(self, start=MIN_TAG_NUMBER, end=MAX_TAG_NUMBER):
+        return self.get_bitmap('AVAILABLE').tags(start, end)
+
 
 class CustomerConnectionType(ChangeLoggingMixin):
     '''
@@ -567,28 +659,71 @@ class CustomerConnection(ActiveResourceModel):
     def _name(self):
         return self.__str__()
 
+    def _memoize(self, key, compute):
+        """
+        Keep derived topology values on the instance, so repeated property
+        access costs no extra queries. Cleared by reset_topology().
+
+        """
+        memo = self.__dict__.setdefault('_topology_memo', {})
+        if key not in memo:
+            memo[key] = compute()
+        return memo[key]
+
+    def reset_topology(self):
+        """Drop the memoised topology (endpoints added or removed)."""
+        self.__dict__.pop('_topology_memo', None)
+        self.__dict__.pop('_endpoints_topology', None)
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.reset_topology()
+        super().refresh_from_db(*args, **kwargs)
+
+    def set_endpoints(self, endpoints):
+        """
+        Use endpoints already loaded (e.g. by the batch resolver) instead of
+        querying them again in the topology methods.
+
+        """
+        self.reset_topology()
+        self._endpoints_topology = [
+            (ept, ept.get_topology()) for ept in endpoints
+            if ept.interface_id or ept.rearport_id or ept.frontport_id
+        ]
+
+    def _get_endpoints_topology(self):
+        """
+        Return the (endpoint, topology) pairs of the endpoints connected to a
+        netbox port, ordered by id, read from CustomerConnectionTopology.
+
+        """
+        if getattr(self, '_endpoints_topology', None) is None:
+            endpoints = self.customerconnectionendpoint.filter(
+                Q(interface__isnull=False) | Q(rearport__isnull=False) | Q(frontport__isnull=False)
+            ).select_related(*ENDPOINT_RELATED).order_by('id')
+            self._endpoints_topology = [(ept, ept.get_topology()) for ept in endpoints]
+        return self._endpoints_topology
+
     def _get_device_connected(self):
+        return self._memoize('device_connected', self._resolve_device_connected)
+
+    def _resolve_device_connected(self):
         try:
-            cc_endpoints = self.customerconnectionendpoint.filter(
-                Q(interface__isnull=False) | Q(rearport__isnull=False) | Q(frontport__isnull=False)
-            )          
-            conditions = Q()
-            for ept in cc_endpoints:
+            endpoints = self._get_endpoints_topology()
+            for ept, topology in endpoints:
                 obj = ept.rearport or ept.frontport or ept.interface
                 if isinstance(obj, Interface):
                     return obj, obj.device
-                conditions |= Q(path__contains=obj)
-            if cc_endpoints: 
-                # define objetos conectados ao mesmo site               
-                _obj = self.customerconnectionendpoint.first()
-                _obj = _obj.rearport or ept.frontport or ept.interface
-                # objetos connectados aos dios ou interface
-                _connected =  CablePath.objects.filter(conditions)
-                # origem dos cabos a partir de interfaces
-                _interfaces_ids = _connected.filter(origin_type=5).values_list("origin_id", flat=True)
-                # interfaces no mesmo site dos dios
-                interface_connected = Interface.objects.filter(pk__in=_interfaces_ids, device__site=_obj.device.site).first()
-                return _obj, interface_connected.device if interface_connected else None
+            if endpoints:
+                # define objetos conectados ao mesmo site
+                _obj = endpoints[0][0]
+                _obj = _obj.rearport or _obj.frontport or _obj.interface
+                # dispositivos conectados aos dios no mesmo site
+                device = next((
+                    topology.destination_device for ept, topology in endpoints
+                    if topology.destination_device and topology.destination_device.site_id == _obj.device.site_id
+                ), None)
+                return _obj, device
             else:
                 return (None,None)
         except Exception as e:
@@ -596,6 +731,9 @@ class CustomerConnection(ActiveResourceModel):
 
 
     def _get_device_origin_and_destination(self):
+        return self._memoize('device_origin_and_destination', self._resolve_device_origin_and_destination)
+
+    def _resolve_device_origin_and_destination(self):
         try:
             _connected = self._get_device_connected()
 
@@ -651,14 +789,13 @@ class CustomerConnection(ActiveResourceModel):
 
 
     def _get_interface_connected(self):
+        return self._memoize('interface_connected', self._resolve_interface_connected)
+
+    def _resolve_interface_connected(self):
         try:
             endpoints = []
 
-            cc_endpoints = self.customerconnectionendpoint.filter(
-                Q(interface__isnull=False) | Q(rearport__isnull=False) | Q(frontport__isnull=False)
-            ).order_by('id')
-
-            for ept in cc_endpoints:
+            for ept, topology in self._get_endpoints_topology():
                 obj = ept.rearport or ept.frontport or ept.interface
                 if isinstance(obj, Interface):
                     endpoints.append({
@@ -674,22 +811,23 @@ class CustomerConnection(ActiveResourceModel):
                     })
                     continue
                 else:
-                  _connected =  CablePath.objects.filter(path__contains=obj).first()
+                  _connected = topology.destination_interface
+                  _device = topology.destination_device
                   endpoints.append({
                     "ccendpointId": ept.id,
                     "configured_capacity": ept.configured_capacity,
                     "port_id_origin": obj.id,
                     "port_name_origin": obj.name,
                     "port_type_origin": obj.type,
-                    "port_id_destination": _connected.origin.id if _connected else None,
-                    "port_name_destination": _connected.origin.name if _connected else None,
-                    "port_type_destination": _connected.origin.type if _connected else None,
+                    "port_id_destination": _connected.id if _connected else None,
+                    "port_name_destination": _connected.name if _connected else None,
+                    "port_type_destination": _connected.type if _connected else None,
                     "device_id_origin": obj.device.id,
                     "device_name_origin": obj.device.name,
                     "device_slug_origin": obj.device.device_role.slug,
-                    "device_id_destination": _connected.origin.device.id if _connected else None,
-                    "device_name_destination": _connected.origin.device.name if _connected else None,
-                    "device_slug_destination": _connected.origin.device.device_role.slug if _connected else None,
+                    "device_id_destination": _device.id if _device else None,
+                    "device_name_destination": _device.name if _device else None,
+                    "device_slug_destination": _device.device_role.slug if _device else None,
                     "status": ept.status,
                   })
 
@@ -751,6 +889,9 @@ class CustomerConnection(ActiveResourceModel):
         return device.id if device else None
     
     def connected_device_by_interface(self):
+        return self._memoize('device_by_interface', self._resolve_device_by_interface)
+
+    def _resolve_device_by_interface(self):
         try:
             device_id = self.customerconnectionendpoint.order_by().values_list("interface__device", flat=True).distinct().first()
             return Device.objects.get(pk=device_id) if device_id else None
@@ -790,47 +931,30 @@ class CustomerConnection(ActiveResourceModel):
     #     except Exception:
     #         return
 
-    def _get_tagdomain_by_device(self):
+    def _get_tagdomain_id_by_device(self):
+        """
+        Return the id of the effective ServiceTagDomain of the connection from
+        the precomputed device resolution map (see utils.tagdomains).
 
+        """
         try:
-            device = self.connected_device_by_interface()
-            if device:
-                ix = device.site.region.ix.first()
-                ix_domain = ix.servicetagdomains.filter(domain_type="IX-DOMAIN").first()
-                # verifica se a conexao direta no PE
-                if device.device_role.name == "PE":
-                    pe_ports = self.customerconnectionendpoint.order_by().values_list("interface", flat=True)
-                    tag_domain = ServiceTagDomain.objects.filter(domain_type="PORT-CHANNEL", device=device, interface__pk__in=pe_ports).first()
-                    return tag_domain or ix_domain
-
-                elif device.device_role.name == "Layer2":
-                    l2_uplinks = device.interfaces.filter(custom_field_data__InterfaceRole="Uplink")
-                    if l2_uplinks:
-                        l2_uplinks = l2_uplinks.values_list("_link_peer_id", flat=True)
-                        # filtra portas de uplink do PE no mesmo PIX
-                        pe_uplinks = Interface.objects.filter(
-                            pk__in=l2_uplinks, 
-                            device__site=device.site, 
-                            device__device_role__name="PE"
-                        )
-                        pe = pe_uplinks.order_by().values_list("device", flat=True).distinct().first()
-                        if pe and pe_uplinks:
-                            tag_domain = ServiceTagDomain.objects.filter(domain_type="PORT-CHANNEL", device__pk=pe, interface__pk__in=pe_uplinks).first()
-                            return tag_domain or ix_domain
-                    else:
-                        
-                        device_domain = ServiceTagDomain.objects.filter(domain_type="DEVICE", device=device, interface__isnull=True).first()
-                        if not device_domain:
-                            l2_ports = self.customerconnectionendpoint.order_by().values_list("interface", flat=True)
-                            tag_domain = ServiceTagDomain.objects.filter(domain_type="PORT-CHANNEL", device=device, interface__pk__in=l2_ports).first()
-                            return tag_domain or ix_domain                        
-                        return  device_domain or ix_domain
+            members = list(self.customerconnectionendpoint.filter(
+                interface__isnull=False
+            ).order_by('id').values_list("interface", "interface__device"))
+            if members:
+                device_id = members[0][1]
+                member_ids = [interface_id for interface_id, interface_device in members]
+                return resolve_tag_domain(ServiceTagDomain, IX, device_id, member_ids)
 
         except Exception as e:
             raise ValidationError(f"{str(e)}")
             # a, b, c = trace_print_exception()
             # raise ValidationError(f"{a}\n{b}\n{c}")
 
+    def _get_tagdomain_by_device(self):
+        tag_domain_id = self._get_tagdomain_id_by_device()
+        return ServiceTagDomain.objects.get(pk=tag_domain_id) if tag_domain_id else None
+
 
     def get_absolute_url(self):
         return self._get_absolute_url('customerconnection') 
@@ -932,10 +1056,17 @@ class CustomerConnectionEndpoint(ActiveResourceModel):
             if isinstance(obj, Interface):
                 return self.interface
             elif isinstance(obj, RearPort) or isinstance(obj, FrontPort):
-                return CablePath.objects.filter(path__contains=obj).first().origin.device
+                return self.get_topology().destination_device
         except Exception as e:
             return None
 
+    def get_topology(self):
+        """Return the cached topology, resolved in memory (not saved) when missing."""
+        try:
+            return self.topology
+        except CustomerConnectionTopology.DoesNotExist:
+            return compute_topology(self)
+
     def _get_connected_endpoint(self, instance):
         try:
             if isinstance(instance, Interface):
@@ -949,6 +1080,59 @@ class CustomerConnectionEndpoint(ActiveResourceModel):
         return self._get_absolute_url('customerconnectionendpoint')
 
 
+class CustomerConnectionTopology(models.Model):
+    '''
+        Topologia resolvida (CablePath) de cada CustomerConnectionEndpoint:
+        device de origem, device e porta de destino e PIX
+    '''
+
+    endpoint = models.OneToOneField('CustomerConnectionEndpoint', models.CASCADE, related_name='topology')
+
+    origin_device = models.ForeignKey(
+        to='dcim.Device', on_delete=models.SET_NULL, related_name='+', blank=True, null=True
+    )
+    destination_device = models.ForeignKey(
+        to='dcim.Device', on_delete=models.SET_NULL, related_name='+', blank=True, null=True
+    )
+    destination_interface = models.ForeignKey(
+        to='dcim.Interface', on_delete=models.SET_NULL, related_name='+', blank=True, null=True
+    )
+    site = models.ForeignKey(
+        to='dcim.Site', on_delete=models.SET_NULL, related_name='+', blank=True, null=True
+    )
+
+    last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = ('CustomerConnectionTopology')
+        verbose_name_plural = ('CustomerConnectionTopologies')
+
+    def __str__(self):
+        return "%s -> %s" % (self.origin_device or '', self.destination_device or '')
+
+
+class StatCounter(models.Model):
+    '''
+        Contador de objetos por modelo, total e por dimensao (IX, tipo de
+        servico, status...), lido pela home. Mantido pelos receivers e
+        refeito pelo comando reconcile_counters (ver utils/counters.py)
+    '''
+
+    model = models.CharField(max_length=50)
+    # dimensao vazia e o total do modelo
+    dimension = models.CharField(max_length=50, blank=True, default='')
+    value = models.CharField(max_length=100, blank=True, default='')
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('model', 'dimension', 'value')
+        verbose_name = ('StatCounter')
+        verbose_name_plural = ('StatCounters')
+
+    def __str__(self):
+        return "%s %s=%s: %s" % (self.model, self.dimension, self.value, self.count)
+
+
 
 class ServiceType(ChangeLoggingMixin):
     '''
@@ -1022,6 +1206,18 @@ class MACAddress(ChangeLoggingMixin):
         return self._get_absolute_url('macaddress')
 
 
+class IPAddressQuerySet(RestrictedQuerySet):
+
+    def with_allocation(self):
+        """
+        Annotate `allocated` (True if a CustomerService uses the address) with
+        an EXISTS subquery, read by get_allocated() instead of one query per row.
+        """
+        relation = self.model._meta.get_field('customerservice')
+        services = relation.related_model.objects.filter(**{relation.field.name: OuterRef('pk')})
+        return self.annotate(allocated=Exists(services))
+
+
 class IPv4Address(ChangeLoggingMixin):
     """Global IPv4 address to be used in IX' services."""
     uuid = None
@@ -1032,18 +1228,28 @@ class IPv4Address(ChangeLoggingMixin):
     reverse_dns = models.CharField(
         max_length=255, blank=True, validators=[validate_url_format]
     )
+    # valor numerico do endereco para ordenacao e consultas por faixa
+    address_int = models.BigIntegerField(null=True, blank=True, editable=False, db_index=True)
 
     # netbox models
-    objects = RestrictedQuerySet.as_manager()
+    objects = IPAddressQuerySet.as_manager()
 
     class Meta:
-        ordering = ('address',)
+        ordering = ('address_int', 'address',)
         verbose_name = _('IPv4Address')
         verbose_name_plural = _('IPv4Addresses')
 
     def __str__(self):
         return "[%s]" % (self.address)
 
+    def save(self, *args, **kwargs):
+        # endereco invalido vira ValidationError, como em clean_instance()
+        try:
+            self.address_int = ipv4_to_int(self.address)
+        except ValueError as e:
+            raise ValidationError({'address': str(e)})
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return self._get_absolute_url('ipv4address')
 
@@ -1056,7 +1262,10 @@ class IPv4Address(ChangeLoggingMixin):
         return self.get_allocated()
     
     def get_allocated(self):
-        return CustomerService.objects.filter(mlpav4_address=self, mlpav4_address__ix=self.ix).count() > 0
+        # valor anotado por IPAddressQuerySet.with_allocation()
+        if hasattr(self, 'allocated'):
+            return self.allocated
+        return CustomerService.objects.filter(mlpav4_address=self, mlpav4_address__ix=self.ix).exists()
 
     def get_status(self):
         return 'ALLOCATED' if self.get_allocated() else 'FREE'
@@ -1072,18 +1281,30 @@ class IPv6Address(ChangeLoggingMixin):
     reverse_dns = models.CharField(
         max_length=255, blank=True, validators=[validate_url_format]
     )
+    # metades de 64 bits do endereco (ver ips_utils.ipv6_to_pair)
+    address_hi = models.BigIntegerField(null=True, blank=True, editable=False)
+    address_lo = models.BigIntegerField(null=True, blank=True, editable=False)
 
     # netbox models
-    objects = RestrictedQuerySet.as_manager()
+    objects = IPAddressQuerySet.as_manager()
    
     class Meta:
-        ordering = ('address',)
+        ordering = ('address_hi', 'address_lo', 'address',)
+        indexes = [models.Index(fields=['address_hi', 'address_lo'])]
         verbose_name = _('IPv6Address')
         verbose_name_plural = _('IPv6Addresses')
 
     def __str__(self):
         return "[%s]" % (self.address)
 
+    def save(self, *args, **kwargs):
+        # endereco invalido vira ValidationError, como em clean_instance()
+        try:
+            self.address_hi, self.address_lo = ipv6_to_pair(self.address)
+        except ValueError as e:
+            raise ValidationError({'address': str(e)})
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return self._get_absolute_url('ipv6address')
 
@@ -1096,7 +1317,10 @@ class IPv6Address(ChangeLoggingMixin):
         return self.get_allocated()
     
     def get_allocated(self):
-        return CustomerService.objects.filter(mlpav6_address=self, mlpav6_address__ix=self.ix).count() > 0
+        # valor anotado por IPAddressQuerySet.with_allocation()
+        if hasattr(self, 'allocated'):
+            return self.allocated
+        return CustomerService.objects.filter(mlpav6_address=self, mlpav6_address__ix=self.ix).exists()
 
     def get_status(self):
         return 'ALLOCATED' if self.get_allocated() else 'FREE'
@@ -1136,19 +1360,19 @@ class CustomerService(ActiveResourceModel):
 
     def get_address(self):
         try:
-            if self.service.service_type == ServiceType.objects.get(name="ATMv4"):
+            if registry.is_service_type(self.service.service_type_id, ATMV4):
                return self.mlpav4_address
-            if self.service.service_type == ServiceType.objects.get(name="ATMv6"):
+            if registry.is_service_type(self.service.service_type_id, ATMV6):
                return self.mlpav6_address
         except:
             raise ValidationError(_("Not a valid IPAddress for CustomerService"))
 
     def set_address(self, address):
         try:
-            if self.service.service_type == ServiceType.objects.get(name="ATMv4"):
+            if registry.is_service_type(self.service.service_type_id, ATMV4):
                self.mlpav4_address = address
 
-            if self.service.service_type == ServiceType.objects.get(name="ATMv6"):
+            if registry.is_service_type(self.service.service_type_id, ATMV6):
                self.mlpav6_address = address
         except:
             raise ValidationError(_("Not a valid IPAddress for CustomerService"))
@@ -1231,56 +1455,29 @@ class CustomerService(ActiveResourceModel):
 
 
 def create_all_ips(instance, IPv6Only=False):
-    # Get the first subnetwork /24 in the ipv4_prefix field
-    first_sub_network_v4 = list(ipaddress.ip_network(instance.ipv4_prefix).subnets(new_prefix=24))[0]
-    ip_v6 = None
-
-    for ip in ipaddress.ip_network(instance.ipv4_prefix).hosts():
-        # For each IPv4 in ipv4_prefix create the respective IP.
-        ### TODO adicionada a flag para apenas IPv6
-        if not IPv6Only:
-            IPv4Address.objects.create(ix=instance, address=str(ip))
-
-        # For each IPv4 create a respective IPv6 with the same final visual
-        # number. (IPv4 v.w.y.x IPv6 final ::0.x)
-        ip_v6 = ipaddress.ip_network(instance.ipv6_prefix)[0] + int(str(ip).split('.')[-1], 16)
-        # If IPv4 is in the first block /24 create IPv6
-        # with final ::y.x IPv4 v.w.y.x
-        if ip not in first_sub_network_v4:
-            ip_v6 += 65536*int(str(ip).split('.')[-2], 16)
-        
-        ### TODO adicionada a flag para apenas IPv6
-        if not IPv6Only:
-            IPv6Address.objects.create(ix=instance, address=str(ip_v6))
-        else:
-            try:
-                IPv6Address.objects.create(ix=instance, address=str(ip_v6))
-            except ValidationError:
-                continue
-                # IPv6Address.objects.filter(pk=str(ip_v6)).update(
-                #    address=str(ip_v6))
-
-
-def create_all_tags_by_ix(instance, limit):
-     # validate ServicetagDomain for IX
-    try:
-        ix_domain = ServiceTagDomain.objects.create(
-            domain_type = 'IX-DOMAIN',
-            ix = instance
-        )
+    # For each IPv4 in ipv4_prefix create the respective IP and an IPv6 with
+    # the same final visual number (IPv4 v.w.y.x IPv6 final ::x in the first
+    # /24 block, ::y:x in the others). Rows are computed as integers and
+    # written with bulk inserts; with IPv6Only existing IPv6s are kept.
+    return seed_ix_addresses(instance, ipv6_only=IPv6Only)
+
+
+def create_all_tags_by_ix(instance):
+    # the IX-DOMAIN and its tags (0 - 4095, 0 and 1 ALLOCATED) are created
+    # in a single transaction, an existing domain is completed
+    with transaction.atomic():
+        ix_domain = ServiceTagDomain.objects.filter(
+            domain_type='IX-DOMAIN', ix=instance, device__isnull=True, interface__isnull=True
+        ).first()
+        if not ix_domain:
+            # a busca acima garante que o dominio ainda nao existe
+            with validation_policy(skip=(UNIQUE, TAG_DOMAIN_UNIQUE)):
+                ix_domain = ServiceTagDomain.objects.create(
+                    domain_type='IX-DOMAIN',
+                    ix=instance
+                )
+        return ix_domain.seed_tags(ix=instance)
 
-        for n_tag in range(0, limit):
-            if n_tag == 0 or n_tag == 1:
-                status = 'ALLOCATED'
-            else:
-                status = ServiceTag._meta.get_field('status').get_default()       
-
-            ServiceTag.objects.create(tag=n_tag, ix=instance, status=status, tag_domain=ix_domain)
-
-    except Exception as e:
-        print(e)
-        pass
-    
 
 
 # This post_save for the IX model, call a method for
@@ -1295,20 +1492,31 @@ def create_ips(sender, instance, **kwargs):
 # This post_save for the IX model, call a method for
 # update ips following some rules.
 @receiver(post_save, sender=IX)
+@on_change('ipv4_prefix', 'ipv6_prefix')
 def update_ips(sender, instance, update_fields, **kwargs):
     if not kwargs['created'] and not kwargs['raw']:
         if instance and instance.create_ips:
             instance.update_ips()
 
 
+# This post_save/post_delete for the IX model, drop the cached
+# index of prefixes used by the overlap validation.
+@receiver(post_save, sender=IX)
+@receiver(post_delete, sender=IX)
+@on_change('code', 'ipv4_prefix', 'ipv6_prefix', 'management_prefix')
+def reset_prefix_index(sender, instance, **kwargs):
+    invalidate_prefix_index()
+    # troca de prefixo renumera os enderecos em bulk, sem sinais
+    reset_resolver()
+
+
 # This post_save for the IX model, call a method for
 # create all tags possible (0 - 4095).
 @receiver(post_save, sender=IX)
 def create_tags_ix(sender, instance, **kwargs):
     if kwargs['created'] and not kwargs['raw']:
         if instance.create_tags and instance.tags_policy == 'ix_managed':
-            create_all_tags_by_ix(instance,
-                                  MAX_TAG_NUMBER-MIN_TAG_NUMBER+1)
+            create_all_tags_by_ix(instance)
 
 
 
@@ -1321,6 +1529,35 @@ def mark_connected(sender, instance, **kwargs):
             obj_connected.mark_connected = True
             obj_connected.save()
 
+## receivers to keep the endpoint topology cache up to date
+@receiver(post_save, sender=CustomerConnectionEndpoint)
+@on_change(*ENDPOINT_PORTS)
+def rebuild_endpoint_topology(sender, instance, **kwargs):
+    if not kwargs['raw']:
+        rebuild_topology(instance)
+
+
+@receiver(post_save, sender=CablePath)
+@receiver(post_delete, sender=CablePath)
+def rebuild_cablepath_topology(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        rebuild_topology_for_nodes(CustomerConnectionEndpoint, cablepath_nodes(instance))
+
+
+@receiver(post_save, sender=Cable)
+@receiver(post_delete, sender=Cable)
+def rebuild_cable_topology(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        rebuild_topology_for_nodes(CustomerConnectionEndpoint, cable_nodes(instance))
+
+@receiver(post_save, sender=CustomerConnectionEndpoint)
+@receiver(post_delete, sender=CustomerConnectionEndpoint)
+@on_change('customer_connection', *ENDPOINT_PORTS)
+def reset_connection_topology(sender, instance, **kwargs):
+    # somente a instancia da conexao carregada pelo endpoint e conhecida aqui
+    if sender._meta.get_field('customer_connection').is_cached(instance) and instance.customer_connection:
+        instance.customer_connection.reset_topology()
+
 ## reveicers to mark interface, rearport or frontport discconnected
 @receiver(post_delete, sender=CustomerConnectionEndpoint)
 def mark_disconnected(sender, instance, **kwargs):
@@ -1336,6 +1573,7 @@ def mark_disconnected(sender, instance, **kwargs):
 ## receivers to validate tag (free tag or tag associated with service), 
 # tag_domain (associated with ix, device or portchannel)
 @receiver(pre_save, sender=CustomerService)
+@on_change('service', 'asn', 'tag_or_outer', 'inner_tag')
 def get_or_create_tag_by_domain_pre(sender, instance, **kwargs):
 
     if instance.tag_or_outer:
@@ -1346,7 +1584,7 @@ def get_or_create_tag_by_domain_pre(sender, instance, **kwargs):
             raise ValidationError("*** IX for Service and ServiceTagDomain dont match ***")
         
         #TODO: validar innertags v4,v6 e bilateral
-        if instance.service and instance.service.service_type.name.lower() == "bilateral":
+        if instance.service and registry.is_service_type(instance.service.service_type_id, BILATERAL):
             # valida criacao do service do tipo bilateral
             customer_services = tag_or_outer.customerservice.filter(service__service_type=instance.service.service_type)
             if customer_services.count() == 2:
@@ -1380,8 +1618,9 @@ def get_or_create_tag_by_domain_pre(sender, instance, **kwargs):
 
 # ## receivers to validate change tag status after tag is associated wiht service
 @receiver(post_save, sender=CustomerService)
+@on_change('tag_or_outer')
 def get_or_create_tag_by_domain_post(sender, instance, **kwargs):
-    if kwargs['created'] and instance.service.service_type.name.lower() == "bilateral":
+    if kwargs['created'] and registry.is_service_type(instance.service.service_type_id, BILATERAL):
         IXService.objects.get_or_create(
             name = f'Bilateral-{instance.tag_or_outer.tag_domain.ix.code}',
             service_type = instance.service.service_type,
@@ -1391,7 +1630,9 @@ def get_or_create_tag_by_domain_post(sender, instance, **kwargs):
     if instance.tag_or_outer and instance.tag_or_outer.status == "AVAILABLE":
         tag_or_outer = instance.tag_or_outer
         tag_or_outer.status = "PRODUCTION"
-        tag_or_outer.save()
+        # somente o status muda, os demais campos ja foram validados
+        with validation_policy(dirty_only=True):
+            tag_or_outer.save()
 
 
 
@@ -1402,15 +1643,143 @@ def change_tag_status_post_delete(sender, instance, **kwargs):
         tag_or_outer = instance.tag_or_outer
         if tag_or_outer.customerservice.all().count() == 0:
             tag_or_outer.status = "AVAILABLE"
-            tag_or_outer.save()
+            with validation_policy(dirty_only=True):
+                tag_or_outer.save()
+
+
+
+
+## receivers to keep the address resolver in sync
+@receiver(post_save, sender=CustomerService)
+@on_change('asn', 'mlpav4_address', 'mlpav6_address')
+def refresh_resolver_service(sender, instance, **kwargs):
+    if not kwargs['raw']:
+        refresh_service(instance)
+
+
+@receiver(post_delete, sender=CustomerService)
+def forget_resolver_service(sender, instance, **kwargs):
+    forget_service(instance.pk)
 
 
+@receiver(post_save, sender=IPv4Address)
+@receiver(post_save, sender=IPv6Address)
+def reset_resolver_address(sender, instance, **kwargs):
+    if not kwargs['created'] and not kwargs['raw']:
+        reset_resolver()
+
+
+## receivers to keep the tag bitmap of the domain in sync
+@receiver(post_save, sender=ServiceTag)
+@on_change('tag', 'tag_domain', 'status')
+def sync_tag_bitmap(sender, instance, **kwargs):
+    if kwargs['raw']:
+        return
+    # numero ou dominio alterado: libera a posicao antiga no dominio anterior
+    if not kwargs['created'] and instance.has_changed('tag', 'tag_domain'):
+        old_domain = instance.get_loaded_value('tag_domain')
+        if old_domain:
+            ServiceTagBitmap.update_tag(old_domain, instance.get_loaded_value('tag'), None)
+    if instance.tag_domain_id:
+        ServiceTagBitmap.update_tag(instance.tag_domain_id, instance.tag, instance.status)
+
+
+@receiver(post_delete, sender=ServiceTag)
+def clear_tag_bitmap(sender, instance, **kwargs):
+    if instance.tag_domain_id:
+        ServiceTagBitmap.update_tag(instance.tag_domain_id, instance.tag)
 
 
 @receiver(pre_save, sender=CustomerConnection)
+@on_change('tag_domain', 'connection_type', 'is_lag', force=lambda instance: instance.tag_domain_id is None)
 def get_or_create_tag_domain_pre(sender, instance, **kwargs):
     if instance.pk:
-        instance.tag_domain = instance._get_tagdomain_by_device()
+        instance.tag_domain_id = instance._get_tagdomain_id_by_device()
+
+
+## receivers to keep the tag domain of the connection in sync with its ports
+@receiver(post_save, sender=CustomerConnectionEndpoint)
+@receiver(post_delete, sender=CustomerConnectionEndpoint)
+@on_change('customer_connection', 'interface')
+def refresh_connection_tag_domain(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    # conexao atual e anterior do endpoint
+    connection_ids = set([instance.customer_connection_id, instance.get_loaded_value('customer_connection')])
+    for connection in CustomerConnection.objects.filter(pk__in=[pk for pk in connection_ids if pk]):
+        try:
+            tag_domain_id = connection._get_tagdomain_id_by_device()
+        except ValidationError:
+            # device sem IX na regiao, o dominio atual e mantido
+            continue
+        if tag_domain_id != connection.tag_domain_id:
+            CustomerConnection.objects.filter(pk=connection.pk).update(tag_domain_id=tag_domain_id)
+
+
+## receivers to drop the cached tag summaries (TagDomainViewSet.getTags)
+@receiver(post_save, sender=ServiceTag)
+@receiver(post_delete, sender=ServiceTag)
+@on_change('tag', 'tag_domain', 'status')
+def reset_tag_summary(sender, instance, **kwargs):
+    invalidate_domain_tags(instance.tag_domain_id, instance.get_loaded_value('tag_domain'))
+
+
+@receiver(post_save, sender=CustomerService)
+@receiver(post_delete, sender=CustomerService)
+@on_change('service', 'asn', 'tag_or_outer', 'inner_tag')
+def reset_service_tag_summary(sender, instance, **kwargs):
+    # dominio da tag atual e da anterior do servico
+    tag_ids = set([instance.tag_or_outer_id, instance.get_loaded_value('tag_or_outer')])
+    invalidate_domain_tags(*ServiceTag.objects.filter(
+        pk__in=[pk for pk in tag_ids if pk]).values_list('tag_domain_id', flat=True))
+
+
+@receiver(post_save, sender=ServiceType)
+@receiver(post_delete, sender=ServiceType)
+@receiver(post_save, sender=IXService)
+@receiver(post_delete, sender=IXService)
+@receiver(post_save, sender=AS)
+@receiver(post_delete, sender=AS)
+@on_change('name', 'service_type', 'number')
+def reset_all_tag_summaries(sender, instance, **kwargs):
+    invalidate_all_domain_tags()
+
+
+## receivers to keep the home page counters (StatCounter) up to date
+def count_saved(sender, instance, **kwargs):
+    if not kwargs['raw']:
+        apply_deltas(instance_deltas([instance]) if kwargs['created'] else changed_deltas(instance))
+
+
+def count_deleted(sender, instance, **kwargs):
+    apply_deltas(instance_deltas([instance], -1))
+
+
+for counted_model in (IX, AS, IPv4Address, IPv6Address, MACAddress, ServiceTagDomain, ServiceTag, ServiceType,
+                      IXService, CustomerService, CustomerConnectionType, CustomerConnection, CustomerConnectionEndpoint):
+    post_save.connect(count_saved, sender=counted_model)
+    post_delete.connect(count_deleted, sender=counted_model)
+
+
+## receivers to drop the reference tables kept by the registry
+@receiver(post_save, sender=ServiceType)
+@receiver(post_delete, sender=ServiceType)
+@receiver(post_save, sender=CustomerConnectionType)
+@receiver(post_delete, sender=CustomerConnectionType)
+@receiver(post_save, sender=IX)
+@receiver(post_delete, sender=IX)
+def reset_registry(sender, instance, **kwargs):
+    registry.invalidate(sender._meta.model_name)
+
+
+## receivers to refresh the device -> tag domain resolution map
+@receiver(post_save, sender=ServiceTagDomain)
+@receiver(post_delete, sender=ServiceTagDomain)
+@receiver(post_save, sender=Device)
+@receiver(post_save, sender=Interface)
+@receiver(post_delete, sender=Interface)
+def reset_tag_domain_resolution(sender, instance, **kwargs):
+    reset_tag_domain_map()
 
 @receiver(post_save, sender=CustomerConnection)
 def get_or_create_tag_domain_post(sender, instance, **kwargs):
@@ -0,0 +1,129 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ixservices.api.views import CustomerServiceViewSet, TagViewSet
+from ixservices.ixservices.models import (AS, IX, CustomerConnection, CustomerConnectionType, CustomerService,
+                                          IXService, ServiceTag, ServiceTagDomain, ServiceType)
+from ixservices.ixservices.utils.ips_utils import seed_ix_addresses
+from ixservices.ixservices.utils.registry import ATMV4, ATMV6, BILATERAL, registry
+from ixservices.ixservices.utils.resolver import reset_resolver
+from ixservices.ixservices.utils.tagdomains import reset_tag_domain_map
+
+
+# consultas de cada endpoint de resumo, independente do numero de linhas
+TAGS_FROM_IX_QUERIES = 2               # contadores por status + lista de tags
+SERVICES_FROM_IX_QUERIES = 3           # ASNs, servicos por tipo, interfaces livres
+ASNS_FROM_CIX_QUERIES = 3              # filtro connection, lista de ASNs, servicos por tipo
+COUNT_SERVICES_FROM_PIX_QUERIES = 2    # CIXes do PIX, servicos por tipo
+
+# numero de servicos da segunda medicao
+MANY = 10
+
+IX_CODE = 'bnch'
+
+
+class SummaryQueriesTestCase(TestCase):
+    """
+    Query budget of the summary endpoints (getTagsFromIX, getServicesFromIX,
+    ...): the same number of queries with one and with many services.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # superusuario: restrict() nao consulta as permissoes
+        cls.user = get_user_model().objects.create_superuser('ixservices', 'ixservices@example.com', 'ixservices')
+        cls.ix = IX.objects.create(
+            code=IX_CODE, shortname='benchmark.br', fullname='Benchmark - BR',
+            ipv4_prefix='198.18.0.0/24', ipv6_prefix='2001:db8:ffff::/64',
+            management_prefix='10.255.255.0/24', create_ips=False, create_tags=False
+        )
+        seed_ix_addresses(cls.ix)
+        cls.tag_domain = ServiceTagDomain.objects.create(domain_type='IX-DOMAIN', ix=cls.ix)
+        cls.ixservices = [
+            IXService.objects.create(
+                service_type=ServiceType.objects.create(name=name), name='{}-{}'.format(IX_CODE, name), ix=cls.ix
+            )
+            for name in (ATMV4, ATMV6, BILATERAL)
+        ]
+        # os endpoints de CIX excluem o tipo de pk 1, o CIX de teste usa o segundo
+        CustomerConnectionType.objects.create(connection_name='Direct', connection_type=1)
+        connection_type = CustomerConnectionType.objects.create(connection_name='CIX', connection_type=2)
+        asn = AS.objects.create(number=64512)
+        cls.connection = CustomerConnection.objects.create(name='cix-1', asn=asn, connection_type=connection_type)
+
+    def setUp(self):
+        # caches do processo e do django sobrevivem entre os testes
+        registry.invalidate()
+        reset_resolver()
+        reset_tag_domain_map()
+        cache.clear()
+
+    def add_services(self, count):
+        """Create count services (one AS, tag and address each) on the test connection."""
+        start = CustomerService.objects.count()
+        ipv4 = list(self.ix.ipv4address.order_by('address_int')[start:start + count])
+        ipv6 = list(self.ix.ipv6address.order_by('address_hi', 'address_lo')[start:start + count])
+        tags = ServiceTag.objects.bulk_create([
+            ServiceTag(tag=100 + start + n, ix=self.ix, tag_domain=self.tag_domain, status='PRODUCTION')
+            for n in range(count)
+        ])
+        ServiceTag.objects.bulk_create([
+            ServiceTag(tag=2000 + start + n, ix=self.ix, tag_domain=self.tag_domain) for n in range(count)
+        ])
+        asns = AS.objects.bulk_create([AS(number=262000 + start + n) for n in range(count)])
+        services = []
+        for n in range(count):
+            service = self.ixservices[(start + n) % len(self.ixservices)]
+            services.append(CustomerService(
+                service=service, asn=asns[n], connection=self.connection, tag_or_outer=tags[n],
+                mlpav4_address=ipv4[n] if service.service_type.name == ATMV4 else None,
+                mlpav6_address=ipv6[n] if service.service_type.name == ATMV6 else None,
+            ))
+        CustomerService.objects.bulk_create(services)
+
+    def get(self, viewset, action, params, queries):
+        request = APIRequestFactory().get('/', params)
+        force_authenticate(request, user=self.user)
+        view = viewset.as_view({'get': action})
+        with self.assertNumQueries(queries):
+            response = view(request)
+            # as listas sao querysets avaliados na renderizacao
+            response.render()
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertFlatQueries(self, viewset, action, params, queries):
+        """Same budget with one service and with MANY services."""
+        self.add_services(1)
+        self.get(viewset, action, params, queries)
+        self.add_services(MANY - 1)
+        return self.get(viewset, action, params, queries)
+
+    def test_tags_from_ix(self):
+        response = self.assertFlatQueries(TagViewSet, 'getTagsFromIX', {'ix__code': IX_CODE}, TAGS_FROM_IX_QUERIES)
+        self.assertEqual(response.data['count']['PRODUCTION'], MANY)
+        self.assertEqual(response.data['count']['AVAILABLE'], MANY)
+
+    def test_services_from_ix(self):
+        response = self.assertFlatQueries(
+            CustomerServiceViewSet, 'getServicesFromIX', {'service__ix__code': IX_CODE}, SERVICES_FROM_IX_QUERIES
+        )
+        self.assertEqual(
+            response.data['totServicesATMv4'] + response.data['totServicesATMv6'] + response.data['totServicesBilateral'],
+            MANY
+        )
+
+    def test_asns_from_cix(self):
+        response = self.assertFlatQueries(
+            CustomerServiceViewSet, 'getASNsFromCIX',
+            {'service__ix__code': IX_CODE, 'connection': self.connection.pk}, ASNS_FROM_CIX_QUERIES
+        )
+        self.assertEqual(len(response.data['asns']), MANY)
+
+    def test_count_services_and_cix_from_pix(self):
+        self.assertFlatQueries(
+            CustomerServiceViewSet, 'getCountServicesAndCixFromPIX',
+            {'service__ix__code': IX_CODE, 'pix__id': 1}, COUNT_SERVICES_FROM_PIX_QUERIES
+        )
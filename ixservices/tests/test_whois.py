@@ -0,0 +1,114 @@
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
+
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, override_settings
+
+from ixservices.ixservices.utils.whoisutils import (WHOIS_SUMMARY_FIELDS, lookup_whois, lookup_whois_many,
+                                                    reset_whois, submit_whois)
+
+
+FAST_ASN = 262100
+SLOW_ASN = 262101
+UNKNOWN_ASN = 262102
+
+# whois de teste: registra cada chamada no log (primeiro argumento) e responde
+# conforme o ASN (segundo argumento)
+STUB = textwrap.dedent('''
+    import sys
+    import time
+
+    log, asn = sys.argv[1], sys.argv[2]
+    with open(log, 'a') as calls:
+        calls.write(asn + '\\n')
+    if asn == 'AS{slow}':
+        time.sleep(5)
+    if asn == 'AS{unknown}':
+        print('Unknown AS number or IP network')
+        sys.exit(1)
+    time.sleep(0.5)
+    print('% stub whois server')
+    print('')
+    print('aut-num:        ' + asn)
+    print('owner:          Stub S.A.')
+    print('e-mail:         noc@stub.example')
+''').format(slow=SLOW_ASN, unknown=UNKNOWN_ASN)
+
+
+class WhoisTestCase(SimpleTestCase):
+    """lookup_whois()/lookup_whois_many() against a local stub of the whois command."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        script = os.path.join(self.directory, 'whois_stub.py')
+        with open(script, 'w') as stub:
+            stub.write(STUB)
+        self.log = os.path.join(self.directory, 'calls.log')
+        self.config = {
+            'whois_command': '{} {} {}'.format(sys.executable, script, self.log),
+            'whois_timeout': 2,
+            'whois_workers': 4,
+            'whois_cache_ttl': 3600,
+            'whois_cache_size': 16,
+        }
+        reset_whois()
+        self.addCleanup(reset_whois)
+
+    def whois_config(self, **config):
+        return override_settings(PLUGINS_CONFIG={'ixservices': dict(self.config, **config)})
+
+    def calls(self):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as calls:
+            return calls.read().split()
+
+    def test_lookup_whois(self):
+        with self.whois_config():
+            whois = lookup_whois(FAST_ASN, WHOIS_SUMMARY_FIELDS)
+        self.assertEqual(whois, [
+            ('aut-num', 'AS{}'.format(FAST_ASN)), ('owner', 'Stub S.A.'), ('e-mail', 'noc@stub.example'),
+        ])
+
+    def test_unknown_asn(self):
+        with self.whois_config(), self.assertRaises(ValidationError):
+            lookup_whois(UNKNOWN_ASN)
+
+    def test_timeout(self):
+        with self.whois_config(whois_timeout=1), self.assertRaises(ValidationError) as raised:
+            lookup_whois(SLOW_ASN)
+        self.assertEqual(raised.exception.code, 'timeout')
+
+    def test_lookup_whois_many(self):
+        with self.whois_config():
+            result = lookup_whois_many([FAST_ASN, SLOW_ASN, UNKNOWN_ASN, FAST_ASN], WHOIS_SUMMARY_FIELDS)
+        self.assertEqual(set(result), {FAST_ASN, SLOW_ASN, UNKNOWN_ASN})
+        self.assertIn('whois', result[FAST_ASN])
+        self.assertIn('error', result[SLOW_ASN])
+        self.assertIn('error', result[UNKNOWN_ASN])
+        # ASN repetido consultado uma vez
+        self.assertEqual(self.calls().count('AS{}'.format(FAST_ASN)), 1)
+
+    def test_inflight_dedupe(self):
+        with self.whois_config():
+            first = submit_whois(FAST_ASN)
+            second = submit_whois(FAST_ASN)
+            self.assertIs(first, second)
+            first.result(timeout=2)
+        self.assertEqual(self.calls(), ['AS{}'.format(FAST_ASN)])
+
+    def test_cache(self):
+        with self.whois_config():
+            lookup_whois(FAST_ASN)
+            lookup_whois(FAST_ASN, WHOIS_SUMMARY_FIELDS)
+        self.assertEqual(len(self.calls()), 1)
+
+    def test_cache_ttl(self):
+        with self.whois_config(whois_cache_ttl=0):
+            lookup_whois(FAST_ASN)
+            lookup_whois(FAST_ASN)
+        self.assertEqual(len(self.calls()), 2)
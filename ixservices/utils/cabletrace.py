@@ -0,0 +1,108 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+
+from dcim.models import Interface, RearPort
+from dcim.utils import decompile_path_node
+
+from .topology import ENDPOINT_PORT_FIELDS
+
+
+# relacionamentos carregados junto com cada porta do trace
+PORT_RELATED = (
+    'device__device_role',
+    'customerconnectionendpoint__customer_connection__asn',
+)
+
+
+class DeviceTrace:
+    """
+    Cable trace of many NetBox interfaces (e.g. every port of a device) with
+    a fixed number of queries.
+
+    The interfaces are loaded with their CablePath, then every interface,
+    front port and rear port found in the paths is loaded once per model
+    with its device, role and CustomerConnectionEndpoint, and the services
+    of the connections found with one more query. trace() returns the same
+    three-tuples as Interface.trace(); nodes that are not ports (cables,
+    padding) are None.
+    """
+
+    def __init__(self, interfaces):
+        self.interfaces = list(interfaces.select_related('_path', *PORT_RELATED))
+        self._nodes = {}
+        self._paths = {}
+        self._services = None
+        self._load()
+
+    def _load(self):
+        models = dict(
+            (ContentType.objects.get_for_model(model).pk, model) for model, field in ENDPOINT_PORT_FIELDS
+        )
+        interface_type = ContentType.objects.get_for_model(Interface).pk
+
+        wanted = {}
+        for interface in self.interfaces:
+            self._nodes[(interface_type, interface.pk)] = interface
+            cablepath = interface._path
+            if cablepath is None:
+                continue
+            nodes = [decompile_path_node(node) for node in cablepath.path]
+            if cablepath.destination_id:
+                nodes.append((cablepath.destination_type_id, cablepath.destination_id))
+            self._paths[interface.pk] = nodes
+            for ct_id, object_id in nodes:
+                if ct_id in models:
+                    wanted.setdefault(ct_id, set()).add(object_id)
+
+        # portas do caminho que ainda nao foram carregadas, uma consulta por modelo
+        for ct_id, object_ids in wanted.items():
+            missing = [pk for pk in object_ids if (ct_id, pk) not in self._nodes]
+            if missing:
+                for obj in models[ct_id].objects.filter(pk__in=missing).select_related(*PORT_RELATED):
+                    self._nodes[(ct_id, obj.pk)] = obj
+
+    def trace(self, interface):
+        """Three-tuples (A termination, cable, B termination) of the interface path."""
+        if interface.pk not in self._paths:
+            return []
+        path = [interface] + [self._nodes.get(node) for node in self._paths[interface.pk]]
+        # mesmo preenchimento do PathEndpoint.trace() para caminhos terminados em rearport
+        while len(path) % 3:
+            path.insert(-1, None)
+        return list(zip(*[iter(path)] * 3))
+
+    @staticmethod
+    def endpoint(obj):
+        """CustomerConnectionEndpoint of a port (None for other nodes)."""
+        return getattr(obj, 'customerconnectionendpoint', None) if obj is not None else None
+
+    def has_endpoint(self, interface):
+        """True if the interface or any port in its path is a CustomerConnectionEndpoint."""
+        trace = self.trace(interface)
+        if not trace:
+            return self.endpoint(interface) is not None
+        return any(self.endpoint(obj) is not None for line in trace for obj in line)
+
+    def first_rearport(self, interface):
+        """First RearPort (DIO position) in the interface path."""
+        return next((obj for line in self.trace(interface) for obj in line if isinstance(obj, RearPort)), None)
+
+    def tags(self, connection_id):
+        """Tags of the services of a connection by ASN: {asn: [tag, ...]}."""
+        if self._services is None:
+            self._load_services()
+        return self._services.get(connection_id, {})
+
+    def _load_services(self):
+        self._services = {}
+        connection_ids = set(
+            endpoint.customer_connection_id for endpoint in map(self.endpoint, self._nodes.values())
+            if endpoint is not None and endpoint.customer_connection_id
+        )
+        if not connection_ids:
+            return
+        service_model = apps.get_model('ixservices', 'CustomerService')
+        for connection_id, asn, tag in service_model.objects.filter(
+                connection__in=connection_ids, tag_or_outer__isnull=False
+        ).values_list('connection_id', 'asn__number', 'tag_or_outer__tag'):
+            self._services.setdefault(connection_id, {}).setdefault(asn, []).append(tag)
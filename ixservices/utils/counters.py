@@ -0,0 +1,174 @@
+from collections import Counter
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count, F
+
+from utilities.permissions import get_permission_for_model, permission_is_exempt
+
+
+# modelo -> {dimensao: caminho do valor a partir do modelo}; todo modelo
+# tambem tem o total (dimensao vazia)
+COUNTED_MODELS = {
+    'ix': {},
+    'as': {},
+    'ipv4address': {'ix': 'ix'},
+    'ipv6address': {'ix': 'ix'},
+    'macaddress': {},
+    'servicetagdomain': {'ix': 'ix', 'domain_type': 'domain_type'},
+    'servicetag': {'ix': 'ix', 'status': 'status'},
+    'servicetype': {},
+    'ixservice': {'ix': 'ix', 'service_type': 'service_type'},
+    'customerservice': {'ix': 'service__ix', 'service_type': 'service__service_type'},
+    'customerconnectiontype': {},
+    'customerconnection': {'connection_type': 'connection_type', 'is_lag': 'is_lag', 'status': 'status'},
+    'customerconnectionendpoint': {},
+}
+
+TOTAL = ''
+
+
+def _counter_model():
+    return apps.get_model('ixservices', 'StatCounter')
+
+
+def _to_value(value):
+    return '' if value is None else str(value)
+
+
+def _resolve(instance, path, loaded=False):
+    """
+    Value of a dimension path (e.g. service__service_type) for an instance.
+    With loaded, the first hop uses the value loaded from the database (see
+    ChangeLoggingMixin.get_loaded_value).
+    """
+    first, *rest = path.split('__')
+    field = instance._meta.get_field(first)
+    if loaded and hasattr(instance, 'get_loaded_value'):
+        value = instance.get_loaded_value(first)
+    else:
+        value = getattr(instance, field.attname)
+    if not rest or value is None:
+        return value
+    # objeto relacionado ja carregado evita a consulta
+    if not loaded and field.is_cached(instance):
+        return _resolve(getattr(instance, first), '__'.join(rest))
+    return field.related_model._base_manager.filter(pk=value).values_list('__'.join(rest), flat=True).first()
+
+
+def counter_keys(instance, loaded=False):
+    """(model, dimension, value) of every counter an instance adds to."""
+    model_name = instance._meta.model_name
+    keys = [(model_name, TOTAL, TOTAL)]
+    for dimension, path in COUNTED_MODELS[model_name].items():
+        keys.append((model_name, dimension, _to_value(_resolve(instance, path, loaded))))
+    return keys
+
+
+def instance_deltas(instances, delta=1):
+    deltas = Counter()
+    for instance in instances:
+        for key in counter_keys(instance):
+            deltas[key] += delta
+    return deltas
+
+
+def changed_deltas(instance):
+    """Moves between counters of an updated instance (empty if no dimension changed)."""
+    paths = COUNTED_MODELS[instance._meta.model_name]
+    if not paths or not hasattr(instance, 'get_dirty_fields'):
+        return Counter()
+    dirty = instance.get_dirty_fields()
+    if not any(path.split('__')[0] in dirty for path in paths.values()):
+        return Counter()
+    deltas = Counter()
+    for key in counter_keys(instance, loaded=True):
+        deltas[key] -= 1
+    for key in counter_keys(instance):
+        deltas[key] += 1
+    return deltas
+
+
+def apply_deltas(deltas):
+    """
+    Add the deltas ({(model, dimension, value): n}) to the counters with one
+    UPDATE each. Models never reconciled (no total row) are left alone, so
+    partial counts are never read as the real ones.
+    """
+    deltas = dict((key, n) for key, n in deltas.items() if n)
+    if not deltas:
+        return
+    counter_model = _counter_model()
+    with transaction.atomic():
+        tracked = set(counter_model.objects.filter(
+            model__in=set(key[0] for key in deltas), dimension=TOTAL
+        ).values_list('model', flat=True))
+        for (model_name, dimension, value), n in deltas.items():
+            if model_name not in tracked:
+                continue
+            updated = counter_model.objects.filter(model=model_name, dimension=dimension, value=value).update(
+                count=F('count') + n
+            )
+            if not updated and n > 0:
+                counter_model.objects.get_or_create(
+                    model=model_name, dimension=dimension, value=value, defaults={'count': n}
+                )
+
+
+def count_rows(model):
+    """Live counters of a model: {(dimension, value): count}."""
+    counts = {(TOTAL, TOTAL): model._base_manager.count()}
+    for dimension, path in COUNTED_MODELS[model._meta.model_name].items():
+        for value, count in model._base_manager.order_by().values_list(path).annotate(n=Count('pk')):
+            counts[(dimension, _to_value(value))] = count
+    return counts
+
+
+def reconcile_counters(*models):
+    """
+    Rewrite the counters of the models (all counted models by default) from
+    live COUNT queries. Returns {model_name: total}.
+    """
+    counter_model = _counter_model()
+    if not models:
+        models = [apps.get_model('ixservices', name) for name in COUNTED_MODELS]
+    totals = {}
+    for model in models:
+        model_name = model._meta.model_name
+        with transaction.atomic():
+            # bloqueia as linhas do modelo enquanto a contagem e refeita
+            list(counter_model.objects.select_for_update().filter(model=model_name))
+            counts = count_rows(model)
+            counter_model.objects.filter(model=model_name).delete()
+            counter_model.objects.bulk_create([
+                counter_model(model=model_name, dimension=dimension, value=value, count=count)
+                for (dimension, value), count in counts.items()
+            ])
+        totals[model_name] = counts[(TOTAL, TOTAL)]
+    return totals
+
+
+def get_counters():
+    """
+    Every counter with one query: {model: {(dimension, value): count}}.
+    Models never reconciled are missing.
+    """
+    counters = {}
+    for model_name, dimension, value, count in _counter_model().objects.values_list(
+            'model', 'dimension', 'value', 'count'):
+        counters.setdefault(model_name, {})[(dimension, value)] = count
+    return dict((name, counts) for name, counts in counters.items() if (TOTAL, TOTAL) in counts)
+
+
+def has_unrestricted_view(user, model):
+    """
+    True when the view permission of the user covers every object of the
+    model (superuser, exempt permission or a permission without
+    constraints), i.e. restrict() would not filter the queryset. Must be
+    called after user.has_perm() has loaded the object permissions.
+    """
+    permission = get_permission_for_model(model, 'view')
+    if user.is_superuser or permission_is_exempt(permission):
+        return True
+    constraints = getattr(user, '_object_perm_cache', {}).get(permission)
+    return constraints is not None and any(not constraint for constraint in constraints)
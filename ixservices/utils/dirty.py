@@ -0,0 +1,39 @@
+import functools
+
+from django.db.models.signals import post_save, pre_save
+
+
+def on_change(*fields, force=None):
+    """
+    Run a pre_save/post_save receiver only when one of the fields it depends
+    on changed since the instance was loaded or last saved, e.g.
+
+        @receiver(post_save, sender=ServiceTag)
+        @on_change('status', 'tag', 'tag_domain')
+        def sync_tag_bitmap(sender, instance, **kwargs):
+            ...
+
+    Creations, saves with update_fields naming one of the fields, other
+    signals (post_delete) and instances without dirty-field tracking (see
+    ChangeLoggingMixin.get_dirty_fields) always run the receiver, as does
+    any save for which force(instance) is true.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(sender, instance, **kwargs):
+            if kwargs.get('signal') in (pre_save, post_save) and not _should_run(instance, fields, kwargs):
+                if force is None or not force(instance):
+                    return None
+            return func(sender, instance, **kwargs)
+        wrapper.depends_on = fields
+        return wrapper
+    return decorator
+
+
+def _should_run(instance, fields, kwargs):
+    if kwargs.get('created') or instance._state.adding or not hasattr(instance, 'get_dirty_fields'):
+        return True
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None:
+        return bool(set(update_fields).intersection(fields))
+    return bool(instance.get_dirty_fields().intersection(fields))
@@ -0,0 +1,352 @@
+import ipaddress
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils.translation import gettext as _
+
+from .counters import apply_deltas, instance_deltas, reconcile_counters
+from .resolver import reset_resolver
+
+
+# tamanho dos lotes usados nos bulk inserts
+BULK_BATCH_SIZE = 1000
+
+# octeto decimal lido como hexadecimal (ex.: 10 -> 0x10), regra usada pelo
+# Hercules para manter o mesmo final visual entre IPv4 e IPv6
+_OCTET_AS_HEX = tuple(int(str(octet), 16) for octet in range(256))
+
+
+# deslocamento aplicado a cada metade do IPv6 para caber em um int64 com sinal
+# mantendo a ordem numerica
+_INT64_SIGN = 1 << 63
+_INT64_MASK = (1 << 64) - 1
+
+
+def ipv4_to_int(address):
+    """Return the value stored in IPv4Address.address_int."""
+    return int(ipaddress.IPv4Address(address))
+
+
+def ipv6_to_pair(address):
+    """
+    Return the (address_hi, address_lo) int64 pair stored for an IPv6.
+
+    Each 64-bit half has the sign bit flipped, so comparing the pairs as
+    signed integers follows the numeric order of the addresses.
+    """
+    return _split_ipv6(int(ipaddress.IPv6Address(address)))
+
+
+def _split_ipv6(value):
+    return (value >> 64) - _INT64_SIGN, (value & _INT64_MASK) - _INT64_SIGN
+
+
+def address_fields(version, value):
+    """Return the integer column values for an address given as int."""
+    if version == 4:
+        return {'address_int': value}
+    address_hi, address_lo = _split_ipv6(value)
+    return {'address_hi': address_hi, 'address_lo': address_lo}
+
+
+def _range_q(version, first, last):
+    if version == 4:
+        return Q(address_int__gte=first, address_int__lte=last)
+    first_hi, first_lo = _split_ipv6(first)
+    last_hi, last_lo = _split_ipv6(last)
+    return (
+        (Q(address_hi__gt=first_hi) | Q(address_hi=first_hi, address_lo__gte=first_lo)) &
+        (Q(address_hi__lt=last_hi) | Q(address_hi=last_hi, address_lo__lte=last_lo))
+    )
+
+
+def filter_address_range(queryset, version, within=None, start=None, end=None):
+    """
+    Filter IPv4Address/IPv6Address rows by CIDR containment (within) and/or
+    an inclusive start/end range using the integer columns.
+
+    Raises ValueError for addresses or prefixes of the wrong version.
+    """
+    network_class = ipaddress.IPv4Network if version == 4 else ipaddress.IPv6Network
+    address_class = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+    if within:
+        network = network_class(within, False)
+        queryset = queryset.filter(_range_q(version, int(network.network_address), int(network.broadcast_address)))
+    if start or end:
+        first = int(address_class(start)) if start else 0
+        last = int(address_class(end)) if end else (1 << network_class.max_prefixlen) - 1
+        queryset = queryset.filter(_range_q(version, first, last))
+    return queryset
+
+
+def ipv4_host_range(prefix):
+    """Return the first and last host addresses (as int) of an IPv4 prefix."""
+    network = ipaddress.IPv4Network(prefix, False)
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    # /31 e /32 nao possuem enderecos de rede e broadcast
+    if network.prefixlen >= 31:
+        return first, last
+    return first + 1, last - 1
+
+
+def ipv6_base(prefix):
+    """Return the network address (as int) of an IPv6 prefix."""
+    return int(ipaddress.IPv6Network(prefix, False).network_address)
+
+
+def derive_ipv6(ipv4, first_block, base):
+    """
+    Derive the IPv6 (int) paired with an IPv4 (int).
+
+    IPv4 v.w.y.x is mapped to <base>::x when it is in the first /24 block of
+    the IX prefix and to <base>::y:x otherwise, keeping the decimal digits.
+    """
+    ipv6 = base + _OCTET_AS_HEX[ipv4 & 0xFF]
+    if ipv4 >> 8 != first_block:
+        ipv6 += 65536 * _OCTET_AS_HEX[(ipv4 >> 8) & 0xFF]
+    return ipv6
+
+
+def iter_ix_addresses(ipv4_prefix, ipv6_prefix):
+    """Yield (ipv4, ipv6) int pairs for every host of the IX IPv4 prefix."""
+    first, last = ipv4_host_range(ipv4_prefix)
+    base = ipv6_base(ipv6_prefix)
+    # primeiro bloco /24 do prefixo
+    first_block = int(ipaddress.IPv4Network(ipv4_prefix, False).network_address) >> 8
+    for ipv4 in range(first, last + 1):
+        yield ipv4, derive_ipv6(ipv4, first_block, base)
+
+
+def seed_ix_addresses(ix, ipv6_only=False, batch_size=BULK_BATCH_SIZE):
+    """
+    Create every IPv4Address and IPv6Address of an IX with batched bulk
+    inserts inside a single transaction.
+
+    With ipv6_only only the IPv6 addresses are written and the ones that
+    already exist are kept. Returns the number of rows actually inserted.
+    """
+    ipv4_model = ix.ipv4address.model
+    ipv6_model = ix.ipv6address.model
+
+    ipv4_objs, ipv6_objs = [], []
+    for ipv4, ipv6 in iter_ix_addresses(ix.ipv4_prefix, ix.ipv6_prefix):
+        if not ipv6_only:
+            ipv4_objs.append(ipv4_model(ix=ix, address=str(ipaddress.IPv4Address(ipv4)), **address_fields(4, ipv4)))
+        ipv6_objs.append(ipv6_model(ix=ix, address=str(ipaddress.IPv6Address(ipv6)), **address_fields(6, ipv6)))
+
+    with transaction.atomic():
+        ipv4_model.objects.bulk_create(ipv4_objs, batch_size=batch_size)
+        # com ignore_conflicts o numero de linhas criadas e desconhecido, conta antes e depois
+        ipv6_before = ix.ipv6address.count() if ipv6_only else 0
+        ipv6_model.objects.bulk_create(ipv6_objs, batch_size=batch_size, ignore_conflicts=ipv6_only)
+        ipv6_written = ix.ipv6address.count() - ipv6_before if ipv6_only else len(ipv6_objs)
+        # contadores da home
+        apply_deltas(instance_deltas(ipv4_objs))
+        if ipv6_only:
+            reconcile_counters(ipv6_model)
+        else:
+            apply_deltas(instance_deltas(ipv6_objs))
+
+    return len(ipv4_objs) + ipv6_written
+
+
+# ============== Renumeracao de prefixos =========================================
+
+def _ipv4_targets(ipv4_prefix):
+    first, last = ipv4_host_range(ipv4_prefix)
+    return set(range(first, last + 1))
+
+
+def _ipv6_targets(ipv4_prefix, ipv6_prefix):
+    return set(ipv6 for ipv4, ipv6 in iter_ix_addresses(ipv4_prefix, ipv6_prefix))
+
+
+def _pool_plan(rows, services, targets, offset, bounds):
+    """
+    Plan the renumbering of one address pool of an IX.
+
+    rows: {address: (id, reverse_dns)} of the current pool
+    services: {service_id: address} of the services using the pool
+    targets: addresses the pool must contain for the new prefix
+    offset: value added to every current address (0 keeps the addresses)
+    bounds: (first, last) usable addresses of the new prefix, addresses
+            moved outside of it are dropped
+    """
+    first, last = bounds
+
+    remap = {}
+    for address in rows:
+        new = address + offset
+        remap[address] = new if first <= new <= last else None
+
+    final = targets | set(new for new in remap.values() if new is not None)
+    # endereco de origem dos dados (reverse_dns) de cada endereco final
+    source = dict((new, old) for old, new in remap.items() if new is not None)
+
+    return {
+        'remap': remap,
+        'create': sorted(final - set(rows)),
+        'delete': sorted(set(rows) - final),
+        'reverse_dns': dict(
+            (address, rows[source[address]][1] if address in source else '')
+            for address in final
+        ),
+        'services': dict((pk, remap.get(address)) for pk, address in services.items()),
+    }
+
+
+def _pool_state(ix, related_name, service_field):
+    model = getattr(ix, related_name).model
+    service_model = model._meta.get_field('customerservice').related_model
+    rows = dict(
+        (int(ipaddress.ip_address(address)), (pk, reverse_dns))
+        for pk, address, reverse_dns in model.objects.filter(ix=ix).values_list('id', 'address', 'reverse_dns')
+    )
+    services = dict(
+        (pk, int(ipaddress.ip_address(address)))
+        for pk, address in service_model.objects.filter(
+            **{'{}__ix'.format(service_field): ix}
+        ).values_list('id', '{}__address'.format(service_field))
+    )
+    return model, service_model, rows, services
+
+
+def _format_plan(plan, old_prefix, new_prefix, offset, to_str):
+    return {
+        'old_prefix': str(old_prefix),
+        'new_prefix': str(new_prefix),
+        'offset': offset,
+        'remap': [(to_str(old), to_str(new)) for old, new in sorted(plan['remap'].items())
+                  if new is not None and new != old],
+        'create': [to_str(address) for address in plan['create']],
+        'delete': [to_str(address) for address in plan['delete']],
+        'services': [(pk, to_str(new) if new is not None else None)
+                     for pk, new in sorted(plan['services'].items())],
+    }
+
+
+def _apply_pool_plan(ix, version, model, service_model, service_field, rows, services, plan, to_str, batch_size):
+    lost = [pk for pk, new in plan['services'].items() if new is None]
+    if lost:
+        raise ValidationError(_("CustomerServices {} have no address in the new prefix".format(sorted(lost))))
+
+    # novos enderecos
+    model.objects.bulk_create(
+        [model(ix=ix, address=to_str(address), reverse_dns=plan['reverse_dns'][address],
+               **address_fields(version, address))
+         for address in plan['create']],
+        batch_size=batch_size
+    )
+    ids = dict(
+        (int(ipaddress.ip_address(address)), pk)
+        for pk, address in model.objects.filter(ix=ix).values_list('id', 'address')
+    )
+
+    # servicos acompanham o endereco com o mesmo offset; os enderecos sao
+    # liberados antes da troca para nao violar o OneToOne
+    moved = [pk for pk, new in plan['services'].items() if new != services[pk]]
+    if moved:
+        service_model.objects.filter(pk__in=moved).update(**{service_field: None})
+        service_model.objects.bulk_update(
+            [service_model(pk=pk, **{'{}_id'.format(service_field): ids[plan['services'][pk]]}) for pk in moved],
+            ['{}_id'.format(service_field)], batch_size=batch_size
+        )
+
+    # reverse_dns acompanha o endereco renumerado
+    model.objects.bulk_update(
+        [model(pk=ids[address], reverse_dns=reverse_dns)
+         for address, reverse_dns in plan['reverse_dns'].items()
+         if address in rows and rows[address][1] != reverse_dns],
+        ['reverse_dns'], batch_size=batch_size
+    )
+
+    model.objects.filter(pk__in=[rows[address][0] for address in plan['delete']]).delete()
+    # o delete() dispara os receivers, somente os criados sao somados
+    apply_deltas(instance_deltas([model(ix=ix)], len(plan['create'])))
+
+
+def renumber_ix(ix, dry_run=False, batch_size=BULK_BATCH_SIZE):
+    """
+    Renumber the IPv4/IPv6 pools of an IX after a prefix change.
+
+    The new address of every row and service is computed in memory keeping
+    the same offset from the prefix (an expansion keeps the addresses), and
+    applied with bulk insert/update/delete in one atomic step. With dry_run
+    nothing is written and the planned remap is returned.
+    """
+    old_v4 = ipaddress.IPv4Network(ix.get_loaded_value('ipv4_prefix'), False)
+    new_v4 = ipaddress.IPv4Network(ix.ipv4_prefix, False)
+    old_v6 = ipaddress.IPv6Network(ix.get_loaded_value('ipv6_prefix'), False)
+    new_v6 = ipaddress.IPv6Network(ix.ipv6_prefix, False)
+
+    if old_v4 == new_v4 and old_v6 == new_v6:
+        return {}
+
+    # expansao do prefixo mantem os enderecos atuais
+    offset_v4 = 0 if old_v4.subnet_of(new_v4) else int(new_v4.network_address) - int(old_v4.network_address)
+    offset_v6 = 0 if old_v6.subnet_of(new_v6) else int(new_v6.network_address) - int(old_v6.network_address)
+
+    to_v4 = lambda address: str(ipaddress.IPv4Address(address))
+    to_v6 = lambda address: str(ipaddress.IPv6Address(address))
+
+    pools = (
+        ('ipv4', 'ipv4address', 'mlpav4_address', _ipv4_targets(ix.ipv4_prefix), offset_v4,
+         ipv4_host_range(new_v4), old_v4, new_v4, to_v4),
+        ('ipv6', 'ipv6address', 'mlpav6_address', _ipv6_targets(ix.ipv4_prefix, ix.ipv6_prefix), offset_v6,
+         (int(new_v6.network_address), int(new_v6.broadcast_address)), old_v6, new_v6, to_v6),
+    )
+
+    result = {}
+    with transaction.atomic():
+        for version, related_name, service_field, targets, offset, bounds, old_prefix, new_prefix, to_str in pools:
+            model, service_model, rows, services = _pool_state(ix, related_name, service_field)
+            plan = _pool_plan(rows, services, targets, offset, bounds)
+            result[version] = _format_plan(plan, old_prefix, new_prefix, offset, to_str)
+            if not dry_run:
+                _apply_pool_plan(ix, new_prefix.version, model, service_model, service_field, rows, services, plan,
+                                 to_str, batch_size)
+
+    # enderecos alterados em bulk, sem sinais
+    if not dry_run:
+        reset_resolver()
+    return result
+
+
+# ============== Pareamento IPv4/IPv6 ============================================
+
+class DualStackPairIndex:
+    """
+    Index of the free IPv6 addresses of an IX keyed by the IPv6 value
+    derive_ipv6() gives for each IPv4, so the v6 pair of a free IPv4 is a
+    dict lookup instead of a scan of every v4 x v6 combination.
+    """
+
+    def __init__(self, ipv4_prefix, ipv6_prefix, ipv6_rows):
+        """ipv6_rows: iterable of dicts with the 'address' of the free IPv6."""
+        self.base = ipv6_base(ipv6_prefix)
+        self.first_block = int(ipaddress.IPv4Network(ipv4_prefix, False).network_address) >> 8
+        self.ipv6 = dict((int(ipaddress.IPv6Address(row['address'])), row) for row in ipv6_rows)
+
+    def __len__(self):
+        return len(self.ipv6)
+
+    def get(self, ipv4_address):
+        """Return the free IPv6 row paired with an IPv4 address or None."""
+        ipv4 = int(ipaddress.IPv4Address(ipv4_address))
+        return self.ipv6.get(derive_ipv6(ipv4, self.first_block, self.base))
+
+    def pairs(self, ipv4_rows, count=1):
+        """
+        Return up to count (ipv4_row, ipv6_row) pairs, following the order
+        of ipv4_rows, whose IPv4 and derived IPv6 are both free.
+        """
+        found = []
+        for row in ipv4_rows:
+            ipv6 = self.get(row['address'])
+            if ipv6 is not None:
+                found.append((row, ipv6))
+                if len(found) >= count:
+                    break
+        return found
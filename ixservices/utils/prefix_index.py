@@ -0,0 +1,103 @@
+import bisect
+import ipaddress
+
+from django.db.models import Count, Max
+
+
+# tipos de prefixo indexados para cada IX
+PREFIX_KINDS = ('ipv4', 'ipv6', 'management')
+
+
+class PrefixIntervalIndex:
+    """
+    Sorted integer intervals of the IX prefixes, one list per IP version.
+
+    Each interval keeps the running max of the interval ends before it, so
+    the overlap check is a bisect plus a backwards walk that stops as soon
+    as no earlier interval can reach the queried range.
+    """
+
+    def __init__(self, entries):
+        """entries: iterable of (network, ix_pk, ix_code, kind)."""
+        self.intervals = {4: [], 6: []}
+        for network, ix_pk, ix_code, kind in entries:
+            self.intervals[network.version].append(
+                (int(network.network_address), int(network.broadcast_address), ix_pk, ix_code, kind, network)
+            )
+
+        self.starts, self.max_ends = {}, {}
+        for version, intervals in self.intervals.items():
+            intervals.sort()
+            self.starts[version] = [interval[0] for interval in intervals]
+            max_ends, current = [], -1
+            for interval in intervals:
+                current = max(current, interval[1])
+                max_ends.append(current)
+            self.max_ends[version] = max_ends
+
+    def overlaps(self, network, kinds=PREFIX_KINDS, exclude_code=None):
+        """
+        Yield the (network, ix_pk, ix_code, kind) entries overlapping network,
+        from the closest start backwards.
+        """
+        network = ipaddress.ip_network(network, False)
+        first, last = int(network.network_address), int(network.broadcast_address)
+        intervals = self.intervals[network.version]
+        max_ends = self.max_ends[network.version]
+
+        position = bisect.bisect_right(self.starts[network.version], last) - 1
+        # nenhum intervalo anterior alcanca o inicio do prefixo consultado
+        while position >= 0 and max_ends[position] >= first:
+            start, end, ix_pk, ix_code, kind, entry = intervals[position]
+            if end >= first and kind in kinds and ix_code != exclude_code:
+                yield entry, ix_pk, ix_code, kind
+            position -= 1
+
+    def first_overlap(self, network, kinds=PREFIX_KINDS, exclude_code=None):
+        return next(self.overlaps(network, kinds, exclude_code), None)
+
+    def owners(self, value):
+        """Return the (ix_pk, ix_code, kind) whose prefixes contain an address or prefix."""
+        network = ipaddress.ip_network(value, False)
+        first, last = int(network.network_address), int(network.broadcast_address)
+        return [
+            (ix_pk, ix_code, kind)
+            for entry, ix_pk, ix_code, kind in self.overlaps(network)
+            if int(entry.network_address) <= first and last <= int(entry.broadcast_address)
+        ]
+
+
+def _parse_entries(rows):
+    for ix_pk, ix_code, *prefixes in rows:
+        for kind, prefix in zip(PREFIX_KINDS, prefixes):
+            try:
+                network = ipaddress.ip_network(prefix, False)
+            except ValueError:
+                # prefixos invalidos sao barrados pelos validadores do modelo
+                continue
+            yield network, ix_pk, ix_code, kind
+
+
+# indice do processo e a versao da tabela de IX usada para monta-lo
+_index = None
+_index_version = None
+
+
+def get_prefix_index(ix_model):
+    """
+    Return the cached index of every IX prefix, rebuilding it when an IX was
+    created, changed or removed (checked with a single aggregate query).
+    """
+    global _index, _index_version
+    version = tuple(ix_model.objects.aggregate(count=Count('pk'), updated=Max('last_updated')).values())
+    if _index is None or version != _index_version:
+        rows = ix_model.objects.values_list('pk', 'code', 'ipv4_prefix', 'ipv6_prefix', 'management_prefix')
+        _index = PrefixIntervalIndex(_parse_entries(rows))
+        _index_version = version
+    return _index
+
+
+def invalidate_prefix_index():
+    global _index, _index_version
+    _index = None
+    _index_version = None
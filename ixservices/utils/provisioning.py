@@ -0,0 +1,335 @@
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist, FieldError, MultipleObjectsReturned, ObjectDoesNotExist, ValidationError
+from django.utils import timezone
+
+from utilities.utils import dict_to_filter_params
+
+from .counters import apply_deltas, instance_deltas
+from .ips_utils import BULK_BATCH_SIZE
+from .registry import BILATERAL, registry
+from .resolver import refresh_service
+from .status import TagStatusChoices
+from .tagsummary import invalidate_domain_tags
+
+
+class RelatedLookup:
+    """
+    Resolve the references accepted by a WritableNestedSerializer (numeric ID
+    or dict of attributes) for many items at once.
+
+    Numeric IDs are loaded with one query and single attribute dicts (e.g.
+    {"number": 65000}, {"address": "..."}) with one query per attribute.
+    Other dicts fall back to one get() each, as the nested serializer does.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.pks = set()
+        # campo -> valores procurados
+        self.attrs = {}
+        # chave -> filtros de um dict com mais de um atributo
+        self.params = {}
+        # chave -> objeto (ou excecao) carregado em load()
+        self.objects = {}
+
+    def add(self, ref):
+        """Register a reference and return the key to fetch it after load()."""
+        if ref is None or ref == '':
+            return None
+        if isinstance(ref, dict):
+            params = dict_to_filter_params(ref)
+            if len(params) == 1:
+                field, value = next(iter(params.items()))
+                if field in ('id', 'pk'):
+                    return self._add_pk(value, ref)
+                try:
+                    model_field = self.model._meta.get_field(field)
+                    key = ('attr', model_field.attname, model_field.to_python(value))
+                except (FieldDoesNotExist, ValidationError):
+                    model_field = None
+                if model_field is not None and not model_field.many_to_many:
+                    self.attrs.setdefault(key[1], set()).add(key[2])
+                    return key
+            key = ('params', repr(sorted(params.items())))
+            self.params[key] = params
+            return key
+        return self._add_pk(ref, ref)
+
+    def _add_pk(self, value, ref):
+        try:
+            pk = int(value)
+        except (TypeError, ValueError):
+            raise ValidationError(
+                "Related objects must be referenced by numeric ID or by dictionary of attributes. "
+                "Received an unrecognized value: {}".format(ref)
+            )
+        self.pks.add(pk)
+        return ('pk', pk)
+
+    def load(self):
+        if self.pks:
+            for pk, obj in self.model.objects.in_bulk(self.pks).items():
+                self.objects[('pk', pk)] = obj
+        for attname, values in self.attrs.items():
+            for obj in self.model.objects.filter(**{'{}__in'.format(attname): values}):
+                key = ('attr', attname, getattr(obj, attname))
+                self.objects[key] = MultipleObjectsReturned() if key in self.objects else obj
+        for key, params in self.params.items():
+            try:
+                self.objects[key] = self.model.objects.get(**params)
+            except (ObjectDoesNotExist, MultipleObjectsReturned, FieldError) as e:
+                self.objects[key] = e
+
+    def get(self, key):
+        if key is None:
+            return None
+        obj = self.objects.get(key)
+        if obj is None or isinstance(obj, (ObjectDoesNotExist, FieldError)):
+            raise ValidationError("Related {} not found using the provided reference: {}".format(
+                self.model._meta.verbose_name, key[-1]
+            ))
+        if isinstance(obj, MultipleObjectsReturned):
+            raise ValidationError("Multiple {} objects match the provided reference: {}".format(
+                self.model._meta.verbose_name, key[-1]
+            ))
+        return obj
+
+
+class TagState:
+    """
+    In memory view of a ServiceTag and its CustomerServices, updated as the
+    items of a batch are accepted, used to apply the rules of
+    CustomerService._validate_v4_v6_service_and_tag() without queries.
+    """
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.status = tag.status
+        # (asn_id, inner_tag, connection_id) dos servicos na tag
+        self.services = []
+
+    def validate(self, service):
+        if self.status not in ('ALLOCATED', 'PRODUCTION'):
+            return
+        if not service.inner_tag:
+            raise ValidationError("*** ServiceTag status is not AVAILABLE ****")
+        if any(asn_id != service.asn_id for asn_id, inner_tag, connection_id in self.services):
+            raise ValidationError("*** ServiceTag is not ASSOCIATED with CustomerService ****")
+        if any(inner_tag == service.inner_tag for asn_id, inner_tag, connection_id in self.services):
+            raise ValidationError("*** InnerTag is already ASSOCIATED with CustomerService ****")
+
+    def is_unique(self, service):
+        # unique_together (connection, tag_or_outer, inner_tag), ignorado com inner_tag nulo
+        return service.inner_tag is None or (service.inner_tag, service.connection_id) not in (
+            (inner_tag, connection_id) for asn_id, inner_tag, connection_id in self.services
+        )
+
+    def add(self, service):
+        self.services.append((service.asn_id, service.inner_tag, service.connection_id))
+        if self.status == 'AVAILABLE':
+            # post_save de CustomerService coloca a tag em producao
+            self.status = 'PRODUCTION'
+
+
+class ServiceProvisioner:
+    """
+    Batch pipeline for the list payload of createorupdatecustomerservice.
+
+    Connections, tag domains, tags, ASes, services, addresses and MACs of
+    every item are loaded with a handful of queries, the tag and inner tag
+    rules are checked in memory following the item order and the
+    CustomerServices, their MACs and the tag status changes are written with
+    bulk operations. Bilateral items are returned in `deferred` to follow the
+    per-item path, whose receivers rename the IXService of the pair.
+
+    run() must be called inside a transaction: any invalid item raises
+    ValidationError and nothing is kept.
+    """
+
+    def __init__(self, items, batch_size=BULK_BATCH_SIZE):
+        self.items = items
+        self.batch_size = batch_size
+        self.service_model = apps.get_model('ixservices', 'CustomerService')
+        self.tag_model = apps.get_model('ixservices', 'ServiceTag')
+        self.lookups = {
+            'asn': RelatedLookup(apps.get_model('ixservices', 'AS')),
+            'service': RelatedLookup(apps.get_model('ixservices', 'IXService')),
+            'mlpav4_address': RelatedLookup(apps.get_model('ixservices', 'IPv4Address')),
+            'mlpav6_address': RelatedLookup(apps.get_model('ixservices', 'IPv6Address')),
+            'mac_address': RelatedLookup(apps.get_model('ixservices', 'MACAddress')),
+        }
+        # (posicao, item, tag) dos itens bilaterais
+        self.deferred = []
+        # (posicao, CustomerService) criados em bulk
+        self.created = []
+        # tags que passaram de AVAILABLE para PRODUCTION
+        self.promoted = []
+
+    def run(self):
+        rows = self._collect()
+        tags = self._load_tags(rows)
+        for lookup in self.lookups.values():
+            lookup.load()
+        services = self._build(rows, tags)
+        self._write(services, tags)
+        return [service for position, service, macs in services]
+
+    def _collect(self):
+        rows = []
+        for position, item in enumerate(self.items):
+            connection_id = item.get('connection')
+            tag_number = item.get('tag_number_v4') or item.get('tag_number_v6') or item.get('tag_or_outer_bilateral')
+            try:
+                connection_id = int(connection_id)
+            except (TypeError, ValueError):
+                raise ValidationError("*** CustomerConnection not found: {}".format(connection_id))
+            row = {'position': position, 'item': item, 'connection_id': connection_id, 'tag_number': None}
+            if tag_number:
+                try:
+                    row['tag_number'] = int(tag_number)
+                except (TypeError, ValueError):
+                    raise ValidationError("*** Invalid ServiceTag: {}".format(tag_number))
+                self.tag_model._meta.get_field('tag').run_validators(row['tag_number'])
+                row['refs'] = dict(
+                    (name, self.lookups[name].add(item.get(name)))
+                    for name in ('asn', 'service', 'mlpav4_address', 'mlpav6_address')
+                )
+                row['macs'] = [self.lookups['mac_address'].add(ref) for ref in item.get('mac_address') or []]
+            rows.append(row)
+        return rows
+
+    def _load_tags(self, rows):
+        connection_model = self.service_model._meta.get_field('connection').related_model
+        connections = dict(
+            (pk, (tag_domain_id, ix_id)) for pk, tag_domain_id, ix_id in connection_model.objects.filter(
+                pk__in=set(row['connection_id'] for row in rows)
+            ).values_list('pk', 'tag_domain_id', 'tag_domain__ix_id')
+        )
+        for row in rows:
+            if row['connection_id'] not in connections:
+                raise ValidationError("*** CustomerConnection not found: {}".format(row['connection_id']))
+            row['tag_domain_id'], row['ix_id'] = connections[row['connection_id']]
+            if not row['tag_domain_id']:
+                raise ValidationError("*** Tag Domain not found for CustomerConnection: {}".format(row['connection_id']))
+        # itens sem tag sao ignorados, como no caminho de um item por vez
+        rows[:] = [row for row in rows if row['tag_number'] is not None]
+
+        # (dominio, tag) -> ServiceTag, criando as tags que ainda nao existem
+        wanted = set((row['tag_domain_id'], row['tag_number']) for row in rows)
+        tags = {}
+        for tag in self.tag_model.objects.filter(
+                tag_domain_id__in=set(domain for domain, number in wanted),
+                tag__in=set(number for domain, number in wanted)):
+            key = (tag.tag_domain_id, tag.tag)
+            if key in wanted:
+                tags.setdefault(key, tag)
+        missing = [
+            self.tag_model(tag=number, tag_domain_id=domain, status=TagStatusChoices().STATUS_AVAILABLE)
+            for domain, number in sorted(wanted - set(tags))
+        ]
+        for tag in self.tag_model.objects.bulk_create(missing, batch_size=self.batch_size):
+            tags[(tag.tag_domain_id, tag.tag)] = tag
+        self._update_bitmaps(missing, TagStatusChoices().STATUS_AVAILABLE)
+        apply_deltas(instance_deltas(missing))
+
+        states = dict((tag.pk, TagState(tag)) for tag in tags.values())
+        for tag_id, asn_id, inner_tag, connection_id in self.service_model.objects.filter(
+                tag_or_outer__in=list(states)).values_list('tag_or_outer_id', 'asn_id', 'inner_tag', 'connection_id'):
+            states[tag_id].services.append((asn_id, inner_tag, connection_id))
+        for row in rows:
+            row['tag'] = tags[(row['tag_domain_id'], row['tag_number'])]
+        return states
+
+    def _taken_addresses(self, name):
+        ids = set(obj.pk for key, obj in self.lookups[name].objects.items() if hasattr(obj, 'pk'))
+        return set(self.service_model.objects.filter(
+            **{'{}__in'.format(name): ids}
+        ).values_list('{}_id'.format(name), flat=True)) if ids else set()
+
+    def _build(self, rows, states):
+        taken = dict((name, self._taken_addresses(name)) for name in ('mlpav4_address', 'mlpav6_address'))
+        relational = [field.name for field in self.service_model._meta.fields if field.is_relation]
+        services = []
+        for row in rows:
+            item, tag = row['item'], row['tag']
+            related = dict((name, self.lookups[name].get(key)) for name, key in row['refs'].items())
+            if related['service'] is None:
+                raise ValidationError("*** IXService is required for CustomerService ***")
+            if related['asn'] is None:
+                raise ValidationError("*** AS is required for CustomerService ***")
+            if registry.is_service_type(related['service'].service_type_id, BILATERAL):
+                self.deferred.append((row['position'], item, tag))
+                continue
+            if row['ix_id'] != related['service'].ix_id:
+                raise ValidationError("*** IX for Service and ServiceTagDomain dont match ***")
+
+            service = self.service_model(
+                connection_id=row['connection_id'],
+                tag_or_outer=tag,
+                inner_tag=item.get('inner_tag'),
+                ticket=item.get('ticket'),
+                **related
+            )
+            service.clean_fields(exclude=relational)
+
+            for name in ('mlpav4_address', 'mlpav6_address'):
+                address = related[name]
+                if address is not None:
+                    if address.pk in taken[name]:
+                        raise service.unique_error_message(self.service_model, (name,))
+                    taken[name].add(address.pk)
+
+            state = states[tag.pk]
+            state.validate(service)
+            if not state.is_unique(service):
+                raise service.unique_error_message(self.service_model, ('connection', 'tag_or_outer', 'inner_tag'))
+            state.add(service)
+            services.append((row['position'], service, [self.lookups['mac_address'].get(key) for key in row['macs']]))
+        return services
+
+    def _write(self, services, states):
+        self.service_model.objects.bulk_create([service for position, service, macs in services], batch_size=self.batch_size)
+        self.created = [(position, service) for position, service, macs in services]
+        # bulk_create/update nao disparam os receivers dos contadores
+        deltas = instance_deltas(service for position, service, macs in services)
+
+        field = self.service_model._meta.get_field('mac_address')
+        through = field.remote_field.through
+        through.objects.bulk_create([
+            through(**{
+                '{}_id'.format(field.m2m_field_name()): service.pk,
+                '{}_id'.format(field.m2m_reverse_field_name()): mac.pk,
+            })
+            for position, service, macs in services for mac in set(macs)
+        ], batch_size=self.batch_size)
+
+        production = TagStatusChoices().STATUS_PRODUCTION
+        self.promoted = [
+            state.tag for state in states.values()
+            if state.tag.status != production and state.status == production
+        ]
+        if self.promoted:
+            deltas.update(instance_deltas(self.promoted, -1))
+            self.tag_model.objects.filter(pk__in=[tag.pk for tag in self.promoted]).update(
+                status=production, last_updated=timezone.now()
+            )
+            for tag in self.promoted:
+                # mantem as instancias compartilhadas com os itens bilaterais atualizadas
+                tag.status = production
+            deltas.update(instance_deltas(self.promoted))
+            self._update_bitmaps(self.promoted, production)
+        apply_deltas(deltas)
+
+        for position, service, macs in services:
+            refresh_service(service)
+        # bulk_create nao dispara os receivers que limpam o resumo de tags
+        invalidate_domain_tags(*[state.tag.tag_domain_id for state in states.values()])
+
+    def _update_bitmaps(self, tags, status):
+        # bulk_create/update nao disparam os receivers de ServiceTag
+        domains = {}
+        for tag in tags:
+            domains.setdefault(tag.tag_domain_id, []).append(tag.tag)
+        bitmap_model = apps.get_model('ixservices', 'ServiceTagBitmap')
+        for tag_domain_id, numbers in domains.items():
+            bitmap_model.update_tags(tag_domain_id, numbers, status)
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from django.apps import apps
+
+
+# tempo maximo (s) de uma tabela carregada, limite para alteracoes feitas
+# por outros processos (no processo local os sinais invalidam na hora)
+REGISTRY_TTL = 300
+
+# nomes dos ServiceTypes usados pelas regras do plugin
+ATMV4 = 'atmv4'
+ATMV6 = 'atmv6'
+BILATERAL = 'bilateral'
+
+
+class ReferenceRegistry:
+    """
+    Process-local cache of the small, almost static reference tables
+    (ServiceType, CustomerConnectionType and IX).
+
+    Each table is loaded once with a single query and dropped by the
+    post_save/post_delete receivers of its model. The cached instances are
+    shared between requests and must be treated as read-only.
+    """
+
+    # tabela -> modelo
+    TABLES = {
+        'servicetype': 'ServiceType',
+        'customerconnectiontype': 'CustomerConnectionType',
+        'ix': 'IX',
+    }
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def _rows(self, table):
+        with self._lock:
+            loaded = self._tables.get(table)
+            if loaded is None or time.monotonic() - loaded[0] > REGISTRY_TTL:
+                model = apps.get_model('ixservices', self.TABLES[table])
+                loaded = (time.monotonic(), list(model.objects.all()))
+                self._tables[table] = loaded
+            return loaded[1]
+
+    def invalidate(self, table=None):
+        with self._lock:
+            if table is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(table, None)
+
+    # ============== ServiceType ==============
+
+    def service_types(self):
+        return self._rows('servicetype')
+
+    def service_type(self, name):
+        """Return the ServiceType by name (case insensitive) or None."""
+        name = name.lower()
+        return next((item for item in self.service_types() if item.name.lower() == name), None)
+
+    def service_type_by_pk(self, pk):
+        return next((item for item in self.service_types() if item.pk == pk), None)
+
+    def atmv4_type(self):
+        return self.service_type(ATMV4)
+
+    def atmv6_type(self):
+        return self.service_type(ATMV6)
+
+    def bilateral_type(self):
+        return self.service_type(BILATERAL)
+
+    def is_service_type(self, service_type_id, name):
+        service_type = self.service_type(name)
+        return service_type is not None and service_type.pk == service_type_id
+
+    # ============== CustomerConnectionType ==============
+
+    def connection_types(self):
+        return self._rows('customerconnectiontype')
+
+    # ============== IX ==============
+
+    def ixs(self):
+        return self._rows('ix')
+
+    def ix_by_code(self, code):
+        return next((ix for ix in self.ixs() if ix.code == code), None)
+
+    def ix_by_pk(self, pk):
+        return next((ix for ix in self.ixs() if ix.pk == pk), None)
+
+
+registry = ReferenceRegistry()
@@ -0,0 +1,206 @@
+import ipaddress
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+
+class PrefixTrie:
+    """
+    Binary radix trie of IP prefixes for longest-prefix-match lookups.
+
+    Nodes are [child_0, child_1, value] lists walked one bit at a time from
+    the most significant bit, so a lookup costs at most 32 (IPv4) or 128
+    (IPv6) steps whatever the number of prefixes.
+    """
+
+    def __init__(self, bits):
+        self.bits = bits
+        self.root = [None, None, None]
+
+    def insert(self, network, value):
+        node, address = self.root, int(network.network_address)
+        for depth in range(network.prefixlen):
+            bit = (address >> (self.bits - 1 - depth)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        node[2] = (network, value)
+
+    def remove(self, network):
+        node, address = self.root, int(network.network_address)
+        for depth in range(network.prefixlen):
+            node = node[(address >> (self.bits - 1 - depth)) & 1]
+            if node is None:
+                return
+        node[2] = None
+
+    def lookup(self, address):
+        """Return the (network, value) of the longest prefix containing address."""
+        node, match = self.root, self.root[2]
+        for depth in range(self.bits):
+            node = node[(address >> (self.bits - 1 - depth)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                match = node[2]
+        return match
+
+
+class AddressResolver:
+    """
+    Resolve peering LAN addresses to the owning IX (longest prefix match over
+    the IX prefixes) and, when allocated, to the CustomerService and AS.
+    """
+
+    def __init__(self):
+        self.tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        # enderecos alocados: (versao, inteiro) -> (service_id, asn)
+        self.hosts = {}
+        # servico -> chaves em hosts, para remover o endereco anterior
+        self.services = {}
+
+    def add_prefix(self, prefix, ix_pk, ix_code):
+        try:
+            network = ipaddress.ip_network(prefix, False)
+        except ValueError:
+            return
+        self.tries[network.version].insert(network, (ix_pk, ix_code))
+
+    def set_service(self, service_pk, asn, addresses):
+        self.remove_service(service_pk)
+        keys = []
+        for address in addresses:
+            if address:
+                ip = ipaddress.ip_address(address)
+                keys.append((ip.version, int(ip)))
+        for key in keys:
+            self.hosts[key] = (service_pk, asn)
+        self.services[service_pk] = keys
+
+    def remove_service(self, service_pk):
+        for key in self.services.pop(service_pk, ()):
+            if self.hosts.get(key, (None,))[0] == service_pk:
+                del self.hosts[key]
+
+    def resolve(self, address):
+        """Return a dict with the IX, prefix, service and AS of an address."""
+        try:
+            ip = ipaddress.ip_address(address.strip())
+        except (ValueError, AttributeError):
+            return {'address': address, 'error': 'invalid address'}
+        match = self.tries[ip.version].lookup(int(ip))
+        service_pk, asn = self.hosts.get((ip.version, int(ip)), (None, None))
+        return {
+            'address': str(ip),
+            'ix_id': match[1][0] if match else None,
+            'ix': match[1][1] if match else None,
+            'prefix': str(match[0]) if match else None,
+            'customerservice_id': service_pk,
+            'asn': asn,
+        }
+
+    def resolve_many(self, addresses):
+        return [self.resolve(address) for address in addresses]
+
+
+# resolver do processo, montado no primeiro uso, e a geracao compartilhada
+# (cache do django) em que foi montado
+_resolver = None
+_resolver_generation = None
+_lock = threading.Lock()
+
+_GENERATION_KEY = 'ixservices:resolver:generation'
+
+
+def _generation():
+    return cache.get_or_set(_GENERATION_KEY, 1, None)
+
+
+def _bump_generation():
+    """Advance the shared generation, so the other processes rebuild on next use."""
+    try:
+        return cache.incr(_GENERATION_KEY)
+    except ValueError:
+        cache.set(_GENERATION_KEY, 1, None)
+        return 1
+
+
+def get_resolver(ix_model, service_model):
+    """
+    Return the process resolver, rebuilding it when another process changed
+    an IX, CustomerService or address (shared generation in the cache).
+    """
+    global _resolver, _resolver_generation
+    generation = _generation()
+    with _lock:
+        if _resolver is None or generation != _resolver_generation:
+            resolver = AddressResolver()
+            for ix_pk, ix_code, ipv4_prefix, ipv6_prefix in ix_model.objects.values_list(
+                    'pk', 'code', 'ipv4_prefix', 'ipv6_prefix'):
+                resolver.add_prefix(ipv4_prefix, ix_pk, ix_code)
+                resolver.add_prefix(ipv6_prefix, ix_pk, ix_code)
+            for service_pk, asn, ipv4, ipv6 in service_model.objects.filter(
+                    Q(mlpav4_address__isnull=False) | Q(mlpav6_address__isnull=False)
+            ).values_list('pk', 'asn__number', 'mlpav4_address__address', 'mlpav6_address__address'):
+                resolver.set_service(service_pk, asn, (ipv4, ipv6))
+            _resolver = resolver
+            _resolver_generation = generation
+        return _resolver
+
+
+def _apply_on_commit(change):
+    """
+    Once the transaction commits (a rolled back save leaves the resolver
+    untouched), bump the shared generation and apply the change to the
+    process resolver. The resolver is dropped instead when it had already
+    missed another change, and rebuilt on next use.
+    """
+    def apply():
+        global _resolver, _resolver_generation
+        generation = _bump_generation()
+        with _lock:
+            if _resolver is None:
+                return
+            if _resolver_generation == generation - 1:
+                change(_resolver)
+                _resolver_generation = generation
+            else:
+                _resolver = None
+                _resolver_generation = None
+    transaction.on_commit(apply)
+
+
+def refresh_service(service):
+    """Update the resolver with the current addresses of a CustomerService."""
+    addresses = (
+        service.mlpav4_address.address if service.mlpav4_address_id else None,
+        service.mlpav6_address.address if service.mlpav6_address_id else None,
+    )
+    service_pk, asn = service.pk, service.asn.number
+    _apply_on_commit(lambda resolver: resolver.set_service(service_pk, asn, addresses))
+
+
+def forget_service(service_pk):
+    _apply_on_commit(lambda resolver: resolver.remove_service(service_pk))
+
+
+def reset_resolver():
+    """
+    Drop the resolver in every process (prefix or bulk address changes),
+    rebuilt on next use.
+    """
+    global _resolver, _resolver_generation
+    with _lock:
+        _resolver = None
+        _resolver_generation = None
+
+    def bump():
+        global _resolver, _resolver_generation
+        _bump_generation()
+        # montado antes do commit com os dados antigos
+        with _lock:
+            _resolver = None
+            _resolver_generation = None
+    transaction.on_commit(bump)
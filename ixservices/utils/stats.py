@@ -0,0 +1,156 @@
+from django.apps import apps
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .registry import ATMV4, ATMV6, BILATERAL
+from .status import TagStatusChoices
+
+
+# contadores por tipo de servico (CustomerService)
+SERVICE_TYPE_COUNTERS = {
+    'atmv4': Q(service__service_type__name__iexact=ATMV4),
+    'atmv6': Q(service__service_type__name__iexact=ATMV6),
+    'bilaterais': Q(service__service_type__name__iexact=BILATERAL),
+}
+
+# papeis de device com interfaces de participantes
+PARTICIPANT_DEVICE_ROLES = ('pe', 'l2')
+
+
+def count_by(queryset, counters, field='pk', distinct=False):
+    """
+    Count the rows of the queryset matching each condition of counters
+    ({name: Q or None}) with a single conditional aggregation query, e.g.
+
+        count_by(qs, {'available': Q(status='AVAILABLE'), 'total': None})
+
+    Returns {name: count}.
+    """
+    if not counters:
+        return {}
+    return queryset.order_by().aggregate(**dict(
+        (name, Count(field, filter=condition, distinct=distinct)) for name, condition in counters.items()
+    ))
+
+
+def service_type_counts(queryset):
+    """CustomerServices of the queryset by service type (SERVICE_TYPE_COUNTERS)."""
+    return count_by(queryset, SERVICE_TYPE_COUNTERS)
+
+
+def tag_status_counts(queryset, statuses=None):
+    """ServiceTags of the queryset by status (all TagStatusChoices by default)."""
+    if statuses is None:
+        statuses = [status for status, txt in TagStatusChoices().CHOICES]
+    return count_by(queryset, dict((status, Q(status=status)) for status in statuses))
+
+
+def free_interface_count(ix_code):
+    """
+    Participant interfaces of the IX devices without a
+    CustomerConnectionEndpoint, counted over dcim.Interface instead of
+    joining IX -> region -> sites -> devices -> interfaces.
+    """
+    interface_model = apps.get_model('dcim', 'Interface')
+    return interface_model.objects.filter(
+        device__site__region__ix__code=ix_code,
+        device__device_role__slug__in=PARTICIPANT_DEVICE_ROLES,
+        customerconnectionendpoint__isnull=True,
+        custom_field_data__InterfaceRole='Participant',
+    ).count()
+
+
+# ============== Paineis das paginas de detalhe ==============
+
+# mesmos tipos (por nome) dos endpoints de resumo
+PANEL_SERVICE_COUNTERS = {
+    'total_services': None,
+    'total_atmv4': SERVICE_TYPE_COUNTERS['atmv4'],
+    'total_atmv6': SERVICE_TYPE_COUNTERS['atmv6'],
+    'total_bilateral': SERVICE_TYPE_COUNTERS['bilaterais'],
+}
+
+PANEL_TAG_COUNTERS = {
+    'tags_avail_count': Q(status=TagStatusChoices().STATUS_AVAILABLE),
+    'tags_alloc_count': Q(status=TagStatusChoices().STATUS_ALLOCATED),
+    'tags_prod_count': Q(status=TagStatusChoices().STATUS_PRODUCTION),
+}
+
+
+def restricted_counts(queryset, user, counters):
+    """count_by() over queryset.restrict(user, 'view'), as the panels count."""
+    return count_by(queryset.restrict(user, 'view'), counters)
+
+
+def subquery_count(queryset, outer_field, condition=None, distinct=False):
+    """
+    Count of the rows of queryset whose outer_field is the pk of the outer
+    query, as an expression to annotate on it (0 when there is none).
+    """
+    # restrict() sem permissao devolve none(), que nao compila como subconsulta
+    if queryset.query.is_empty():
+        return Value(0, output_field=IntegerField())
+    rows = queryset.filter(**{outer_field: OuterRef('pk')}).order_by().values(outer_field).annotate(
+        n=Count('pk', filter=condition, distinct=distinct)
+    ).values('n')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def _ip_counters(version):
+    return {
+        'total_ipv{}'.format(version): None,
+        'total_ipv{}_free'.format(version): Q(customerservice__isnull=True),
+        'total_ipv{}_alloc'.format(version): Q(customerservice__isnull=False),
+    }
+
+
+def ix_panel_stats(ix, user):
+    """
+    Numbers of the IX page with two queries: services by type, then ASNs,
+    IPs and tags by status as subqueries annotated on the IX.
+    """
+    service_model = apps.get_model('ixservices', 'CustomerService')
+    as_model = apps.get_model('ixservices', 'AS')
+    stats = restricted_counts(service_model.objects.filter(service__ix=ix), user, PANEL_SERVICE_COUNTERS)
+
+    counters = {
+        'total_asn': subquery_count(as_model.objects.restrict(user, 'view'), 'customerservice__service__ix', distinct=True),
+    }
+    for related, names in (
+            (ix.ipv4address, _ip_counters(4)), (ix.ipv6address, _ip_counters(6)), (ix.servicetag_set, PANEL_TAG_COUNTERS)):
+        queryset = related.model.objects.restrict(user, 'view')
+        for name, condition in names.items():
+            counters[name] = subquery_count(queryset, 'ix', condition)
+    stats.update(type(ix).objects.filter(pk=ix.pk).values(**counters).get())
+    return stats
+
+
+def as_panel_stats(asn, user):
+    """Numbers of the AS page: services by IX and by type."""
+    service_model = apps.get_model('ixservices', 'CustomerService')
+    services = service_model.objects.filter(asn=asn)
+    total_by_ix = list(
+        services.values('service__ix', 'service__ix__code').annotate(Count('service')).order_by().restrict(user, 'view')
+    )
+    stats = {
+        'total_ix': len(total_by_ix),
+        'total_by_ix': total_by_ix,
+    }
+    stats.update(restricted_counts(services, user, PANEL_SERVICE_COUNTERS))
+    return stats
+
+
+def tag_domain_panel_stats(tag_domain, user):
+    """Tags of a ServiceTagDomain by status."""
+    return restricted_counts(tag_domain.servicetags.all(), user, PANEL_TAG_COUNTERS)
+
+
+def connection_panel_stats(connection, user):
+    """Services of a CustomerConnection grouped by ASN and their total."""
+    services = list(
+        connection.customerservice.values('asn', 'asn__number').annotate(Count('asn')).order_by().restrict(user, 'view')
+    )
+    return {
+        'total_services': sum(item['asn__count'] for item in services),
+        'customerservice': services,
+    }
@@ -0,0 +1,144 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from dcim.models import Device, Interface
+
+
+# tempo maximo (s) de uma resolucao no mapa, limite para alteracoes que nao
+# passam pelos sinais (as demais mudam a geracao compartilhada)
+TAGDOMAIN_MAP_TTL = 300
+
+_GENERATION_KEY = 'ixservices:tagdomains:generation'
+
+
+class DeviceDomains:
+    """
+    Precomputed tag domain resolution of a device, following the rules of
+    CustomerConnection._get_tagdomain_by_device():
+
+    - PE: PORT-CHANNEL domain of one of the member ports, else the IX domain
+    - Layer2 with uplinks: PORT-CHANNEL domain of the PE uplinks in the same
+      PIX, else the IX domain (None when no PE is found)
+    - Layer2 without uplinks: DEVICE domain of the device, else PORT-CHANNEL
+      domain of one of the member ports, else the IX domain
+    """
+
+    def __init__(self, role, ix_domain, device_domain=None, port_domains=None, uplink_domain=None, has_pe=False,
+                 generation=None):
+        self.role = role
+        self.ix_domain = ix_domain
+        self.device_domain = device_domain
+        # interface -> PORT-CHANNEL domain do device
+        self.port_domains = port_domains or {}
+        self.uplink_domain = uplink_domain
+        self.has_pe = has_pe
+        # geracao compartilhada (cache) em que a resolucao foi feita
+        self.generation = generation
+        self.created = time.monotonic()
+
+    def _port_domain(self, member_ids):
+        return next((self.port_domains[pk] for pk in member_ids if pk in self.port_domains), None)
+
+    def resolve(self, member_ids):
+        """Return the id of the effective ServiceTagDomain for the member ports."""
+        if self.role == 'PE':
+            return self._port_domain(member_ids) or self.ix_domain
+        if self.role == 'Layer2-uplink':
+            return (self.uplink_domain or self.ix_domain) if self.has_pe else None
+        if self.role == 'Layer2':
+            return self.device_domain or self._port_domain(member_ids) or self.ix_domain
+        return None
+
+
+def _port_domains(domain_model, device_id, interface_ids=None):
+    domains = domain_model.objects.filter(domain_type='PORT-CHANNEL', device_id=device_id)
+    if interface_ids is not None:
+        domains = domains.filter(interface__pk__in=interface_ids)
+    port_domains = {}
+    for pk, interface_id in domains.values_list('pk', 'interface_id'):
+        port_domains.setdefault(interface_id, pk)
+    return port_domains
+
+
+def build_device_domains(domain_model, ix_model, device):
+    if device.site.region_id is None:
+        raise ValueError("Site {} of device {} has no region".format(device.site, device))
+    ix = ix_model.objects.filter(region=device.site.region_id).first()
+    if ix is None:
+        raise ValueError("No IX found for the region of device {}".format(device))
+    ix_domain = domain_model.objects.filter(ix=ix, domain_type='IX-DOMAIN').values_list('pk', flat=True).first()
+    role = device.device_role.name
+
+    if role == 'PE':
+        return DeviceDomains('PE', ix_domain, port_domains=_port_domains(domain_model, device.pk))
+
+    if role == 'Layer2':
+        l2_uplinks = device.interfaces.filter(custom_field_data__InterfaceRole="Uplink")
+        if l2_uplinks.exists():
+            # portas de uplink do PE no mesmo PIX
+            pe_uplinks = list(Interface.objects.filter(
+                pk__in=l2_uplinks.values_list("_link_peer_id", flat=True),
+                device__site=device.site,
+                device__device_role__name="PE"
+            ).values_list('pk', 'device'))
+            if not pe_uplinks:
+                return DeviceDomains('Layer2-uplink', ix_domain)
+            pe = pe_uplinks[0][1]
+            uplink_domain = next(iter(_port_domains(
+                domain_model, pe, [pk for pk, device_id in pe_uplinks]
+            ).values()), None)
+            return DeviceDomains('Layer2-uplink', ix_domain, uplink_domain=uplink_domain, has_pe=True)
+
+        device_domain = domain_model.objects.filter(
+            domain_type="DEVICE", device=device, interface__isnull=True
+        ).values_list('pk', flat=True).first()
+        return DeviceDomains(
+            'Layer2', ix_domain, device_domain=device_domain, port_domains=_port_domains(domain_model, device.pk)
+        )
+
+    return DeviceDomains(role, ix_domain)
+
+
+# mapa do processo: device -> DeviceDomains
+_device_domains = {}
+_lock = threading.Lock()
+
+
+def resolve_tag_domain(domain_model, ix_model, device_id, member_ids):
+    """
+    Return the id of the ServiceTagDomain of a connection from the device of
+    its ports and the member interfaces, using the precomputed map.
+    """
+    # dominios, devices ou interfaces alterados em outros processos mudam a geracao
+    generation = cache.get_or_set(_GENERATION_KEY, 1, None)
+    with _lock:
+        entry = _device_domains.get(device_id)
+    if entry is None or entry.generation != generation or time.monotonic() - entry.created > TAGDOMAIN_MAP_TTL:
+        device = Device.objects.select_related('site', 'device_role').get(pk=device_id)
+        entry = build_device_domains(domain_model, ix_model, device)
+        entry.generation = generation
+        with _lock:
+            _device_domains[device_id] = entry
+    return entry.resolve(member_ids)
+
+
+def reset_tag_domain_map():
+    """
+    Drop every resolution (domains, device roles or uplinks changed) in this
+    process now and, once the transaction commits, in every process.
+    """
+    with _lock:
+        _device_domains.clear()
+
+    def bump():
+        try:
+            cache.incr(_GENERATION_KEY)
+        except ValueError:
+            cache.set(_GENERATION_KEY, 1, None)
+        # resolucoes feitas antes do commit com os dados antigos
+        with _lock:
+            _device_domains.clear()
+    transaction.on_commit(bump)
@@ -0,0 +1,124 @@
+from django.db import transaction
+
+from .constants import MAX_TAG_NUMBER, MIN_TAG_NUMBER
+from .counters import apply_deltas, instance_deltas
+from .ips_utils import BULK_BATCH_SIZE
+from .status import TagStatusChoices
+from .tagsummary import invalidate_domain_tags
+
+
+# tags reservadas em todos os dominios (0 - priority tag, 1 - vlan default)
+RESERVED_TAGS = (0, 1)
+
+
+def seed_tag_domain(tag_domain, ix=None, reserved=RESERVED_TAGS, batch_size=BULK_BATCH_SIZE):
+    """
+    Create every ServiceTag (MIN_TAG_NUMBER - MAX_TAG_NUMBER) of a
+    ServiceTagDomain with batched bulk inserts inside a single transaction.
+
+    Tags that already exist in the domain are kept, so seeding is idempotent
+    and can be used for IX, device and port-channel domains. Reserved tags
+    are created as ALLOCATED. Returns the number of tags created.
+    """
+    st = TagStatusChoices()
+    tag_model = tag_domain.servicetags.model
+
+    with transaction.atomic():
+        existing = set(tag_domain.servicetags.values_list('tag', flat=True))
+        tags = [
+            tag_model(
+                tag=n_tag,
+                ix=ix,
+                tag_domain=tag_domain,
+                status=st.STATUS_ALLOCATED if n_tag in reserved else st.STATUS_AVAILABLE
+            )
+            for n_tag in range(MIN_TAG_NUMBER, MAX_TAG_NUMBER + 1) if n_tag not in existing
+        ]
+        tag_model.objects.bulk_create(tags, batch_size=batch_size)
+        apply_deltas(instance_deltas(tags))
+        if tags:
+            invalidate_domain_tags(tag_domain.pk)
+
+    return len(tags)
+
+
+# tamanho em bytes do bitmap de um dominio (uma posicao por tag 0 - 4095)
+TAG_BITMAP_BYTES = (MAX_TAG_NUMBER + 8) // 8
+
+
+class TagBitmap:
+    """
+    Occupancy bitmap of the VLAN tags of a domain, one bit per tag.
+
+    Backed by a python int, so first-free and range searches are done with
+    shifts and masks over the whole 4096-bit word instead of row scans.
+    """
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(int.from_bytes(bytes(data or b''), 'little'))
+
+    @classmethod
+    def from_tags(cls, tags):
+        bits = 0
+        for tag in tags:
+            bits |= 1 << tag
+        return cls(bits)
+
+    def to_bytes(self):
+        return self.bits.to_bytes(TAG_BITMAP_BYTES, 'little')
+
+    def __contains__(self, tag):
+        return bool(self.bits >> tag & 1)
+
+    def __iter__(self):
+        bits, tag = self.bits, 0
+        while bits:
+            low = bits & -bits
+            tag = low.bit_length() - 1
+            yield tag
+            bits ^= low
+
+    def __or__(self, other):
+        return TagBitmap(self.bits | other.bits)
+
+    def add(self, tag):
+        self.bits |= 1 << tag
+
+    def discard(self, tag):
+        self.bits &= ~(1 << tag)
+
+    def count(self):
+        return bin(self.bits).count('1')
+
+    def _window(self, start, end):
+        return (self.bits >> start) & ((1 << (end - start + 1)) - 1)
+
+    def first(self, start=MIN_TAG_NUMBER, end=MAX_TAG_NUMBER):
+        """Return the lowest tag set in [start, end] or None."""
+        window = self._window(start, end)
+        if not window:
+            return None
+        return start + (window & -window).bit_length() - 1
+
+    def first_range(self, size, start=MIN_TAG_NUMBER, end=MAX_TAG_NUMBER):
+        """
+        Return the first tag of the lowest run of `size` consecutive tags set
+        in [start, end] or None.
+        """
+        run, length = self._window(start, end), 1
+        # cada passo dobra o tamanho das sequencias ate atingir size
+        while run and length < size:
+            step = min(length, size - length)
+            run &= run >> step
+            length += step
+        if not run:
+            return None
+        return start + (run & -run).bit_length() - 1
+
+    def tags(self, start=MIN_TAG_NUMBER, end=MAX_TAG_NUMBER):
+        """Return the tags set in [start, end] in ascending order."""
+        return [start + tag for tag in TagBitmap(self._window(start, end))]
@@ -0,0 +1,109 @@
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+
+
+# tempo maximo (s) de uma resposta no cache, limite para alteracoes que nao
+# passam pelos sinais
+TAG_SUMMARY_TTL = 300
+
+_KEY = 'ixservices:tagsummary:{}:{}'
+_GENERATION_KEY = 'ixservices:tagsummary:generation'
+
+
+def build_domain_tags(tag_domain_id):
+    """
+    Tags of a ServiceTagDomain by status, in the format of
+    TagDomainViewSet.getTags, with two queries.
+
+    A status whose tags have CustomerServices lists one entry per
+    (IXService, tag) with the service name, type, number of customer
+    services (ncs) and the tags of that service with their ASN and inner
+    tag lists. Other statuses list their tags as {tag_id, tag}.
+    """
+    tag_model = apps.get_model('ixservices', 'ServiceTag')
+    service_model = apps.get_model('ixservices', 'CustomerService')
+
+    tags = dict((status, []) for status, txt in tag_model.STATUSES)
+    for tag_id, tag, status in tag_model.objects.filter(tag_domain_id=tag_domain_id).order_by(
+            'ix', 'tag', 'pk').values_list('pk', 'tag', 'status'):
+        if status in tags:
+            tags[status].append({'tag_id': tag_id, 'tag': tag})
+
+    # status -> IXService -> dados do servico e suas tags
+    services = {}
+    rows = service_model.objects.filter(tag_or_outer__tag_domain_id=tag_domain_id).order_by(
+        'service__service_type__name', 'service__name', 'tag_or_outer__tag', 'pk'
+    ).values_list(
+        'tag_or_outer__status', 'tag_or_outer_id', 'tag_or_outer__tag',
+        'service_id', 'service__name', 'service__service_type__name', 'asn__number', 'inner_tag',
+    )
+    for status, tag_id, tag, service_id, name, service_type, asn, inner_tag in rows:
+        service = services.setdefault(status, {}).setdefault(service_id, {
+            'name': name, 'service_type__name': service_type, 'tags': {},
+        })
+        detail = service['tags'].setdefault(tag_id, {
+            'tag': tag, 'tag_id': tag_id, 'asn_list': [], 'inner_tag_list': [], 'ncs': 0,
+        })
+        detail['asn_list'].append(asn)
+        if inner_tag is not None:
+            detail['inner_tag_list'].append(inner_tag)
+        detail['ncs'] += 1
+
+    for status, by_service in services.items():
+        if status not in tags:
+            continue
+        detail_list = []
+        for service in by_service.values():
+            service_tags = [
+                dict((key, value) for key, value in detail.items() if key != 'ncs')
+                for detail in service['tags'].values()
+            ]
+            for detail in service['tags'].values():
+                detail_list.append({
+                    'name': service['name'],
+                    'service_type__name': service['service_type__name'],
+                    'ncs': detail['ncs'],
+                    'tags': service_tags,
+                })
+        tags[status] = detail_list
+    return tags
+
+
+def _generation():
+    return cache.get_or_set(_GENERATION_KEY, 1, None)
+
+
+def get_domain_tags(tag_domain_id):
+    """build_domain_tags() through the django cache."""
+    key = _KEY.format(_generation(), tag_domain_id)
+    tags = cache.get(key)
+    if tags is None:
+        tags = build_domain_tags(tag_domain_id)
+        cache.set(key, tags, TAG_SUMMARY_TTL)
+    return tags
+
+
+def invalidate_domain_tags(*tag_domain_ids):
+    """
+    Drop the cached domains once the transaction commits, so a getTags
+    running before the commit cannot cache the old rows again.
+    """
+    ids = set(pk for pk in tag_domain_ids if pk)
+    if not ids:
+        return
+
+    def delete():
+        generation = _generation()
+        cache.delete_many([_KEY.format(generation, pk) for pk in ids])
+    transaction.on_commit(delete)
+
+
+def invalidate_all_domain_tags():
+    """Drop every domain on commit (IXService or AS changes appear in all of them)."""
+    def bump():
+        try:
+            cache.incr(_GENERATION_KEY)
+        except ValueError:
+            cache.set(_GENERATION_KEY, 1, None)
+    transaction.on_commit(bump)
@@ -0,0 +1,155 @@
+from django.contrib.contenttypes.models import ContentType
+
+from dcim.models import CablePath, FrontPort, Interface, RearPort
+from dcim.utils import decompile_path_node
+
+
+# campo do CustomerConnectionEndpoint para cada tipo de porta do netbox
+ENDPOINT_PORT_FIELDS = ((Interface, 'interface'), (FrontPort, 'frontport'), (RearPort, 'rearport'))
+ENDPOINT_PORTS = tuple(field for model, field in ENDPOINT_PORT_FIELDS)
+
+
+def resolve_endpoint(endpoint):
+    """
+    Resolve the topology of a CustomerConnectionEndpoint from the CablePaths.
+
+    Interfaces are connected directly to the device. Front/rear ports (DIOs)
+    are followed to the Interface origin of a CablePath crossing them,
+    preferring one in the same site (PIX) of the port.
+    """
+    obj = endpoint.rearport or endpoint.frontport or endpoint.interface
+    values = {
+        'origin_device': None,
+        'destination_device': None,
+        'destination_interface': None,
+        'site': None,
+    }
+    if obj is None:
+        return values
+
+    values['origin_device'] = obj.device
+    if isinstance(obj, Interface):
+        values['destination_device'] = obj.device
+        values['destination_interface'] = obj
+    else:
+        origins = CablePath.objects.filter(
+            path__contains=obj, origin_type=ContentType.objects.get_for_model(Interface)
+        ).values('origin_id')
+        interfaces = Interface.objects.filter(pk__in=origins).select_related('device')
+        destination = interfaces.filter(device__site=obj.device.site_id).first() or interfaces.first()
+        if destination:
+            values['destination_device'] = destination.device
+            values['destination_interface'] = destination
+
+    device = values['destination_device'] or values['origin_device']
+    values['site'] = device.site if device else None
+    return values
+
+
+def compute_topology(endpoint):
+    """
+    Unsaved topology row of an endpoint, used by reads on a cache miss (only
+    the receivers and the rebuild_topology command write the cache).
+    """
+    topology_model = endpoint._meta.get_field('topology').related_model
+    return topology_model(endpoint=endpoint, **resolve_endpoint(endpoint))
+
+
+def rebuild_topology(endpoint):
+    """Store the resolved topology of an endpoint and return the cache row."""
+    topology_model = endpoint._meta.get_field('topology').related_model
+    topology, created = topology_model.objects.update_or_create(
+        endpoint=endpoint, defaults=resolve_endpoint(endpoint)
+    )
+    return topology
+
+
+def rebuild_topology_for_nodes(endpoint_model, nodes):
+    """
+    Rebuild the topology of the endpoints attached to any of the nodes given
+    as (content_type_id, object_id), e.g. the nodes of a CablePath.
+    """
+    fields = dict(
+        (ContentType.objects.get_for_model(model).pk, field) for model, field in ENDPOINT_PORT_FIELDS
+    )
+    ids = {}
+    for ct_id, object_id in nodes:
+        if ct_id in fields:
+            ids.setdefault(fields[ct_id], set()).add(object_id)
+    if not ids:
+        return 0
+
+    endpoints = endpoint_model.objects.none()
+    for field, object_ids in ids.items():
+        endpoints |= endpoint_model.objects.filter(**{'{}__in'.format(field): object_ids})
+
+    count = 0
+    for endpoint in endpoints.select_related('interface__device', 'frontport__device', 'rearport__device'):
+        rebuild_topology(endpoint)
+        count += 1
+    return count
+
+
+def cablepath_nodes(cablepath):
+    """Return the (content_type_id, object_id) of every node of a CablePath."""
+    nodes = [decompile_path_node(node) for node in cablepath.path]
+    nodes.append((cablepath.origin_type_id, cablepath.origin_id))
+    if cablepath.destination_id:
+        nodes.append((cablepath.destination_type_id, cablepath.destination_id))
+    return nodes
+
+
+def cable_nodes(cable):
+    """Return the (content_type_id, object_id) of both terminations of a Cable."""
+    return [
+        (cable.termination_a_type_id, cable.termination_a_id),
+        (cable.termination_b_type_id, cable.termination_b_id),
+    ]
+
+
+# relacionamentos carregados junto com os endpoints no resolver em lote
+ENDPOINT_RELATED = (
+    'topology__destination_interface',
+    'topology__destination_device__site',
+    'topology__destination_device__device_role',
+    'topology__destination_device__primary_ip4',
+) + tuple(
+    '{}__device__{}'.format(port, field)
+    for port in ('interface', 'frontport', 'rearport')
+    for field in ('site', 'device_role', 'primary_ip4')
+)
+
+
+def resolve_connections(connections):
+    """
+    Resolve the topology fields of many CustomerConnections at once.
+
+    Endpoints, ports, devices, roles, sites and the cached topology of every
+    connection are loaded with one query and handed to each connection, so
+    the topology properties are computed without further queries. Returns
+    {connection_pk: {field: value}}.
+    """
+    connections = list(connections)
+    if not connections:
+        return {}
+
+    endpoint_model = connections[0]._meta.get_field('customerconnectionendpoint').related_model
+    endpoints = {}
+    for endpoint in endpoint_model.objects.filter(
+            customer_connection__in=[connection.pk for connection in connections]
+    ).select_related(*ENDPOINT_RELATED).order_by('id'):
+        endpoints.setdefault(endpoint.customer_connection_id, []).append(endpoint)
+
+    resolved = {}
+    for connection in connections:
+        connection_endpoints = endpoints.get(connection.pk, [])
+        connection.set_endpoints(connection_endpoints)
+        first = connection_endpoints[0] if connection_endpoints else None
+        resolved[connection.pk] = {
+            'connected_device_info': connection.connected_device_info,
+            'connected_interfaces': connection.connected_interfaces,
+            'destination_device_info': connection.destination_device_info,
+            'device_id_by_interface': first.interface.device_id if first and first.interface_id else None,
+            'tagdomain': connection.tagdomain if connection.tag_domain_id else None,
+        }
+    return resolved
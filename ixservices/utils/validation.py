@@ -0,0 +1,115 @@
+import contextlib
+import threading
+
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+
+
+# etapas do full_clean() que um caminho interno pode declarar como garantidas
+FIELDS = 'fields'
+UNIQUE = 'unique'
+CLEAN = 'clean'
+
+# regras especificas dos modelos consultadas dentro dos seus clean()
+PREFIX_OVERLAP = 'prefix_overlap'
+TAG_DOMAIN_UNIQUE = 'tag_domain_unique'
+
+VALIDATIONS = (FIELDS, UNIQUE, CLEAN, PREFIX_OVERLAP, TAG_DOMAIN_UNIQUE)
+
+
+class ValidationPolicy:
+    """
+    Validations to run on ChangeLoggingMixin.save() while the policy is
+    active.
+
+    skip: validations already guaranteed by the caller (see VALIDATIONS).
+    dirty_only: on updates, validate only the fields changed since the
+    instance was loaded or last saved.
+    """
+
+    def __init__(self, skip=(), dirty_only=False):
+        unknown = set(skip) - set(VALIDATIONS)
+        if unknown:
+            raise ValueError("Unknown validations: {}".format(', '.join(sorted(unknown))))
+        self.skip = frozenset(skip)
+        self.dirty_only = dirty_only
+
+    def skips(self, validation):
+        return validation in self.skip
+
+
+# pilha de politicas da thread, a mais interna vale
+_local = threading.local()
+
+
+def _stack():
+    if not hasattr(_local, 'policies'):
+        _local.policies = []
+    return _local.policies
+
+
+@contextlib.contextmanager
+def validation_policy(skip=(), dirty_only=False):
+    """
+    Scope a ValidationPolicy to the saves done inside the block, e.g.
+
+        with validation_policy(skip=(UNIQUE, TAG_DOMAIN_UNIQUE)):
+            ServiceTagDomain.objects.create(...)
+    """
+    stack = _stack()
+    stack.append(ValidationPolicy(skip, dirty_only))
+    try:
+        yield stack[-1]
+    finally:
+        stack.pop()
+
+
+def current_policy():
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def is_guaranteed(validation):
+    """True when the active policy declares the validation as guaranteed."""
+    policy = current_policy()
+    return policy is not None and policy.skips(validation)
+
+
+def clean_instance(instance):
+    """
+    full_clean() of a ChangeLoggingMixin following the active policy. With
+    no policy every validation runs, as before.
+    """
+    policy = current_policy()
+    if policy is None:
+        instance.full_clean()
+        return
+
+    exclude = unique_exclude = []
+    if policy.dirty_only and not instance._state.adding:
+        dirty = instance.get_dirty_fields()
+        exclude = [field.name for field in instance._meta.fields if field.name not in dirty]
+        # unique_together e ignorado se qualquer campo do grupo for excluido
+        together = set(
+            name for group in instance._meta.unique_together if dirty.intersection(group) for name in group
+        )
+        unique_exclude = [name for name in exclude if name not in together]
+
+    # mesmas etapas e acumulo de erros do Model.full_clean()
+    errors = {}
+    if not policy.skips(FIELDS):
+        try:
+            instance.clean_fields(exclude=exclude)
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+    if not policy.skips(CLEAN):
+        try:
+            instance.clean()
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+    if not policy.skips(UNIQUE):
+        try:
+            instance.validate_unique(exclude=unique_exclude + [name for name in errors if name != NON_FIELD_ERRORS])
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+    if errors:
+        raise ValidationError(errors)
@@ -81,6 +81,29 @@ CUSTOMER_EXTREME = re.compile(r'^ct-{0}$'.format(regex.channel_name_extreme))
 CUSTOMER_JUNIPER = re.compile(r'^ct-{0}$'.format(regex.channel_name_juniper))
 CUSTOMER_HUAWEI = re.compile(r'^ct-{0}$'.format(regex.channel_name_huawei))
 
+# ------- ASN -------
+# faixas reservadas (16 e 32 bits), teste de pertinencia em range e O(1)
+ASN_RESERVED_RANGES = (range(64496, 64512), range(64513, 65536), range(65536, 65551))
+ASN_MAX = 4200000000
+
+# ------- Compiled Validators -------
+CNPJ_VALIDATOR = RegexValidator(regex=CNPJ, message=INVALID_CNPJ, code='invalid')
+IX_CODE_VALIDATOR = RegexValidator(IX_CODE, USUAL_IX_CODE)
+IX_FULLNAME_VALIDATOR = RegexValidator(IX_FULLNAME, USUAL_IX_FULLNAME)
+IX_SHORTNAME_VALIDATOR = RegexValidator(IX_SHORTNAME, USUAL_IX_SHORTNAME)
+MAC_ADDRESS_VALIDATOR = RegexValidator(MAC_ADDRESS, USUAL_MAC_ADDRESS)
+LOWERCASE_VALIDATOR = RegexValidator(LOWERCASE, ONLY_LOWERCASE)
+PIX_CODE_VALIDATOR = RegexValidator(PIX_CODE, USUAL_PIX_CODE)
+URL_VALIDATOR = URLValidator()
+
+SWITCH_MODEL_DICT = {
+    'EXTREME': RegexValidator(EXTREME_MODELS, INVALID_SWITCH_MODEL),
+    'CISCO': RegexValidator(CISCO_MODELS, INVALID_SWITCH_MODEL),
+    'JUNIPER': RegexValidator(JUNIPER_MODELS, INVALID_SWITCH_MODEL),
+    'BROCADE': RegexValidator(BROCADE_MODELS, INVALID_SWITCH_MODEL),
+    'HUAWEI': RegexValidator(HUAWEI_MODELS, INVALID_SWITCH_MODEL),
+}
+
 # ------- Validation Dicts -------
 CHANNEL_DICT = {
     'CustomerChannel': {
@@ -122,30 +145,18 @@ CHANNEL_DICT = {
 
 
 # ------- Validation Functions -------
-def validate_as_number(number):
-    """ASN validator."""
-
-    # 16-bit range list
-    s_bit_reserved_range = list(range(64496, 64512))
-    s_bit_reserved_range.extend(list(range(64513, 65536)))
+def is_valid_as_number(number):
+    return 1 <= number < ASN_MAX and not any(number in reserved for reserved in ASN_RESERVED_RANGES)
 
-    # 32-bit range list
-    t_bit_reserved_range = list(range(65536, 65551))
 
-    if number < 1 or \
-            number in s_bit_reserved_range or \
-            number in t_bit_reserved_range or \
-            number >= 4200000000:
+def validate_as_number(number):
+    """ASN validator."""
+    if not is_valid_as_number(number):
         raise ValidationError(INVALID_ASN)
 
 
 def validate_cnpj(value):
-    validator = RegexValidator(
-        regex=CNPJ,
-        message=INVALID_CNPJ,
-        code='invalid')
-
-    validator(value)
+    CNPJ_VALIDATOR(value)
 
 
 def validate_ipv4_network(value):
@@ -176,24 +187,20 @@ def validate_ipv6_network(value):
 
 
 def validate_ix_code(value):
-    validator = RegexValidator(IX_CODE, USUAL_IX_CODE)
-    validator(value)
+    IX_CODE_VALIDATOR(value)
 
 
 def validate_ix_fullname(value):
-    validator = RegexValidator(IX_FULLNAME, USUAL_IX_FULLNAME)
-    validator(value)
+    IX_FULLNAME_VALIDATOR(value)
 
 
 def validate_ix_shortname(value):
-    validator = RegexValidator(IX_SHORTNAME, USUAL_IX_SHORTNAME)
-    validator(value)
+    IX_SHORTNAME_VALIDATOR(value)
 
 
 def validate_mac_address(value):
     """Usual lowercase MAC address validator."""
-    validator = RegexValidator(MAC_ADDRESS, USUAL_MAC_ADDRESS)
-    validator(value)
+    MAC_ADDRESS_VALIDATOR(value)
 
 
 def validate_name_format(value):
@@ -208,38 +215,22 @@ def validate_name_format(value):
 
 def validate_only_lowercase(value):
     """Only lowercase validator."""
-    validator = RegexValidator(LOWERCASE, ONLY_LOWERCASE)
-    validator(value)
+    LOWERCASE_VALIDATOR(value)
 
 
 def validate_pix_code(value):
-    valitador = RegexValidator(PIX_CODE, USUAL_PIX_CODE)
-    valitador(value)
+    PIX_CODE_VALIDATOR(value)
 
 
 def validate_url_format(value):
-    validator = URLValidator()
-    validator(value)
+    URL_VALIDATOR(value)
 
 
 def validate_switch_model(switch):
-    if switch.vendor == 'EXTREME':
-        validator = RegexValidator(EXTREME_MODELS, INVALID_SWITCH_MODEL)
-        validator(switch.model)
-    elif switch.vendor == 'CISCO':
-        validator = RegexValidator(CISCO_MODELS, INVALID_SWITCH_MODEL)
-        validator(switch.model)
-    elif switch.vendor == 'JUNIPER':
-        validator = RegexValidator(JUNIPER_MODELS, INVALID_SWITCH_MODEL)
-        validator(switch.model)
-    elif switch.vendor == 'BROCADE':
-        validator = RegexValidator(BROCADE_MODELS, INVALID_SWITCH_MODEL)
-        validator(switch.model)
-    elif switch.vendor == 'HUAWEI':
-        validator = RegexValidator(HUAWEI_MODELS, INVALID_SWITCH_MODEL)
-        validator(switch.model)
-    else:
+    validator = SWITCH_MODEL_DICT.get(switch.vendor)
+    if validator is None:
         raise ValidationError(_('unrecognized switch model'))
+    validator(switch.model)
 
 
 def validate_channel_name(channel):
@@ -257,6 +248,52 @@ def validate_channel_name(channel):
         raise ValidationError(INVALID_CHANNEL_TYPE_OR_VENDOR)
 
 
+# ------- Batch Validation -------
+# retornam {posicao: [mensagens]} somente dos itens invalidos, sem levantar
+# excecao, para importacoes e APIs em lote
+
+def validate_batch(validator, values):
+    """Run any validator over the values collecting the errors by position."""
+    errors = {}
+    for position, value in enumerate(values):
+        try:
+            validator(value)
+        except ValidationError as e:
+            errors[position] = e.messages
+    return errors
+
+
+def validate_as_numbers(numbers):
+    errors = {}
+    for position, number in enumerate(numbers):
+        # sem conversao: float, string numerica e bool sao invalidos
+        if isinstance(number, bool) or not isinstance(number, int) or not is_valid_as_number(number):
+            errors[position] = [INVALID_ASN]
+    return errors
+
+
+def validate_mac_addresses(values):
+    search = MAC_ADDRESS.search
+    return dict(
+        (position, [USUAL_MAC_ADDRESS]) for position, value in enumerate(values) if not search(str(value))
+    )
+
+
+def validate_networks(values, version=None):
+    """Validate IPv4 (version=4), IPv6 (version=6) or mixed (None) prefixes."""
+    network, message = {
+        4: (ipaddress.IPv4Network, INVALID_IPV4_NETWORK),
+        6: (ipaddress.IPv6Network, INVALID_IPV6_NETWORK),
+        None: (ipaddress.ip_network, INVALID_IPV46_NETWORK),
+    }[version]
+    errors = {}
+    for position, value in enumerate(values):
+        try:
+            network(value, False)
+        except (TypeError, ValueError):
+            errors[position] = [message]
+    return errors
+
 
 def trace_print_exception():
     exception_type, exception_object, exception_traceback = sys.exc_info()
@@ -1,64 +1,286 @@
+import functools
+import os
 import re
-from subprocess import PIPE, CalledProcessError, run
+import shlex
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from subprocess import PIPE, CalledProcessError, TimeoutExpired, run
 
+from django.apps import apps
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext as _
 
 from .validators import INVALID_ASN, validate_as_number
 
 INEXISTENT_ASN = _('ASN Does not exist.')
+WHOIS_TIMEOUT = _('Whois lookup timed out.')
+
+def whois_setting(name):
+    """PLUGINS_CONFIG value, falling back to the default_settings of the plugin."""
+    config = getattr(settings, 'PLUGINS_CONFIG', {}).get('ixservices', {})
+    value = config.get(name)
+    if value is None:
+        value = apps.get_app_config('ixservices').default_settings.get(name)
+    return value
+
+
+class WhoisCache:
+    """
+    Raw whois responses by ASN, kept for ttl seconds in a size bounded LRU
+    and, when directory is set, in files shared by every worker process.
+    """
+
+    def __init__(self, ttl, size, directory=None):
+        self.ttl = ttl
+        self.size = size
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, asn):
+        return os.path.join(self.directory, 'AS{}.whois'.format(asn))
+
+    def get(self, asn):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(asn)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._entries.move_to_end(asn)
+                    return entry[1]
+                del self._entries[asn]
+        if self.directory:
+            try:
+                path = self._path(asn)
+                created = os.path.getmtime(path)
+                if now - created <= self.ttl:
+                    with open(path, 'rb') as disk_file:
+                        content = disk_file.read()
+                    self._remember(asn, content, created)
+                    return content
+            except OSError:
+                pass
+        return None
+
+    def set(self, asn, content):
+        self._remember(asn, content, time.time())
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                # escrita atomica, leitores nunca veem arquivo parcial
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+                with os.fdopen(fd, 'wb') as disk_file:
+                    disk_file.write(content)
+                os.replace(tmp_path, self._path(asn))
+            except OSError:
+                pass
+
+    def _remember(self, asn, content, created):
+        with self._lock:
+            self._entries[asn] = (created, content)
+            self._entries.move_to_end(asn)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# cache e pool do processo, criados no primeiro uso
+_cache = None
+_executor = None
+# consultas em andamento: asn -> future, evita processos duplicados
+_inflight = {}
+_lock = threading.Lock()
+
+
+def get_whois_cache():
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = WhoisCache(
+                whois_setting('whois_cache_ttl'),
+                whois_setting('whois_cache_size'),
+                whois_setting('whois_cache_dir'),
+            )
+        return _cache
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=whois_setting('whois_workers'), thread_name_prefix='whois'
+            )
+        return _executor
+
+
+def reset_whois():
+    """
+    Drop the cache and the pool of the process, recreated on next use with
+    the current settings.
+    """
+    global _cache, _executor
+    with _lock:
+        executor = _executor
+        _cache = _executor = None
+        _inflight.clear()
+    if executor is not None:
+        executor.shutdown(wait=False)
 
 
 def get_whois(asn):
     try:
         validate_as_number(asn)
-        data = run(['whois', "AS" + str(asn)], stdout=PIPE)
-        data.check_returncode()
-        return data.stdout
-    except (TypeError, ValidationError) as e:
+    except (TypeError, ValidationError):
         raise ValidationError(INVALID_ASN)
-    except CalledProcessError as e:
+
+    cache = get_whois_cache()
+    content = cache.get(asn)
+    if content is not None:
+        return content
+
+    command = shlex.split(whois_setting('whois_command'))
+    try:
+        data = run(command + ["AS" + str(asn)], stdout=PIPE, timeout=whois_setting('whois_timeout'))
+        data.check_returncode()
+    except TimeoutExpired:
+        raise ValidationError(WHOIS_TIMEOUT, code='timeout')
+    except CalledProcessError:
         txt = data.stdout
         # verif b'Unknown AS number or IP network'
         if txt.startswith(b'Unknown AS number'):
             raise ValidationError(INEXISTENT_ASN)
+        return None
+    cache.set(asn, data.stdout)
+    return data.stdout
+
+
+# linha em branco ou comentario (separa os objetos da resposta)
+WHOIS_BREAK = re.compile(rb'^\s*(?:%.*)?$')
+# field: value % possivel comentario
+WHOIS_RECORD = re.compile(rb'^\s*\b([\w-]*):\s*((?:(?! %.*$).)*)')
+# separador entre objetos
+WHOIS_SEPARATOR = ('', '')
+
+# atributos usados pela interface de provisionamento
+WHOIS_SUMMARY_FIELDS = ('aut-num', 'as-name', 'owner', 'e-mail')
 
 
 def decode_line(line):
     try:
         return line.decode("utf-8")
-    except:
+    except UnicodeDecodeError:
         return line.decode("latin1")
 
 
-def parse_whois(whois_content):
-    if whois_content is None:
-        raise ValidationError(INEXISTENT_ASN)
+@functools.lru_cache(maxsize=32)
+def _projection(fields):
+    """Compiled pattern of the records of the fields (a tuple), compiled once per tuple."""
+    names = b'|'.join(re.escape(field.encode('ascii')) for field in fields)
+    return re.compile(rb'^\s*(' + names + rb'):\s*((?:(?! %.*$).)*)')
 
-    final_list = list()
-    line_break = False
 
-    for line in whois_content.split(b'\n'):
-        decoded_line = decode_line(line)
+def iter_whois(whois_content, fields=None):
+    """
+    Yield the (field, value) records of a whois response incrementally.
 
-        # If it's a blank line or a comment
-        if final_list and re.match(r'^\s*(?:%.*)?$', decoded_line):
-            line_break = True
+    whois_content is the raw bytes or any iterable of byte lines (e.g. the
+    stdout of the process). Lines are matched as bytes with precompiled
+    patterns and only the captured groups are decoded. Objects are
+    separated by ('', ''). With fields, only those attributes are yielded
+    (no separators).
+    """
+    lines = whois_content.split(b'\n') if isinstance(whois_content, bytes) else whois_content
 
-        # Tuple (field, value) with format field: value % possible comment
-        match_content = re.match(r'^\s*\b([\w\d-]*):\s*((?:(?! %.*$).)*)',
-                                 decoded_line)
-        if match_content:
+    if fields:
+        match = _projection(tuple(fields)).match
+        for line in lines:
+            found = match(line)
+            if found:
+                yield decode_line(found.group(1)), decode_line(found.group(2))
+        return
+
+    match, is_break = WHOIS_RECORD.match, WHOIS_BREAK.match
+    started = line_break = False
+    for line in lines:
+        found = match(line)
+        if found:
             if line_break:
-                final_list.append(('', ''))
+                yield WHOIS_SEPARATOR
                 line_break = False
-            final_list.append(match_content.groups())
+            started = True
+            yield decode_line(found.group(1)), decode_line(found.group(2))
+        elif started and is_break(line):
+            line_break = True
+
 
+def parse_whois(whois_content, fields=None):
+    if whois_content is None:
+        raise ValidationError(INEXISTENT_ASN)
+
+    final_list = list(iter_whois(whois_content, fields))
     if not final_list:
         raise ValidationError(INEXISTENT_ASN)
 
     return final_list
 
 
-def get_parsed_whois(asn):
-    return parse_whois(get_whois(asn))
+def get_parsed_whois(asn, fields=None):
+    return parse_whois(get_whois(asn), fields)
+
+
+def submit_whois(asn, fields=None):
+    """Schedule get_parsed_whois() on the bounded pool, sharing lookups in progress."""
+    key = (asn, tuple(fields) if fields else None)
+    executor = _get_executor()
+    with _lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future
+        future = _inflight[key] = executor.submit(get_parsed_whois, asn, fields)
+    future.add_done_callback(lambda done: _forget_inflight(key, done))
+    return future
+
+
+def _forget_inflight(key, future):
+    with _lock:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+def lookup_whois(asn, fields=None):
+    """
+    Parsed whois of an ASN through the worker pool, so a slow registry
+    holds at most whois_workers subprocesses and the request waits at most
+    whois_timeout seconds.
+    """
+    try:
+        return submit_whois(asn, fields).result(timeout=whois_setting('whois_timeout'))
+    except FutureTimeout:
+        raise ValidationError(WHOIS_TIMEOUT, code='timeout')
+
+
+def lookup_whois_many(asns, fields=None):
+    """
+    Resolve many ASNs concurrently. Returns {asn: {'whois': [...]}} or
+    {asn: {'error': message}} for every ASN given.
+    """
+    futures = dict((asn, submit_whois(asn, fields)) for asn in set(asns))
+    wait(futures.values(), timeout=whois_setting('whois_timeout'))
+    result = {}
+    for asn, future in futures.items():
+        if not future.done():
+            result[asn] = {'error': str(WHOIS_TIMEOUT)}
+        elif future.exception() is not None:
+            error = future.exception()
+            result[asn] = {'error': ' '.join(error.messages) if isinstance(error, ValidationError) else str(error)}
+        else:
+            result[asn] = {'whois': future.result()}
+    return result
@@ -19,6 +19,9 @@ from ixservices.core import tables
 from django.views.generic import View
 
 from ixservices.ixservices.utils.status import TagStatusChoices
+from ixservices.ixservices.utils.registry import registry
+from ixservices.ixservices.utils.counters import TOTAL, get_counters, has_unrestricted_view
+from ixservices.ixservices.utils.stats import as_panel_stats, connection_panel_stats, ix_panel_stats, tag_domain_panel_stats
 
 def index(request):
     return render(request, 'home.html')
@@ -36,12 +39,20 @@ class HomeView(views.HomeView):
             app_label = 'ixservices'
             def get_view(model_name):
                 return "plugins.{}.view_{}".format(app_label, model_name)
-            def get_qs_count(qs):
-                return qs.restrict(request.user, 'view').count
+            # contadores mantidos pelos receivers (StatCounter), lidos em uma consulta
+            counters = get_counters()
+            def get_qs_count(qs, keys=((TOTAL, TOTAL),)):
+                def count():
+                    counts = counters.get(qs.model._meta.model_name)
+                    # permissoes com restricao (ou contador ainda nao reconciliado) contam ao vivo
+                    if counts is None or not has_unrestricted_view(request.user, qs.model):
+                        return qs.restrict(request.user, 'view').count()
+                    return sum(counts.get(key, 0) for key in keys)
+                return count
             def get_section_model(model_name, label, model, params=None):
                 return get_view(model_name), label, get_qs_count(model.objects), params
-            def get_section_filter(model_name, label, filtered, params=None):
-                return get_view(model_name), label, get_qs_count(filtered), params
+            def get_section_filter(model_name, label, filtered, keys, params=None):
+                return get_view(model_name), label, get_qs_count(filtered, keys), params
             def get_service_types(t):
                 return CustomerService.objects.filter(service__service_type__pk=t)
             core = (
@@ -66,15 +77,16 @@ class HomeView(views.HomeView):
                         "customerservice", 
                         st.name, 
                         get_service_types(st.pk),
+                        [('service_type', str(st.pk))],
                         params='service__service_type={}'.format(st.pk)
-                    ) for st in ServiceType.objects.all()
+                    ) for st in registry.service_types()
                 ]
             )    
 
 
             ### ### filter connection types from data inserted
-            qs_cix_types = CustomerConnectionType.objects.exclude(connection_type=0)
-            qs_individual = CustomerConnectionType.objects.filter(connection_type=0).first()
+            qs_cix_types = [item for item in registry.connection_types() if item.connection_type != 0]
+            qs_individual = next((item for item in registry.connection_types() if item.connection_type == 0), None)
 
             def get_cix_params(qs_types):
                 formated_params = (",".join([str(item.pk) for item in  qs_types]).replace(',','&connection_type='))
@@ -88,9 +100,12 @@ class HomeView(views.HomeView):
                 (get_section_model("customerconnection", "CustomerConnections", CustomerConnection)),
                 (get_section_model("customerconnectionendpoint", "CustomerConnectionEndpoints", CustomerConnectionEndpoint)),
                 ## filter connection types
-                (get_section_filter("customerconnection", "CIXs", CustomerConnection.objects.exclude(connection_type__connection_type=0), params=params_cix)),
-                (get_section_filter("customerconnection", "Individual", CustomerConnection.objects.filter(connection_type__connection_type=0), params=params_indiv)),
-                (get_section_filter("customerconnection", "LAGs", CustomerConnection.objects.filter(is_lag=True), params='is_lag=True')),
+                (get_section_filter("customerconnection", "CIXs", CustomerConnection.objects.exclude(connection_type__connection_type=0),
+                                    [('connection_type', str(item.pk)) for item in qs_cix_types], params=params_cix)),
+                (get_section_filter("customerconnection", "Individual", CustomerConnection.objects.filter(connection_type__connection_type=0),
+                                    [('connection_type', str(qs_individual.pk))] if qs_individual else [], params=params_indiv)),
+                (get_section_filter("customerconnection", "LAGs", CustomerConnection.objects.filter(is_lag=True),
+                                    [('is_lag', 'True')], params='is_lag=True')),
             ) 
 
             sections = (
@@ -145,19 +160,19 @@ class TagListView(generic.ObjectListView):
     table = tables.TagTable
 
 class ServiceTagDomainListView(generic.ObjectListView):
-    queryset = ServiceTagDomain.objects.all()
+    queryset = ServiceTagDomain.objects.select_related('tag_bitmap')
     filterset = filtersets.ServiceTagDomainFilterSet
     filterset_form = filterforms.ServiceTagDomainFilterForm
     table = tables.ServiceTagDomainTable
 
 class IPv4AddressListView(generic.ObjectListView):
-    queryset = IPv4Address.objects.all()
+    queryset = IPv4Address.objects.with_allocation().select_related('ix')
     filterset = filtersets.IPv4AddressFilterSet
     filterset_form = filterforms.IPv4AddressFilterForm
     table = tables.IPv4AddressTable
 
 class IPv6AddressListView(generic.ObjectListView):
-    queryset = IPv6Address.objects.all()
+    queryset = IPv6Address.objects.with_allocation().select_related('ix')
     filterset = filtersets.IPv6AddressFilterSet
     filterset_form = filterforms.IPv6AddressFilterForm
     table = tables.IPv6AddressTable
@@ -218,34 +233,7 @@ class ASView(generic.ObjectView):
     
     def get_extra_context(self, request, instance):
         stats = super().get_extra_context(request, instance)
-        qs = CustomerService.objects.filter(asn=instance)
-       
-        def qs_restrict(qs):
-            return qs.restrict(request.user, 'view')
-        def get_total_by_ix(qs):
-            qs = qs.values('service__ix', 'service__ix__code').annotate(Count('service')).order_by()
-            return qs_restrict(qs)
-        def get_services(qs):
-            tot_services = qs_restrict(qs)
-            tot_atmv4 = tot_services.filter(service__service_type__pk=1)
-            tot_atmv6 = tot_services.filter(service__service_type__pk=2)
-            tot_bilateral = tot_services.filter(service__service_type__pk=3)
-            return tot_services.count(), tot_atmv4.count(), tot_atmv6.count(), tot_bilateral.count()
-        
-        total_by_ix = get_total_by_ix(qs)
-        services, atmv4, atmv6, bilateral = get_services(qs)
-        
-        def get_stats():
-            return { 
-                'total_ix': total_by_ix.count(),
-                'total_by_ix': total_by_ix,
-                'total_services': services,
-                'total_atmv4': atmv4,
-                'total_atmv6': atmv6,
-                'total_bilateral': bilateral,
-            }
-        
-        stats['stats'] = get_stats() 
+        stats['stats'] = as_panel_stats(instance, request.user)
         return stats
 
 class IXView(generic.ObjectView):
@@ -253,50 +241,7 @@ class IXView(generic.ObjectView):
 
     def get_extra_context(self, request, instance):
         stats = super().get_extra_context(request, instance)
-        qs, st = instance.servicetag_set, TagStatusChoices() 
-        def qs_restrict(qs):
-            return qs.restrict(request.user, 'view')
-        def get_total_asns():
-            qs = AS.objects.filter(customerservice__service__ix=instance).distinct()
-            return qs_restrict(qs).count()
-        def get_by_status(status):
-            return qs_restrict(qs).filter(status=status).count()
-        def get_total_ips(qs):
-            tot_ips = qs_restrict(qs) 
-            tot_ips_free = qs.filter(customerservice__isnull=True)
-            tot_ips_alloc = qs.filter(customerservice__isnull=False)
-            return tot_ips.count(), tot_ips_free.count(), tot_ips_alloc.count()
-        def get_services():
-            tot_services = CustomerService.objects.filter(service__ix=instance)
-            tot_services = qs_restrict(tot_services)
-            tot_atmv4 = tot_services.filter(service__service_type__pk=1)
-            tot_atmv6 = tot_services.filter(service__service_type__pk=2)
-            tot_bilateral = tot_services.filter(service__service_type__pk=3)
-            return tot_services.count(), tot_atmv4.count(), tot_atmv6.count(), tot_bilateral.count()
-        
-        ipv4, ipv4_free, ipv4_alloc = get_total_ips(instance.ipv4address.all())
-        ipv6, ipv6_free, ipv6_alloc = get_total_ips(instance.ipv6address.all())
-        services, atmv4, atmv6, bilateral = get_services()
-        
-        def get_stats():
-            return { 
-                'total_asn': get_total_asns(),
-                'total_services': services,
-                'total_atmv4': atmv4,
-                'total_atmv6': atmv6,
-                'total_bilateral': bilateral,
-                'total_ipv4': ipv4,
-                'total_ipv4_free': ipv4_free,
-                'total_ipv4_alloc': ipv4_alloc,
-                'total_ipv6': ipv6,
-                'total_ipv6_free': ipv6_free,
-                'total_ipv6_alloc': ipv6_alloc,
-                'tags_avail_count': get_by_status(st.STATUS_AVAILABLE),
-                'tags_alloc_count': get_by_status(st.STATUS_ALLOCATED),
-                'tags_prod_count':  get_by_status(st.STATUS_PRODUCTION),
-            }
-        
-        stats['stats'] = get_stats() 
+        stats['stats'] = ix_panel_stats(instance, request.user)
         return stats
 
 class TagView(generic.ObjectView):
@@ -309,26 +254,14 @@ class ServiceTagDomainView(generic.ObjectView):
 
     def get_extra_context(self, request, instance):
         stats = super().get_extra_context(request, instance)
-        qs, st = instance.servicetags, TagStatusChoices() 
-        def qs_restrict(qs):
-            return qs.restrict(request.user, 'view')
-        def get_by_status(status):
-            return qs_restrict(qs).filter(status=status).count()        
-        def get_stats():
-            return { 
-                'tags_avail_count': get_by_status(st.STATUS_AVAILABLE),
-                'tags_alloc_count': get_by_status(st.STATUS_ALLOCATED),
-                'tags_prod_count':  get_by_status(st.STATUS_PRODUCTION),
-            }
-        
-        stats['stats'] = get_stats() 
+        stats['stats'] = tag_domain_panel_stats(instance, request.user)
         return stats
 
 class IPv4AddressView(generic.ObjectView):
-    queryset = IPv4Address.objects.prefetch_related('ix')
+    queryset = IPv4Address.objects.with_allocation().prefetch_related('ix')
 
 class IPv6AddressView(generic.ObjectView):
-    queryset = IPv6Address.objects.prefetch_related('ix')
+    queryset = IPv6Address.objects.with_allocation().prefetch_related('ix')
 
 class MACAddressView(generic.ObjectView):
     queryset = MACAddress.objects.all()
@@ -358,22 +291,7 @@ class CustomerConnectionView(generic.ObjectView):
 
     def get_extra_context(self, request, instance):
         stats = super().get_extra_context(request, instance)
-        qs = instance.customerservice.all()
-        def qs_restrict(qs):
-            return qs.restrict(request.user, 'view')
-        def get_total(qs):
-            return qs_restrict(qs).count()
-        def get_service(qs):
-            qs = qs.values('asn', 'asn__number').annotate(Count('asn')).order_by()
-            return qs_restrict(qs)        
-        
-        def get_stats():
-            return { 
-                'total_services': get_total(qs),
-                'customerservice': get_service(qs)
-            }
-        
-        stats['stats'] = get_stats()
+        stats['stats'] = connection_panel_stats(instance, request.user)
         stats['active_tab'] = 'customerconnection'
         return stats
 